@@ -1,7 +1,21 @@
+from django.db import IntegrityError, transaction
+from django.utils.encoding import smart_str
 from django.utils.translation import gettext_lazy as _
-from rest_framework import exceptions
+from rest_framework import exceptions, serializers
 from rest_framework_gis.filters import InBBoxFilter
 
+from .. import reference_data
+from ..models import EnforcementDomain, EventParking, Parking, PaymentZone
+
+EXTERNAL_ID_TAKEN_MESSAGE = _("Parking with this external id already exists.")
+
+# Names of the unique constraints of the operators' external ids
+EXTERNAL_ID_CONSTRAINTS = {
+    constraint.name
+    for model in [Parking, EventParking]
+    for constraint in model._meta.constraints
+    if 'external_id' in getattr(constraint, 'fields', ())}
+
 
 class ParkingException(exceptions.APIException):
     status_code = 403
@@ -19,3 +33,72 @@ class WGS84InBBoxFilter(InBBoxFilter):
         bbox.srid = 4326
         bbox.transform(3879)
         return bbox
+
+
+class EnforcementDomainCodeField(serializers.SlugRelatedField):
+    """
+    Enforcement domain by its code, looked up from the reference data.
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', EnforcementDomain.objects.all())
+        super().__init__(slug_field='code', **kwargs)
+
+    def to_internal_value(self, data):
+        domain = reference_data.get_domain_by_code(smart_str(data))
+        if domain is None:
+            self.fail('does_not_exist', slug_name=self.slug_field,
+                      value=smart_str(data))
+        return domain
+
+
+class PaymentZoneCodeField(serializers.SlugRelatedField):
+    """
+    Payment zone by its code, looked up from the reference data.
+
+    The zone is looked up from the domain whose code is set to the
+    `domain_code` attribute of the field.
+    """
+    def __init__(self, domain_code=None, **kwargs):
+        kwargs.setdefault('queryset', PaymentZone.objects.all())
+        super().__init__(slug_field='code', **kwargs)
+        self.domain_code = (
+            domain_code or EnforcementDomain.get_default_domain_code())
+
+    def to_internal_value(self, data):
+        domain = reference_data.get_domain_by_code(self.domain_code)
+        zone = (
+            reference_data.get_payment_zone(domain.pk, smart_str(data))
+            if domain else None)
+        if zone is None:
+            self.fail('does_not_exist', slug_name=self.slug_field,
+                      value=smart_str(data))
+        return zone
+
+
+def save_with_unique_external_id(serializer, **kwargs):
+    """
+    Save a parking serializer, reporting taken external id as an error.
+
+    The uniqueness of the external id of the operator is checked by the
+    database constraint, so that no extra query is needed.
+    """
+    try:
+        with transaction.atomic():
+            return serializer.save(**kwargs)
+    except IntegrityError as error:
+        if not is_external_id_taken_error(error):
+            raise
+        raise serializers.ValidationError({'external_id': [
+            EXTERNAL_ID_TAKEN_MESSAGE]})
+
+
+def is_external_id_taken_error(error):
+    """
+    Check if an integrity error is a violation of external id uniqueness.
+
+    :type error: IntegrityError
+    :rtype: bool
+    """
+    constraint = getattr(
+        getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+    return constraint in EXTERNAL_ID_CONSTRAINTS
@@ -1,3 +1,5 @@
+from collections import Counter, defaultdict
+
 from django.db import transaction
 from django.db.models import Q
 from django.utils.translation import gettext as _
@@ -6,9 +8,12 @@ from rest_framework import mixins, serializers, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.status import HTTP_201_CREATED
 
-from ..models import Permit, PermitArea, PermitSeries
+from .. import plate_filter
+from ..models import Permit, PermitArea, PermitLookupItem, PermitSeries
 from ..models.constants import PERMIT_TYPES
+from ..plate_cache import invalidate_all_plates
 
 
 class PermitSeriesSerializer(serializers.ModelSerializer):
@@ -18,6 +23,26 @@ class PermitSeriesSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+class PermitSeriesCloneSerializer(serializers.Serializer):
+    permits = serializers.ListField(
+        child=serializers.DictField(), required=False, default=list)
+    removed = serializers.ListField(
+        child=serializers.CharField(max_length=50), required=False,
+        default=list)
+
+    def validate_permits(self, value):
+        external_ids = [x.get('external_id') for x in value]
+        if not all(isinstance(x, str) and x for x in external_ids):
+            raise serializers.ValidationError(
+                _("Every permit must have an external id"))
+        duplicates = sorted(
+            x for (x, count) in Counter(external_ids).items() if count > 1)
+        if duplicates:
+            raise serializers.ValidationError(
+                _("Duplicate external ids: {}").format(', '.join(duplicates)))
+        return value
+
+
 class CreateAndReadOnlyModelViewSet(
         mixins.CreateModelMixin,
         mixins.RetrieveModelMixin,
@@ -62,14 +87,83 @@ class PermitSeriesViewSet(CreateAndReadOnlyModelViewSet):
 
             if not obj_to_activate.active:
                 obj_to_activate.active = True
-                obj_to_activate.save(update_fields=['active'])
+                # Update also the modification time
+                obj_to_activate.save(update_fields=['active', 'modified_at'])
+                add_series_to_plate_filters(obj_to_activate)
 
             to_deactivate.update(active=False)
 
+            transaction.on_commit(invalidate_all_plates)
+
             PermitSeries.delete_prunable_series()
 
             return Response({'status': 'OK'})
 
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """
+        Create a new series from a copy of this series and a delta.
+
+        The permits of the series are copied inside the database and
+        then the permits in the delta are added or updated and the
+        removed ones are deleted, matching them by their external id.
+        """
+        delta_serializer = PermitSeriesCloneSerializer(data=request.data)
+        delta_serializer.is_valid(raise_exception=True)
+        delta = delta_serializer.validated_data
+        with transaction.atomic():
+            new_series = self.get_object().clone()
+            self.apply_permit_delta(
+                new_series, delta['permits'], delta['removed'])
+        serializer = self.get_serializer(new_series)
+        return Response(serializer.data, status=HTTP_201_CREATED)
+
+    def apply_permit_delta(self, series, permits, removed):
+        series_permits = Permit.objects.filter(series=series)
+        series_permits.filter(external_id__in=removed).delete()
+        existing = series_permits.filter(
+            external_id__in=[x['external_id'] for x in permits])
+        permits_by_external_id = {x.external_id: x for x in existing}
+
+        serializer_class = self.get_permit_serializer_class()
+        context = self.get_serializer_context()
+        permit_serializers = [
+            serializer_class(
+                permits_by_external_id.get(item['external_id']),
+                data=dict(item, series=series.pk), context=context)
+            for item in permits]
+        errors = [
+            ({} if serializer.is_valid() else serializer.errors)
+            for serializer in permit_serializers]
+        if any(errors):
+            raise serializers.ValidationError({'permits': errors})
+
+        new_permits = []
+        for serializer in permit_serializers:
+            if serializer.instance:
+                serializer.save()
+            else:
+                new_permits.append(Permit(**serializer.validated_data))
+        Permit.objects.bulk_create(new_permits)
+
+    def get_permit_serializer_class(self):
+        return PermitSerializer
+
+
+def add_series_to_plate_filters(series):
+    if not plate_filter.is_enabled():
+        return
+    items = (
+        PermitLookupItem.objects
+        .filter(permit__series=series)
+        .values_list('permit__domain_id', 'registration_number')
+        .distinct())
+    reg_nums_by_domain = defaultdict(set)
+    for (domain_id, reg_num) in items:
+        reg_nums_by_domain[domain_id].add(reg_num)
+    for (domain_id, reg_nums) in reg_nums_by_domain.items():
+        plate_filter.add_plates(domain_id, reg_nums)
+
 
 class PermitListSerializer(serializers.ListSerializer):
     def create(self, validated_data):
@@ -1,17 +1,22 @@
 import datetime
 
 from django.conf import settings
-from django.contrib.gis.gdal.error import GDALException
 from django.contrib.gis.geos import Point
 from django.utils import timezone
+from django.utils.translation import gettext as _
 from rest_framework import generics, serializers
 from rest_framework.response import Response
 
-from ...models import (
-    EventArea, EventParking, Parking, ParkingCheck, PaymentZone, Permit,
-    PermitArea, PermitLookupItem)
+from ... import reference_data
+from ...check_candidates import (
+    get_candidate_rows, get_candidates, make_candidates)
+from ...check_log import save_checks
+from ...models import EventParking, Parking, ParkingCheck, Permit
 from ...models.constants import GK25FIN_SRID, WGS84_SRID
-from .permissions import IsEnforcer
+from ...models.utils import normalize_reg_num
+from ...spatial_index import get_area_index
+from ...utils.coordinates import transform_points
+from .permissions import IsEnforcer, get_enforced_domain
 
 
 class PermitPermissionsSerializer(serializers.ModelSerializer):
@@ -67,81 +72,180 @@ class CheckParking(generics.GenericAPIView):
         time = params.get("time") or timezone.now()
         registration_number = params.get("registration_number")
         (wgs84_location, gk25_location) = get_location(params)
-        domain = request.user.enforcer.enforced_domain
+        domain = get_enforced_domain(request.user)
 
-        zone = get_payment_zone(gk25_location, domain)
-        area = get_permit_area(gk25_location, domain)
-        event_area = get_event_area(gk25_location, domain)
+        (zone, area, event_area) = resolve_location(gk25_location, domain)
 
-        (allowed_by, parking, end_time, active_parkings, permit_lookup_items, active_event_parkings) = check_parking(
+        check_result = check_parking(
             registration_number, zone, area, time, domain, event_area)
-        allowed = bool(allowed_by)
-
-        if not allowed:
-            # If no matching parking or permit was found, try to find
-            # one that has just expired, i.e. was valid a few minutes
-            # ago (where "a few minutes" is the grace duration)
-            past_time = time - get_grace_duration()
-            (
-                _allowed_by,
-                parking,
-                end_time,
-                active_parkings,
-                permit_lookup_items,
-                active_event_parkings
-            ) = check_parking(
-                registration_number,
-                zone, area,
-                past_time,
-                domain,
-                event_area
-            )
-
-        result = {
-            "allowed": allowed,
-            "end_time": end_time,
-            "location": {
-                "payment_zone": zone,
-                "permit_area": area.identifier if area else None,
-                "event_area": event_area.id if event_area else None,
-            },
-            "time": time,
-        }
+        prefetch_details([(params, check_result)])
+
+        (result, parking_check) = make_parking_check(
+            request.user, params, time, wgs84_location,
+            (zone, area, event_area), check_result)
+        save_checks([parking_check])
+        return Response(result)
+
 
-        operator_detail, time_start_detail, permissions_detail = get_details(params)
+class CheckParkingBatch(generics.GenericAPIView):
+    """
+    Check parking validity of several registration numbers at once.
 
-        if operator_detail:
-            result["operator"] = parking.operator.name if allowed and parking and parking.operator else None
+    Takes a list of items in the same format as the check_parking
+    endpoint takes and returns a list of results in the same order.
+    """
+    permission_classes = [IsEnforcer]
 
-        if time_start_detail:
-            result["time_start"] = parking.time_start if allowed and parking and parking.time_start else None
+    serializer_class = CheckParkingSerializer
 
+    def post(self, request):
+        # Check the size before validating, so that the items of an
+        # oversized request are not validated in vain
+        max_size = get_batch_max_size()
+        if isinstance(request.data, list) and len(request.data) > max_size:
+            raise serializers.ValidationError(
+                _("At most {max_size} items can be checked at once.").format(
+                    max_size=max_size))
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+        if not items:
+            return Response([])
+
+        now = timezone.now()
+        times = [params.get("time") or now for params in items]
+        locations = get_locations(items)
+        domain = get_enforced_domain(request.user)
+        resolved = resolve_locations(
+            [gk25_location for (_wgs84, gk25_location) in locations], domain)
+
+        grace_duration = get_grace_duration()
+        reg_nums = [
+            normalize_reg_num(params["registration_number"])
+            for params in items]
+        rows_by_reg_num = get_candidate_rows(
+            reg_nums, domain.pk, min(times) - grace_duration, max(times))
+        candidates_by_reg_num = {
+            reg_num: make_candidates(rows)
+            for (reg_num, rows) in rows_by_reg_num.items()}
+
+        check_results = [
+            evaluate_with_grace(
+                candidates_by_reg_num[reg_num], zone, area, event_area,
+                time, time - grace_duration)
+            for (time, (zone, area, event_area), reg_num)
+            in zip(times, resolved, reg_nums)]
+        prefetch_details(list(zip(items, check_results)))
+
+        results = []
+        parking_checks = []
+        for (params, time, (wgs84_location, _gk25), areas, check_result) in zip(
+                items, times, locations, resolved, check_results):
+            (result, parking_check) = make_parking_check(
+                request.user, params, time, wgs84_location, areas,
+                check_result)
+            results.append(result)
+            parking_checks.append(parking_check)
+
+        save_checks(parking_checks)
+        return Response(results)
+
+
+def prefetch_details(checks):
+    """
+    Load the related objects needed by the requested details.
+
+    The operators of the found parkings are taken from the reference
+    data and the permits of the lookup items are fetched with a single
+    query, and they are set to the objects of the check results, so that
+    building the details of any number of checks doesn't need further
+    queries.
+
+    :type checks: list[(dict, tuple)]
+    :param checks: Pairs of input parameters and `check_parking` results
+    """
+    operator_ids = set()
+    permit_ids = set()
+    for (params, check_result) in checks:
+        (allowed_by, parking, _end_time, _parkings, permit_lookup_items, _event_parkings) = check_result
+        (operator_detail, _time_start_detail, permissions_detail) = get_details(params)
+        if operator_detail and allowed_by and parking:
+            operator_ids.add(parking.operator_id)
         if permissions_detail:
-            result["permissions"] = {
-                "zones": list({p.zone.number for p in active_parkings}),
-                "permits": [
-                    PermitPermissionsSerializer(item.permit).data for item in permit_lookup_items
-                ],
-                "event_areas": list({e_p.event_area.id for e_p in active_event_parkings})
-            }
-
-        filter = {
-            "performer": request.user,
-            "time": time,
-            "time_overridden": bool(params.get("time")),
-            "registration_number": registration_number,
-            "location": wgs84_location,
-            "result": result,
-            "allowed": allowed
+            permit_ids.update(item.permit_id for item in permit_lookup_items)
+
+    operators = reference_data.get_operators() if operator_ids else {}
+    permits = (
+        Permit.objects.only("id", "external_id", "subjects", "areas")
+        .in_bulk(permit_ids)) if permit_ids else {}
+
+    for (_params, check_result) in checks:
+        (_allowed_by, parking, _end_time, _parkings, permit_lookup_items, _event_parkings) = check_result
+        if parking and parking.operator_id in operators:
+            parking.operator = operators[parking.operator_id]
+        for item in permit_lookup_items:
+            if item.permit_id in permits:
+                item.permit = permits[item.permit_id]
+
+
+def make_parking_check(user, params, time, wgs84_location, areas, check_result):
+    """
+    Make the response data and an unsaved ParkingCheck of a check.
+
+    :type params: dict
+    :type time: datetime.datetime
+    :type areas: (int|None, PermitArea|None, EventArea|None)
+    :param check_result: Return value of `check_parking`
+    :rtype: (dict, ParkingCheck)
+    """
+    (zone, area, event_area) = areas
+    (allowed_by, parking, end_time, active_parkings, permit_lookup_items, active_event_parkings) = check_result
+    allowed = bool(allowed_by)
+
+    result = {
+        "allowed": allowed,
+        "end_time": end_time,
+        "location": {
+            "payment_zone": zone,
+            "permit_area": area.identifier if area else None,
+            "event_area": event_area.id if event_area else None,
+        },
+        "time": time,
+    }
+
+    operator_detail, time_start_detail, permissions_detail = get_details(params)
+
+    if operator_detail:
+        result["operator"] = parking.operator.name if allowed and parking and parking.operator else None
+
+    if time_start_detail:
+        result["time_start"] = parking.time_start if allowed and parking and parking.time_start else None
+
+    if permissions_detail:
+        result["permissions"] = {
+            "zones": list({p.zone_number for p in active_parkings if p.zone_number is not None}),
+            "permits": [
+                PermitPermissionsSerializer(item.permit).data for item in permit_lookup_items
+            ],
+            "event_areas": list({e_p.event_area_id for e_p in active_event_parkings if e_p.event_area_id})
         }
 
-        if isinstance(parking, Parking):
-            filter["found_parking"] = parking
-        if isinstance(parking, EventParking):
-            filter["found_event_parking"] = parking
+    filter = {
+        "performer": user,
+        "time": time,
+        "time_overridden": bool(params.get("time")),
+        "registration_number": params.get("registration_number"),
+        "location": wgs84_location,
+        "result": result,
+        "allowed": allowed
+    }
 
-        ParkingCheck.objects.create(**filter)
-        return Response(result)
+    if isinstance(parking, Parking):
+        filter["found_parking"] = parking
+    if isinstance(parking, EventParking):
+        filter["found_event_parking"] = parking
+
+    return (result, ParkingCheck(**filter))
 
 
 def get_details(params):
@@ -161,101 +265,135 @@ def get_details(params):
 
 
 def get_location(params):
-    longitude = params["location"]["longitude"]
-    latitude = params["location"]["latitude"]
-    wgs84_location = Point(longitude, latitude, srid=WGS84_SRID)
-    try:
-        gk25_location = wgs84_location.transform(GK25FIN_SRID, clone=True)
-    except GDALException:
-        # GK25-FIN doesn't cover the whole world, and therefore
-        # locations outside of its projection plane will raise a
-        # GDALException.  In that case return None as the gk25_location.
-        return (wgs84_location, None)
-    return (wgs84_location, gk25_location)
-
-
-def get_payment_zone(location, domain):
-    if location is None:
-        return None
-    zone = (
-        PaymentZone.objects
-        .filter(geom__contains=location, domain=domain)
-        .order_by("-number")[:1]
-        .values_list("number", flat=True)).first()
-    return zone
-
-
-def get_permit_area(location, domain):
-    if location is None:
-        return None
-    area = PermitArea.objects.filter(geom__contains=location, domain=domain).first()
-    return area if area else None
-
-
-def get_event_area(location, domain):
-    if location is None:
-        return None
+    return get_locations([params])[0]
+
+
+def get_locations(items):
+    """
+    Get WGS84 and GK25-FIN locations of check parameters.
+
+    GK25-FIN doesn't cover the whole world, and therefore the
+    GK25-FIN location of a location outside of its projection plane is
+    None.
+
+    :rtype: list[(Point, Point|None)]
+    """
+    wgs84_locations = [
+        Point(params["location"]["longitude"], params["location"]["latitude"],
+              srid=WGS84_SRID)
+        for params in items]
+    gk25_locations = transform_points(wgs84_locations, GK25FIN_SRID)
+    return list(zip(wgs84_locations, gk25_locations))
+
+
+def resolve_location(location, domain):
+    """
+    Resolve payment zone, permit area and event area of a location.
+
+    :type location: django.contrib.gis.geos.Point|None
+    :type domain: parkings.models.EnforcementDomain
+    :rtype: (int|None, PermitArea|None, EventArea|None)
+    """
+    return resolve_locations([location], domain)[0]
+
+
+def resolve_locations(locations, domain):
+    """
+    Resolve payment zones, permit areas and event areas of locations.
+
+    :type locations: list[django.contrib.gis.geos.Point|None]
+    :type domain: parkings.models.EnforcementDomain
+    :rtype: list[(int|None, PermitArea|None, EventArea|None)]
+    """
+    index = get_area_index(domain)
     now = timezone.now()
-    area = EventArea.objects.filter(geom__contains=location, domain=domain, time_end__gte=now).first()
-    return area if area else None
+    return [
+        (
+            index.get_payment_zone(location),
+            index.get_permit_area(location),
+            index.get_event_area(location, now=now),
+        ) if location is not None else (None, None, None)
+        for location in locations
+    ]
 
 
 def check_parking(registration_number, zone, area, time, domain, event_area):
     """
     Check parking allowance from the database.
 
+    All candidates valid within the grace duration before the given time
+    are fetched at once.  If none of them allows parking at the given
+    time, the result is evaluated for the start of the grace duration
+    instead, i.e. to find a parking or permit that has just expired.  In
+    that case the returned allowed_by is None.
+
     :type registration_number: str
     :type zone: int|None
-    :type area: str|None
+    :type area: PermitArea|None
     :type domain: parkings.models.EnforcementDomain
     :type time: datetime.datetime
-    :rtype: (str, Parking|None, datetime.datetime, ParkingQuerySet, PermitLookupItemQuerySet, EventParkingQuerySet)
+    :type event_area: EventArea|None
+    :rtype: (str|None, Parking|EventParking|None, datetime.datetime|None,
+             list[Parking], list[PermitLookupItem], list[EventParking])
     """
-    permit_lookup_items = (
-        PermitLookupItem.objects
-        .active()
-        .by_time(time)
-        .by_subject(registration_number)
-        .filter(permit__domain=domain))
-
-    active_parkings = (
-        Parking.objects
-        .registration_number_like(registration_number)
-        .valid_at(time)
-        .only("id", "zone", "time_end")
-        .filter(domain=domain))
-
-    active_event_parkings = (
-        EventParking.objects
-        .registration_number_like(registration_number)
-        .valid_at(time)
-        .only("id", "time_end")
-        .filter(domain=domain))
+    past_time = time - get_grace_duration()
+    candidates = get_candidates(registration_number, domain, past_time, time)
+    return evaluate_with_grace(
+        candidates, zone, area, event_area, time, past_time)
+
+
+def evaluate_with_grace(candidates, zone, area, event_area, time, past_time):
+    """
+    Evaluate candidates at given time or, if not allowed, at past time.
+
+    :type candidates: parkings.check_candidates.Candidates
+    :rtype: See `check_parking`
+    """
+    result = evaluate_candidates(
+        candidates.valid_at(time), zone, area, event_area)
+    if not result[0]:
+        (_allowed_by, *rest) = evaluate_candidates(
+            candidates.valid_at(past_time), zone, area, event_area)
+        result = (None, *rest)
+    return result
+
+
+def evaluate_candidates(candidates, zone, area, event_area):
+    """
+    Find the parking, permit or event parking allowing parking.
+
+    :type candidates: parkings.check_candidates.Candidates
+    :type zone: int|None
+    :type area: PermitArea|None
+    :type event_area: EventArea|None
+    """
+    (active_parkings, active_event_parkings, permit_lookup_items) = candidates
+    rest = (active_parkings, permit_lookup_items, active_event_parkings)
 
     for parking in active_parkings:
-        if zone is None or parking.zone.number <= zone:
-            return ("parking",
-                    parking,
-                    parking.time_end,
-                    active_parkings,
-                    permit_lookup_items,
-                    active_event_parkings)
+        if zone is None or (
+                parking.zone_number is not None and parking.zone_number <= zone):
+            return ("parking", parking, parking.time_end, *rest)
 
     if area:
-        permit_end_time = permit_lookup_items.by_area(area).values_list("end_time", flat=True).first()
-        if permit_end_time:
-            return ("permit", None, permit_end_time, active_parkings, permit_lookup_items, active_event_parkings)
+        for item in permit_lookup_items:
+            if item.area_id == area.pk and item.end_time:
+                return ("permit", None, item.end_time, *rest)
 
+    event_area_id = event_area.pk if event_area else None
     for active_event_parking in active_event_parkings:
-        if active_event_parking.event_area == event_area:
+        if active_event_parking.event_area_id == event_area_id:
             return ("event_parking",
                     active_event_parking,
                     active_event_parking.time_end,
-                    active_parkings,
-                    permit_lookup_items,
-                    active_event_parkings)
+                    *rest)
+
+    return (None, None, None, *rest)
+
 
-    return (None, None, None, active_parkings, permit_lookup_items, active_event_parkings)
+def get_batch_max_size(default=1000):
+    setting = getattr(settings, "PARKKIHUBI_CHECK_PARKING_BATCH_MAX_SIZE", None)
+    return setting if setting is not None else default
 
 
 def get_grace_duration(default=datetime.timedelta(minutes=15)):
@@ -9,6 +9,9 @@ from .permissions import IsEnforcer
 class EnforcementPermitSeriesViewSet(PermitSeriesViewSet):
     permission_classes = [IsEnforcer]
 
+    def get_permit_serializer_class(self):
+        return EnforcementPermitSerializer
+
 
 class _ForcedDomain:
     def to_internal_value(self, data):
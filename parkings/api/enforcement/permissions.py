@@ -1,5 +1,6 @@
 from rest_framework.permissions import BasePermission
 
+from parkings import reference_data
 from parkings.models import Enforcer
 
 
@@ -17,3 +18,12 @@ class IsEnforcer(BasePermission):
             pass
 
         return False
+
+
+def get_enforced_domain(user):
+    """
+    Get the domain enforced by the enforcer user from the reference data.
+
+    :rtype: parkings.models.EnforcementDomain
+    """
+    return reference_data.get_domain(user.enforcer.enforced_domain_id)
@@ -2,7 +2,7 @@ from django.urls import re_path
 from rest_framework.routers import DefaultRouter
 
 from ..url_utils import versioned_url
-from .check_parking import CheckParking
+from .check_parking import CheckParking, CheckParkingBatch
 from .enforcement_permit import (
     EnforcementActivePermitByExternalIdViewSet, EnforcementPermitSeriesViewSet,
     EnforcementPermitViewSet)
@@ -17,11 +17,13 @@ class Router(DefaultRouter):
         urls = super().get_urls()
         return urls + [
             re_path(r"^check_parking/$", CheckParking.as_view(), name="check_parking"),
+            re_path(r"^check_parking_batch/$", CheckParkingBatch.as_view(), name="check_parking_batch"),
         ]
 
     def get_api_root_view(self, *args, **kwargs):
         view = super().get_api_root_view(*args, **kwargs)
         view.initkwargs['api_root_dict']['check_parking'] = 'check_parking'
+        view.initkwargs['api_root_dict']['check_parking_batch'] = 'check_parking_batch'
         return view
 
 
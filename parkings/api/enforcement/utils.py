@@ -2,7 +2,7 @@ import datetime
 
 from django.conf import settings
 
-from .check_parking import get_event_area
+from ...spatial_index import get_area_index
 
 
 def get_grace_duration(default=datetime.timedelta(minutes=15)):
@@ -14,6 +14,10 @@ def get_grace_duration(default=datetime.timedelta(minutes=15)):
 def get_event_parkings_in_assigned_event_areas(queryset):
     in_assigned_event_area = []
     for event_parking in queryset.all():
-        if get_event_area(event_parking.location_gk25fin, domain=event_parking.domain) == event_parking.event_area:
+        location = event_parking.location_gk25fin
+        event_area = (
+            get_area_index(event_parking.domain).get_event_area(location)
+            if location is not None else None)
+        if event_area == event_parking.event_area:
             in_assigned_event_area.append(event_parking.id)
     return queryset.filter(id__in=in_assigned_event_area)
@@ -4,11 +4,18 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers, viewsets
 
-from ...models import Parking
+from ... import plate_cache
+from ...models import EventParking, Parking
+from ...models.utils import normalize_reg_num
 from .permissions import IsEnforcer
 from .utils import (
     get_event_parkings_in_assigned_event_areas, get_grace_duration)
 
+CANDIDATE_KINDS = {
+    Parking: 'parking',
+    EventParking: 'event_parking',
+}
+
 
 class ValidSerializer(serializers.ModelSerializer):
     operator_name = serializers.CharField(source='operator.name')
@@ -142,6 +149,8 @@ class ValidViewSet(viewsets.ReadOnlyModelViewSet):
         with the PARKKIHUBI_TIME_OLD_PARKINGS_VISIBLE setting.
         """
         filtered_queryset = super().filter_queryset(queryset)
+        if self._has_no_cached_candidates(queryset):
+            return queryset.none()
         if filtered_queryset:
             return filtered_queryset
 
@@ -163,6 +172,29 @@ class ValidViewSet(viewsets.ReadOnlyModelViewSet):
 
         return valid_some_time_ago.order_by('-time_end')[:1]
 
+    def _has_no_cached_candidates(self, queryset):
+        """
+        Check from the plate cache if there is nothing to return.
+
+        The cached candidates of a registration number contain all the
+        parkings valid within the grace duration before the given time,
+        so if there are none, neither the valid parkings nor the last
+        valid parking would be found.
+        """
+        kind = CANDIDATE_KINDS.get(queryset.model)
+        if not kind or not plate_cache.is_enabled():
+            return False
+        filter_params = self._get_filter_params(queryset)
+        reg_num = filter_params.get('reg_num')
+        if not reg_num:
+            return False
+        time = filter_params.get('time') or timezone.now()
+        rows = plate_cache.peek_rows(
+            normalize_reg_num(reg_num),
+            self.request.user.enforcer.enforced_domain.pk,
+            time - get_grace_duration(), time)
+        return rows is not None and not any(row.kind == kind for row in rows)
+
     def _get_filter_params(self, queryset):
         filterset = self._get_filterset(queryset)
         is_valid = filterset.is_valid()
@@ -1,5 +1,6 @@
 import pytz
 from django.conf import settings
+from django.db import transaction
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import mixins, serializers, viewsets
@@ -8,16 +9,17 @@ from parkings.models import EnforcementDomain, EventArea, EventParking
 from parkings.models.constants import WGS84_SRID
 from parkings.models.utils import get_closest_area
 
-from ..common import ParkingException
-from .permissions import IsOperator
+from ...plate_cache import invalidate_plates
+from ..common import (
+    EnforcementDomainCodeField, ParkingException, save_with_unique_external_id)
+from .permissions import IsOperator, get_operator
 
 DEFAULT_DOMAIN_CODE = EnforcementDomain.get_default_domain_code()
 
 
 class OperatorAPIEventParkingSerializer(serializers.ModelSerializer):
     status = serializers.ReadOnlyField(source='get_state')
-    domain = serializers.SlugRelatedField(
-        slug_field='code', queryset=EnforcementDomain.objects.all(),
+    domain = EnforcementDomainCodeField(
         default=EnforcementDomain.get_default_domain)
     event_area_id = serializers.CharField(max_length=50, required=False)
 
@@ -31,6 +33,7 @@ class OperatorAPIEventParkingSerializer(serializers.ModelSerializer):
             'status',
             'domain',
             'event_area_id',
+            'external_id',
         )
 
         # these are needed because by default a PUT request that does not contain some optional field
@@ -39,6 +42,7 @@ class OperatorAPIEventParkingSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'location': {'default': None},
             'time_end': {'default': None},
+            'external_id': {'allow_blank': False},
         }
 
     def __init__(self, *args, **kwargs):
@@ -115,7 +119,7 @@ class OperatorAPIEventParkingPermission(IsOperator):
         """
         Allow operators to modify only their own parkings.
         """
-        return request.user.operator == obj.operator
+        return get_operator(request).pk == obj.operator_id
 
 
 class OperatorAPIEventParkingViewSet(mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin,
@@ -125,7 +129,15 @@ class OperatorAPIEventParkingViewSet(mixins.CreateModelMixin, mixins.UpdateModel
     serializer_class = OperatorAPIEventParkingSerializer
 
     def perform_create(self, serializer):
-        serializer.save(operator=self.request.user.operator)
+        save_with_unique_external_id(
+            serializer, operator=get_operator(self.request))
+
+    def perform_update(self, serializer):
+        old_reg_num = serializer.instance.normalized_reg_num
+        instance = save_with_unique_external_id(serializer)
+        if old_reg_num != instance.normalized_reg_num:
+            transaction.on_commit(lambda: invalidate_plates(
+                instance.domain_id, [old_reg_num]))
 
     def get_queryset(self):
-        return super().get_queryset().filter(operator=self.request.user.operator)
+        return super().get_queryset().filter(operator=get_operator(self.request))
@@ -1,24 +1,43 @@
+import json
+import time
+
 import pytz
 from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
-from rest_framework import mixins, serializers, viewsets
+from rest_framework import mixins, serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 
-from parkings.models import EnforcementDomain, Parking, PaymentZone
+from parkings.models import EnforcementDomain, Parking
 
-from ..common import ParkingException
-from .permissions import IsOperator
+from ...plate_cache import invalidate_plates
+from ..common import (
+    EXTERNAL_ID_TAKEN_MESSAGE, EnforcementDomainCodeField, ParkingException,
+    PaymentZoneCodeField, is_external_id_taken_error,
+    save_with_unique_external_id)
+from ..parsers import NDJSONParser
+from .permissions import IsOperator, get_operator
 
 DEFAULT_DOMAIN_CODE = EnforcementDomain.get_default_domain_code()
 
+# Fields which cannot be changed by upsert after the grace period
+UPSERT_FROZEN_FIELDS = [
+    'location', 'terminal_number', 'registration_number', 'time_start',
+    'zone', 'is_disc_parking', 'domain',
+]
+
 
 class OperatorAPIParkingSerializer(serializers.ModelSerializer):
     status = serializers.ReadOnlyField(source='get_state')
-    domain = serializers.SlugRelatedField(
-        slug_field='code', queryset=EnforcementDomain.objects.all(),
+    domain = EnforcementDomainCodeField(
         default=EnforcementDomain.get_default_domain)
-    zone = serializers.SlugRelatedField(
-        slug_field='code', queryset=PaymentZone.objects.all())
+    zone = PaymentZoneCodeField()
 
     class Meta:
         model = Parking
@@ -30,6 +49,7 @@ class OperatorAPIParkingSerializer(serializers.ModelSerializer):
             'zone',
             'status', 'is_disc_parking',
             'domain',
+            'external_id',
         )
 
         # these are needed because by default a PUT request that does not contain some optional field
@@ -40,6 +60,7 @@ class OperatorAPIParkingSerializer(serializers.ModelSerializer):
             'terminal_number': {'default': ''},
             'time_end': {'default': None},
             'is_disc_parking': {'default': False},
+            'external_id': {'allow_blank': False},
         }
 
     def __init__(self, *args, **kwargs):
@@ -55,9 +76,11 @@ class OperatorAPIParkingSerializer(serializers.ModelSerializer):
             self.fields['zone'].required = False
 
         if initial_data:
-            domain = initial_data.get('domain', DEFAULT_DOMAIN_CODE)
-            self.fields['zone'].queryset = (
-                PaymentZone.objects.filter(domain__code=domain))
+            self.limit_zones_to_domain(
+                initial_data.get('domain', DEFAULT_DOMAIN_CODE))
+
+    def limit_zones_to_domain(self, domain_code):
+        self.fields['zone'].domain_code = domain_code
 
     def validate(self, data):
         if self.instance and (now() - self.instance.created_at) > settings.PARKKIHUBI_TIME_PARKINGS_EDITABLE:
@@ -80,6 +103,26 @@ class OperatorAPIParkingSerializer(serializers.ModelSerializer):
 
         return data
 
+    def update(self, instance, validated_data):
+        if set(validated_data) == {'time_end'}:
+            return self.update_time_end(instance, validated_data['time_end'])
+        return super().update(instance, validated_data)
+
+    def update_time_end(self, instance, time_end):
+        """
+        Update only the end time of the parking with a narrow update.
+        """
+        queryset = Parking.objects.filter(pk=instance.pk)
+        modified_at = queryset.set_end_times({instance.pk: time_end})
+        if instance.pk not in modified_at:
+            # The parking was changed to start after the end time after
+            # it was validated
+            raise serializers.ValidationError(
+                _('"time_start" cannot be after "time_end".'))
+        instance.time_end = time_end
+        instance.modified_at = modified_at[instance.pk]
+        return instance
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
 
@@ -95,7 +138,7 @@ class OperatorAPIParkingPermission(IsOperator):
         """
         Allow operators to modify only their own parkings.
         """
-        return request.user.operator == obj.operator
+        return get_operator(request).pk == obj.operator_id
 
 
 class OperatorAPIParkingViewSet(mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin,
@@ -105,7 +148,413 @@ class OperatorAPIParkingViewSet(mixins.CreateModelMixin, mixins.UpdateModelMixin
     serializer_class = OperatorAPIParkingSerializer
 
     def perform_create(self, serializer):
-        serializer.save(operator=self.request.user.operator)
+        save_with_unique_external_id(
+            serializer, operator=get_operator(self.request))
+
+    def perform_update(self, serializer):
+        old_reg_num = serializer.instance.normalized_reg_num
+        instance = save_with_unique_external_id(serializer)
+        if old_reg_num != instance.normalized_reg_num:
+            transaction.on_commit(lambda: invalidate_plates(
+                instance.domain_id, [old_reg_num]))
 
     def get_queryset(self):
-        return super().get_queryset().filter(operator=self.request.user.operator)
+        return super().get_queryset().filter(operator=get_operator(self.request))
+
+    @action(detail=False, methods=['put'], url_name='external',
+            url_path=r'external/(?P<external_id>[^/]+)')
+    def upsert(self, request, external_id):
+        """
+        Create or replace a parking by its external id.
+
+        Takes a parking in the same format as the create endpoint and
+        either creates it or replaces the operator's parking with the
+        same external id with a single statement.  After the grace
+        period only the end time of an existing parking can change.
+        """
+        if not isinstance(request.data, dict):
+            raise serializers.ValidationError(_("Expected a parking."))
+        data = dict(request.data.items(), external_id=external_id)
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        parking = Parking(
+            operator=get_operator(request), **serializer.validated_data)
+        created = upsert_parking(parking)
+        serializer.instance = parking
+        return Response(serializer.data, status=(
+            status.HTTP_201_CREATED if created else status.HTTP_200_OK))
+
+    @action(detail=False, methods=['post'], url_path='bulk', url_name='bulk',
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk_create(self, request):
+        """
+        Create many parkings at once.
+
+        Takes a JSON array or NDJSON stream of parkings in the same
+        format as the create endpoint and returns the id or the
+        validation errors of each item in the same order.
+        """
+        items = get_bulk_items(request)
+        results = [validate_bulk_item(item) for item in items]
+        create_parkings(results, get_operator(request), self.get_queryset())
+        return make_bulk_response(results, 'created', status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='end', url_name='end',
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk_end(self, request):
+        """
+        Set end times of many parkings at once.
+
+        Takes a JSON array or NDJSON stream of objects with "id" and
+        "time_end" and updates only the end times of the parkings with
+        a single update.  Returns the id or the errors of each item in
+        the same order.
+        """
+        items = get_bulk_items(request)
+        results = [
+            validate_bulk_item(item, OperatorAPIParkingEndSerializer)
+            for item in items]
+        end_parkings(results, self.get_queryset())
+        return make_bulk_response(results, 'updated', status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='stream',
+            url_name='stream', parser_classes=[NDJSONParser])
+    def stream(self, request):
+        """
+        Apply a stream of parking events.
+
+        Takes an NDJSON stream of events, which are parkings with "op"
+        of "create" or "upsert" or objects with "op" of "end", "id" and
+        "time_end".  The events are applied in micro-batches as they
+        are read and an acknowledgement with the line number and the id
+        or the errors of each event is streamed back as NDJSON.
+
+        Within a micro-batch the events are reordered: the creates are
+        applied first, then the upserts and finally the ends.  If a
+        micro-batch fails in the database, none of its events are
+        applied and each of them is acknowledged with an error.
+        """
+        lines = get_stream_lines(request)
+        if lines is None:
+            return Response(
+                {'detail': _("Content-Length or chunked transfer encoding is required.")},
+                status=status.HTTP_411_LENGTH_REQUIRED)
+        events = process_parking_events(
+            lines, get_operator(request), self.get_queryset())
+        return StreamingHttpResponse(
+            (json.dumps(ack, cls=JSONEncoder) + '\n' for ack in events),
+            content_type='application/x-ndjson')
+
+
+class OperatorAPIParkingEndSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    time_end = serializers.DateTimeField()
+
+
+# Serializers of the operations of the parking event stream
+STREAM_SERIALIZERS = {
+    'create': OperatorAPIParkingSerializer,
+    'upsert': OperatorAPIParkingSerializer,
+    'end': OperatorAPIParkingEndSerializer,
+}
+
+
+def get_bulk_items(request):
+    items = request.data
+    if not isinstance(items, list):
+        raise serializers.ValidationError(
+            _("Expected a list of parkings."))
+    max_size = get_bulk_max_size()
+    if len(items) > max_size:
+        raise serializers.ValidationError(
+            _("At most {max_size} parkings can be processed at once.").format(
+                max_size=max_size))
+    return items
+
+
+def validate_bulk_item(item, serializer_class=OperatorAPIParkingSerializer):
+    """
+    Validate a single item of a bulk request.
+
+    :rtype: dict
+    :return: Dictionary with either "validated_data" or "errors"
+    """
+    if not isinstance(item, dict):
+        return {'errors': {api_settings.NON_FIELD_ERRORS_KEY: [
+            _("Invalid data. Expected a dictionary, but got {datatype}.").format(
+                datatype=type(item).__name__)]}}
+    serializer = serializer_class(data=item)
+    if not serializer.is_valid():
+        return {'errors': serializer.errors}
+    return {'validated_data': dict(serializer.validated_data)}
+
+
+def make_bulk_response(results, done_key, success_status):
+    """
+    Make response of a bulk request from the results of the items.
+
+    The response has the success status if all the items succeeded, 400
+    if all of them failed and 200 otherwise.
+    """
+    done = sum(1 for x in results if 'errors' not in x)
+    failed = len(results) - done
+    response_status = (
+        success_status if not failed else
+        status.HTTP_400_BAD_REQUEST if not done else
+        status.HTTP_200_OK)
+    return Response({
+        done_key: done,
+        'failed': failed,
+        'results': results,
+    }, status=response_status)
+
+
+def create_parkings(results, operator, queryset):
+    """
+    Create parkings of the validated bulk items with a single insert.
+
+    The id of the created parking is set to the result of each item.
+    If a concurrent request takes some of the external ids after they
+    were checked, the insert is rolled back and retried without the
+    items whose external id got taken.
+
+    :type results: list[dict]
+    :param queryset: Parkings of the operator
+    """
+    check_external_ids(results, queryset)
+    while True:
+        valid_results = [x for x in results if 'errors' not in x]
+        try:
+            parkings = Parking.create_in_bulk([
+                Parking(operator=operator, **x['validated_data'])
+                for x in valid_results])
+            break
+        except IntegrityError as error:
+            if not is_external_id_taken_error(error):
+                raise
+            check_external_ids(valid_results, queryset)
+            if all('errors' not in x for x in valid_results):
+                raise
+    for (result, parking) in zip(valid_results, parkings):
+        del result['validated_data']
+        result['id'] = parking.pk
+
+
+def end_parkings(results, queryset):
+    """
+    Set end times of the validated bulk items with a single update.
+
+    :type results: list[dict]
+    :param queryset: Parkings of the operator
+    """
+    end_times = {
+        x['validated_data']['id']: x['validated_data']['time_end']
+        for x in results if 'errors' not in x}
+    modified = queryset.set_end_times(end_times)
+    not_updated = set(end_times) - set(modified)
+    time_starts = dict(
+        queryset.filter(pk__in=not_updated)
+        .values_list('pk', 'time_start')) if not_updated else {}
+
+    for result in results:
+        if 'errors' in result:
+            continue
+        parking_id = result.pop('validated_data')['id']
+        result['id'] = parking_id
+        if parking_id in modified:
+            continue
+        elif parking_id in time_starts:
+            result['errors'] = {api_settings.NON_FIELD_ERRORS_KEY: [
+                _('"time_start" cannot be after "time_end".')]}
+        else:
+            result['errors'] = {'id': [_("Parking not found.")]}
+
+
+def upsert_parking(parking):
+    """
+    Create the parking or replace the parking with its external id.
+
+    :type parking: Parking
+    :rtype: bool
+    :return: True if created, False if replaced
+    """
+    created = parking.upsert(
+        frozen_since=(now() - settings.PARKKIHUBI_TIME_PARKINGS_EDITABLE),
+        frozen_fields=UPSERT_FROZEN_FIELDS)
+    if created is None:
+        raise ParkingException(
+            _('Grace period has passed. Only "time_end" can be updated.'),
+            code='grace_period_over',
+        )
+    return created
+
+
+def get_stream_lines(request):
+    """
+    Get the lines of the request body as they are received.
+
+    DRF gives no stream for a request without Content-Length, which is
+    how a chunked request is sent, so its body is read from the WSGI
+    input directly.  The WSGI server has removed the chunk framing.
+
+    :rtype: Iterable[bytes]|None
+    :return: The lines, or None if the length of the body is unknown
+    """
+    if request.stream is not None:
+        return request.stream
+    meta = request._request.META
+    if 'chunked' in meta.get('HTTP_TRANSFER_ENCODING', '').lower():
+        return iter(meta['wsgi.input'].readline, b'')
+    if meta.get('CONTENT_LENGTH'):  # Empty body with Content-Length: 0
+        return []
+    return None
+
+
+def process_parking_events(lines, operator, queryset):
+    """
+    Apply parking events of a stream in micro-batches.
+
+    The lines are collected to a batch until the batch is full or the
+    maximum delay since its first line has passed.  Note that the delay
+    is checked only when a line is read.
+
+    :type lines: Iterable[bytes]
+    :param queryset: Parkings of the operator
+    :rtype: Iterable[dict]
+    :return: Acknowledgement of each event in the order of the lines
+    """
+    batch_size = get_stream_batch_size()
+    max_delay = get_stream_max_delay()
+    batch = []
+    batch_started_at = None
+    for (line_number, line) in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if not batch:
+            batch_started_at = time.monotonic()
+        batch.append((line_number, line))
+        if (len(batch) >= batch_size
+                or time.monotonic() - batch_started_at >= max_delay):
+            yield from apply_parking_events(batch, operator, queryset)
+            batch = []
+    if batch:
+        yield from apply_parking_events(batch, operator, queryset)
+
+
+def apply_parking_events(batch, operator, queryset):
+    """
+    Apply a batch of parking events.
+
+    All the creates of the batch are done with a single insert, then
+    the upserts one by one and finally the ends with a single update,
+    so the events are not applied in the order of the lines.  The
+    batch is applied in a transaction: if it fails in the database,
+    e.g. because an external id was taken concurrently, it is rolled
+    back and its events which had no errors are acknowledged with an
+    error.
+
+    :type batch: list[(int, bytes)]
+    :rtype: list[dict]
+    """
+    acks = []
+    acks_by_op = {op: [] for op in STREAM_SERIALIZERS}
+    for (line_number, line) in batch:
+        (op, result) = parse_parking_event(line)
+        ack = dict({'line': line_number, 'op': op}, **result)
+        acks.append(ack)
+        if 'errors' not in ack:
+            acks_by_op[op].append(ack)
+
+    applied = [ack for op_acks in acks_by_op.values() for ack in op_acks]
+    try:
+        with transaction.atomic():
+            create_parkings(acks_by_op['create'], operator, queryset)
+            for ack in acks_by_op['upsert']:
+                apply_upsert_event(ack, operator)
+            end_parkings(acks_by_op['end'], queryset)
+    except DatabaseError:
+        for ack in applied:
+            if 'errors' in ack:
+                continue
+            for key in ['validated_data', 'id', 'created']:
+                ack.pop(key, None)
+            ack['errors'] = {api_settings.NON_FIELD_ERRORS_KEY: [
+                _("The batch of this event failed and it was not applied.")]}
+    return acks
+
+
+def parse_parking_event(line):
+    """
+    Parse and validate a line of a parking event stream.
+
+    :type line: bytes
+    :rtype: (str|None, dict)
+    :return: Operation and a dictionary with "validated_data" or "errors"
+    """
+    try:
+        event = json.loads(line)
+    except ValueError as error:
+        return (None, {'errors': {api_settings.NON_FIELD_ERRORS_KEY: [
+            _("JSON parse error - {error}").format(error=error)]}})
+    op = event.pop('op', None) if isinstance(event, dict) else None
+    if op not in STREAM_SERIALIZERS:
+        return (None, {'errors': {'op': [
+            _('Expected "create", "upsert" or "end".')]}})
+    return (op, validate_bulk_item(event, STREAM_SERIALIZERS[op]))
+
+
+def apply_upsert_event(ack, operator):
+    data = ack.pop('validated_data')
+    if not data.get('external_id'):
+        ack['errors'] = {'external_id': [_("This field is required.")]}
+        return
+    parking = Parking(operator=operator, **data)
+    try:
+        ack['created'] = upsert_parking(parking)
+    except ParkingException as error:
+        ack['errors'] = {api_settings.NON_FIELD_ERRORS_KEY: [error.detail]}
+        return
+    ack['id'] = parking.pk
+
+
+def check_external_ids(results, queryset):
+    """
+    Turn validated items with a taken external id to errors.
+
+    An external id is taken if it is used by a parking in the queryset
+    or by an earlier item of the same request.
+
+    :type results: list[dict]
+    """
+    external_ids = [
+        x['validated_data'].get('external_id') for x in results
+        if 'errors' not in x]
+    if not any(external_ids):
+        return
+    taken = set(queryset.filter(external_id__in=set(external_ids) - {None})
+                .values_list('external_id', flat=True))
+    for result in results:
+        if 'errors' in result:
+            continue
+        external_id = result['validated_data'].get('external_id')
+        if external_id is None:
+            continue
+        if external_id in taken:
+            del result['validated_data']
+            result['errors'] = {'external_id': [EXTERNAL_ID_TAKEN_MESSAGE]}
+        taken.add(external_id)
+
+
+def get_bulk_max_size(default=5000):
+    setting = getattr(settings, "PARKKIHUBI_OPERATOR_PARKING_BULK_MAX_SIZE", None)
+    return setting if setting is not None else default
+
+
+def get_stream_batch_size(default=500):
+    setting = getattr(settings, "PARKKIHUBI_OPERATOR_PARKING_STREAM_BATCH_SIZE", None)
+    return setting if setting is not None else default
+
+
+def get_stream_max_delay(default=1.0):
+    setting = getattr(settings, "PARKKIHUBI_OPERATOR_PARKING_STREAM_MAX_DELAY", None)
+    return setting if setting is not None else default
@@ -1,6 +1,6 @@
 from rest_framework import permissions
 
-from parkings.models import Operator
+from ... import reference_data
 
 
 class IsOperator(permissions.BasePermission):
@@ -13,10 +13,13 @@ class IsOperator(permissions.BasePermission):
         if not user.is_authenticated:
             return False
 
-        try:
-            user.operator
-            return True
-        except Operator.DoesNotExist:
-            pass
+        return get_operator(request) is not None
 
-        return False
+
+def get_operator(request):
+    """
+    Get operator of the requesting user from the reference data.
+
+    :rtype: parkings.models.Operator|None
+    """
+    return reference_data.get_operator_of_user(request.user.pk)
@@ -24,6 +24,9 @@ class OperatorPermitSeriesViewSet(mixins.DestroyModelMixin, PermitSeriesViewSet)
             Q(pk__in=params.get('deactivate_series', [])))
         return self.execute_activation(deactivate_id_filter)
 
+    def get_permit_serializer_class(self):
+        return OperatorPermitSerializer
+
 
 class PermitSeriesActivateBodySerializer(serializers.Serializer):
     deactivate_others = serializers.BooleanField(required=False, default=False)
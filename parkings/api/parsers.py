@@ -0,0 +1,32 @@
+import codecs
+import json
+
+from django.conf import settings
+from django.utils.translation import gettext as _
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parse newline delimited JSON to a list of the parsed lines.
+
+    Empty lines are skipped.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        reader = codecs.getreader(encoding)(stream)
+        result = []
+        for (line_number, line) in enumerate(reader, 1):
+            if not line.strip():
+                continue
+            try:
+                result.append(json.loads(line))
+            except ValueError as error:
+                raise ParseError(
+                    _("NDJSON parse error on line {line}: {error}").format(
+                        line=line_number, error=error))
+        return result
@@ -1,5 +1,6 @@
 
 import django_filters
+from django.db.models import Q
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, permissions, serializers, viewsets
 
@@ -16,6 +17,19 @@ class ArchivedParkingAnonymizedFilterSet(django_filters.FilterSet):
             'archived_at': ['lte', 'gte'],
         }
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        time_start_min = self.form.cleaned_data.get('time_start__gte')
+        if time_start_min is not None:
+            # A parking ends after it starts, so the same limit applies
+            # to the end time.  The archived parkings may be partitioned
+            # by the end time and this lets the older partitions be
+            # skipped.  Parkings without an end time are in the default
+            # partition.
+            queryset = queryset.filter(
+                Q(time_end__gte=time_start_min) | Q(time_end=None))
+        return queryset
+
 
 class ArchivedParkingAnonymizedSerializer(serializers.ModelSerializer):
 
@@ -0,0 +1,370 @@
+"""
+Benchmarking of the API endpoints.
+
+A synthetic data set is generated to the database with the factories of
+`parkings.factories`, and then each benchmark scenario requests its API
+endpoint repeatedly with the Django test client.  The requests are done
+sequentially by a single client, so the throughput figures are per
+process.
+
+The results can be compared to the results of an earlier run, stored as
+a JSON file, to spot regressions.  See the bench management command.
+"""
+import json
+import random
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .factories import (
+    DataUserFactory, EnforcementDomainFactory, EnforcerFactory,
+    HistoryParkingFactory, MonitorFactory, OperatorFactory, ParkingAreaFactory,
+    ParkingFactory, RegionFactory)
+from .factories.faker import fake
+from .factories.gis import generate_location, generate_multi_polygon
+from .factories.permit import (
+    create_permit, create_permit_area, create_permit_series,
+    generate_external_ids, generate_subjects)
+from .factories.utils import generate_registration_number
+from .models import PaymentZone
+
+ZONE_COUNT = 3
+PERMIT_AREA_IDENTIFIERS = ["A", "B", "C", "D", "E"]
+REGION_COUNT = 5
+PARKING_AREA_COUNT = 10
+
+# Share of the checked registration numbers which have no parkings or
+# permits, like most of the checked vehicles in reality
+UNKNOWN_REG_NUM_RATIO = 0.5
+
+BATCH_SIZE = 20
+
+# Metrics which are worse when larger and compared against the baseline
+COMPARED_METRICS = ["p50_ms", "p95_ms", "p99_ms", "queries_per_request"]
+
+Dataset = namedtuple("Dataset", [
+    "domain", "zones", "operator", "enforcer", "monitor", "data_user",
+    "permit_series", "parkings", "reg_nums", "clients"])
+
+Request = namedtuple("Request", [
+    "client", "method", "path", "data", "expected_status"])
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def create_dataset(parking_count=1000, permit_count=200, seed=0):
+    """
+    Create a synthetic data set for the benchmarks.
+
+    :rtype: Dataset
+    """
+    fake.seed(seed)
+    domain = EnforcementDomainFactory()
+    operator = OperatorFactory()
+    enforcer = EnforcerFactory(enforced_domain=domain)
+    monitor = MonitorFactory(domain=domain)
+    data_user = DataUserFactory()
+    zones = [
+        PaymentZone.objects.create(
+            domain=domain, number=number, code=str(number),
+            name="Zone {}".format(number), geom=generate_multi_polygon())
+        for number in range(1, ZONE_COUNT + 1)]
+    for identifier in PERMIT_AREA_IDENTIFIERS:
+        create_permit_area(identifier, domain, allowed_user=enforcer.user)
+    for _ in range(REGION_COUNT):
+        RegionFactory(domain=domain)
+    for _ in range(PARKING_AREA_COUNT):
+        ParkingAreaFactory(domain=domain)
+
+    parkings = []
+    for n in range(parking_count):
+        factory = ParkingFactory if n % 4 else HistoryParkingFactory
+        parkings.append(factory(
+            domain=domain, operator=operator,
+            zone=fake.random.choice(zones)))
+
+    permit_series = create_permit_series(active=True, owner=enforcer.user)
+    reg_nums = [parking.registration_number for parking in parkings]
+    for _ in range(permit_count):
+        permit = create_permit(
+            domain=domain, series=permit_series,
+            external_id=generate_external_ids(), owner=enforcer.user,
+            subject_count=1, area_count=1)
+        reg_nums.extend(x["registration_number"] for x in permit.subjects)
+
+    return Dataset(
+        domain=domain, zones=zones, operator=operator, enforcer=enforcer,
+        monitor=monitor, data_user=data_user, permit_series=permit_series,
+        parkings=parkings, reg_nums=reg_nums, clients={
+            "operator": _make_client(operator.user),
+            "enforcer": _make_client(enforcer.user),
+            "monitor": _make_client(monitor.user),
+            "data_user": _make_client(data_user.user),
+        })
+
+
+def _make_client(user):
+    (token, _created) = Token.objects.get_or_create(user=user)
+    return Client(HTTP_AUTHORIZATION="ApiKey " + token.key)
+
+
+def _format_time(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _pick_reg_num(dataset, rng):
+    if not dataset.reg_nums or rng.random() < UNKNOWN_REG_NUM_RATIO:
+        return generate_registration_number()
+    return rng.choice(dataset.reg_nums)
+
+
+def _make_check_data(dataset, rng):
+    location = generate_location()
+    return {
+        "registration_number": _pick_reg_num(dataset, rng),
+        "location": {"longitude": location.x, "latitude": location.y},
+    }
+
+
+def check_parking(dataset, rng):
+    return Request(
+        dataset.clients["enforcer"], "post",
+        reverse("enforcement:v1:check_parking"),
+        _make_check_data(dataset, rng), 200)
+
+
+def check_parking_batch(dataset, rng):
+    return Request(
+        dataset.clients["enforcer"], "post",
+        reverse("enforcement:v1:check_parking_batch"),
+        [_make_check_data(dataset, rng) for _ in range(BATCH_SIZE)], 200)
+
+
+def operator_parking_create(dataset, rng):
+    location = generate_location()
+    now = timezone.now()
+    return Request(
+        dataset.clients["operator"], "post",
+        reverse("operator:v1:parking-list"), {
+            "registration_number": generate_registration_number(),
+            "domain": dataset.domain.code,
+            "zone": rng.choice(dataset.zones).casted_code,
+            "time_start": _format_time(now),
+            "time_end": _format_time(
+                now + timedelta(minutes=rng.randint(10, 240))),
+            "location": {
+                "type": "Point", "coordinates": [location.x, location.y]},
+        }, 201)
+
+
+def operator_parking_patch(dataset, rng):
+    parking = rng.choice(dataset.parkings)
+    time_end = max(parking.time_start, timezone.now()) + timedelta(
+        minutes=rng.randint(10, 240))
+    return Request(
+        dataset.clients["operator"], "patch",
+        reverse("operator:v1:parking-detail", kwargs={"pk": parking.pk}),
+        {"time_end": _format_time(time_end)}, 200)
+
+
+def permit_upload(dataset, rng):
+    now = timezone.now()
+    return Request(
+        dataset.clients["enforcer"], "post",
+        reverse("enforcement:v1:permit-list"), {
+            "series": dataset.permit_series.pk,
+            "external_id": generate_external_ids(),
+            "subjects": generate_subjects(),
+            "areas": [{
+                "area": rng.choice(PERMIT_AREA_IDENTIFIERS),
+                "start_time": _format_time(now - timedelta(hours=1)),
+                "end_time": _format_time(now + timedelta(days=30)),
+            }],
+        }, 201)
+
+
+def valid_parking(dataset, rng):
+    return Request(
+        dataset.clients["enforcer"], "get",
+        reverse("enforcement:v1:valid_parking-list"),
+        {"reg_num": _pick_reg_num(dataset, rng)}, 200)
+
+
+def region_statistics(dataset, rng):
+    return Request(
+        dataset.clients["monitor"], "get",
+        reverse("monitoring:v1:regionstatistics-list"), None, 200)
+
+
+def parking_area_statistics(dataset, rng):
+    return Request(
+        Client(), "get",
+        reverse("public:v1:parkingareastatistics-list"), None, 200)
+
+
+def parking_anonymized(dataset, rng):
+    since = timezone.now() - timedelta(days=rng.randint(1, 30))
+    return Request(
+        dataset.clients["data_user"], "get",
+        reverse("data:v1:parking_anonymized-list"),
+        {"time_start__gte": _format_time(since)}, 200)
+
+
+SCENARIOS = {func.__name__: func for func in [
+    check_parking,
+    check_parking_batch,
+    operator_parking_create,
+    operator_parking_patch,
+    permit_upload,
+    valid_parking,
+    region_statistics,
+    parking_area_statistics,
+    parking_anonymized,
+]}
+
+
+def perform(request):
+    """
+    Perform a request and check its status code.
+
+    :type request: Request
+    """
+    method = getattr(request.client, request.method)
+    if request.method == "get":
+        response = method(request.path, request.data)
+    else:
+        response = method(
+            request.path, json.dumps(request.data),
+            content_type="application/json")
+    if response.status_code != request.expected_status:
+        raise BenchmarkError("{} {} returned {}: {}".format(
+            request.method.upper(), request.path, response.status_code,
+            response.content[:500].decode("utf-8", "replace")))
+    return response
+
+
+def run_scenario(scenario, dataset, iterations=100, warmup=10, seed=0):
+    """
+    Run a benchmark scenario.
+
+    :param scenario: Function returning a `Request` to perform
+    :type dataset: Dataset
+    :rtype: dict
+    """
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        perform(scenario(dataset, rng))
+
+    durations = []
+    query_counts = []
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        request = scenario(dataset, rng)
+        with CaptureQueriesContext(connection) as queries:
+            request_started_at = time.perf_counter()
+            perform(request)
+            durations.append(time.perf_counter() - request_started_at)
+        query_counts.append(len(queries))
+    total_duration = time.perf_counter() - started_at
+    return summarize(durations, query_counts, total_duration)
+
+
+def run_benchmarks(dataset, scenario_names=None, iterations=100, warmup=10,
+                   seed=0):
+    """
+    Run the given or all benchmark scenarios.
+
+    :rtype: dict[str, dict]
+    """
+    return {
+        name: run_scenario(
+            SCENARIOS[name], dataset, iterations=iterations, warmup=warmup,
+            seed=seed)
+        for name in (scenario_names or SCENARIOS)}
+
+
+def summarize(durations, query_counts, total_duration):
+    """
+    Summarize measurements of a scenario.
+
+    >>> summarize([0.001, 0.002, 0.003, 0.004], [2, 2, 3, 3], 0.02)
+    {'requests': 4, 'p50_ms': 2.5, 'p95_ms': 3.85, 'p99_ms': 3.97,
+     'mean_ms': 2.5, 'throughput_rps': 200.0, 'queries_per_request': 2.5}
+    """
+    count = len(durations)
+    durations_ms = sorted(1000.0 * x for x in durations)
+    return {
+        "requests": count,
+        "p50_ms": round(percentile(durations_ms, 50), 3),
+        "p95_ms": round(percentile(durations_ms, 95), 3),
+        "p99_ms": round(percentile(durations_ms, 99), 3),
+        "mean_ms": round(sum(durations_ms) / count, 3),
+        "throughput_rps": round(count / total_duration, 1),
+        "queries_per_request": round(sum(query_counts) / count, 2),
+    }
+
+
+def percentile(sorted_values, percent):
+    """
+    Get a percentile of sorted values with linear interpolation.
+
+    >>> percentile([1, 2, 3, 4, 5], 50)
+    3.0
+    >>> percentile([1, 2, 3, 4], 25)
+    1.75
+    >>> percentile([7], 99)
+    7.0
+    """
+    position = (len(sorted_values) - 1) * percent / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return float(
+        sorted_values[lower] +
+        (sorted_values[upper] - sorted_values[lower]) * fraction)
+
+
+def find_regressions(results, baseline, tolerance=0.2):
+    """
+    Find metrics which are worse than in the baseline.
+
+    Latencies are regressions if they exceed the baseline by more than
+    the tolerance fraction, and query counts if they exceed it at all.
+
+    >>> find_regressions(
+    ...     {"a": {"p50_ms": 13.0, "p95_ms": 20.0, "p99_ms": 25.0,
+    ...            "queries_per_request": 4}},
+    ...     {"a": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0,
+    ...            "queries_per_request": 3},
+    ...      "b": {"p50_ms": 1.0}})
+    [('a', 'p50_ms', 10.0, 13.0), ('a', 'queries_per_request', 3, 4)]
+
+    :type results: dict[str, dict]
+    :type baseline: dict[str, dict]
+    :rtype: list[(str, str, float, float)]
+    :return: List of (scenario, metric, baseline value, current value)
+    """
+    regressions = []
+    for (name, result) in results.items():
+        baseline_result = baseline.get(name)
+        if not baseline_result:
+            continue
+        for metric in COMPARED_METRICS:
+            old = baseline_result.get(metric)
+            new = result.get(metric)
+            if old is None or new is None:
+                continue
+            allowed = old if metric == "queries_per_request" else (
+                old * (1 + tolerance))
+            if new > allowed:
+                regressions.append((name, metric, old, new))
+    return regressions
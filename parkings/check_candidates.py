@@ -0,0 +1,266 @@
+"""
+Fetching of the objects that may allow parking of a vehicle.
+
+A parking check needs to know the parkings, event parkings and active
+permit lookup items of the checked registration number, both at the
+time of the check and within the grace duration before it.  Instead of
+querying each of them separately for both times, all candidates valid
+at some point of the whole time window are fetched with a single UNION
+query, and the rest of the evaluation is done in Python.
+"""
+from collections import namedtuple
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from . import plate_cache, plate_filter
+from .models import (
+    EventParking, Parking, PaymentZone, Permit, PermitLookupItem, PermitSeries)
+from .models.utils import normalize_reg_num
+
+
+class Candidates(namedtuple("Candidates", [
+    "parkings",
+    "event_parkings",
+    "permit_lookup_items",
+])):
+    def valid_at(self, time):
+        """
+        Filter to candidates which are valid at given time.
+
+        Matches the ``valid_at`` and ``by_time`` filters of the querysets.
+
+        :type time: datetime.datetime
+        :rtype: Candidates
+        """
+        return Candidates(
+            [x for x in self.parkings if _is_valid(x, time)],
+            [x for x in self.event_parkings if _is_valid(x, time)],
+            [x for x in self.permit_lookup_items
+             if x.start_time <= time <= x.end_time])
+
+
+def _is_valid(parking, time):
+    return (parking.time_start <= time and (
+        parking.time_end is None or parking.time_end >= time))
+
+
+CandidateRow = namedtuple("CandidateRow", [
+    "kind",
+    "reg_num",
+    "id",
+    "item_id",
+    "time_start",
+    "time_end",
+    "zone_id",
+    "zone_number",
+    "event_area_id",
+    "permit_id",
+    "area_id",
+    "operator_id",
+])
+
+CANDIDATES_SQL = """
+SELECT 'parking', p.normalized_reg_num, p.id, NULL::integer,
+       p.time_start, p.time_end, p.zone_id, z.number,
+       NULL::uuid, NULL::integer, NULL::integer, p.operator_id
+  FROM {parking} p
+  LEFT JOIN {zone} z ON z.id = p.zone_id
+ WHERE p.normalized_reg_num = ANY(%(reg_nums)s)
+   AND p.domain_id = %(domain_id)s
+   AND p.validity && tstzrange(%(time_from)s, %(time_to)s, '[]')
+UNION ALL
+SELECT 'event_parking', e.normalized_reg_num, e.id, NULL,
+       e.time_start, e.time_end, NULL, NULL,
+       e.event_area_id, NULL, NULL, e.operator_id
+  FROM {event_parking} e
+ WHERE e.normalized_reg_num = ANY(%(reg_nums)s)
+   AND e.domain_id = %(domain_id)s
+   AND e.validity && tstzrange(%(time_from)s, %(time_to)s, '[]')
+UNION ALL
+SELECT 'permit', i.registration_number, NULL, i.id,
+       i.start_time, i.end_time, NULL, NULL,
+       NULL, i.permit_id, i.area_id, NULL
+  FROM {lookup_item} i
+  JOIN {permit} pe ON pe.id = i.permit_id
+  JOIN {series} s ON s.id = pe.series_id
+ WHERE i.registration_number = ANY(%(reg_nums)s)
+   AND pe.domain_id = %(domain_id)s
+   AND s.active
+   AND i.validity && tstzrange(%(time_from)s, %(time_to)s, '[]')
+ ORDER BY 1, 5, 6, 4
+"""
+
+# Primary keys of the rows written by transactions not older than given
+# 64-bit transaction id
+WRITTEN_SINCE_SQL = """
+SELECT {pk} FROM {table}
+WHERE age(xmin) <= age(mod(%s::bigint, 4294967296)::text::xid)
+"""
+
+
+def fetch_candidate_rows(normalized_reg_nums, domain_id, time_from, time_to):
+    """
+    Fetch candidate rows of registration numbers within a time window.
+
+    The rows overlapping the window are found with their validity range
+    columns, so that the GiST indexes of the registration number and
+    the validity range serve the query.
+
+    :type normalized_reg_nums: list[str]
+    :type domain_id: int
+    :type time_from: datetime.datetime
+    :type time_to: datetime.datetime
+    :rtype: dict[str, list[CandidateRow]]
+    """
+    rows_by_reg_num = {reg_num: [] for reg_num in normalized_reg_nums}
+    if not rows_by_reg_num:
+        return rows_by_reg_num
+    connection = connections[router.db_for_read(Parking)]
+    quote = connection.ops.quote_name
+    sql = CANDIDATES_SQL.format(
+        parking=quote(Parking._meta.db_table),
+        zone=quote(PaymentZone._meta.db_table),
+        event_parking=quote(EventParking._meta.db_table),
+        lookup_item=quote(PermitLookupItem._meta.db_table),
+        permit=quote(Permit._meta.db_table),
+        series=quote(PermitSeries._meta.db_table),
+    )
+    params = {
+        "reg_nums": list(rows_by_reg_num),
+        "domain_id": domain_id,
+        "time_from": time_from,
+        "time_to": time_to,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            candidate_row = CandidateRow(*row)
+            rows_by_reg_num[candidate_row.reg_num].append(candidate_row)
+    return rows_by_reg_num
+
+
+def get_candidates(registration_number, domain, time_from, time_to):
+    """
+    Get candidates of a single registration number.
+
+    :type registration_number: str
+    :type domain: parkings.models.EnforcementDomain
+    :rtype: Candidates
+    """
+    reg_num = normalize_reg_num(registration_number)
+    rows = get_candidate_rows([reg_num], domain.pk, time_from, time_to)
+    return make_candidates(rows[reg_num])
+
+
+def get_candidate_rows(normalized_reg_nums, domain_id, time_from, time_to):
+    """
+    Get candidate rows of registration numbers within a time window.
+
+    Same as `fetch_candidate_rows`, but uses the plate filter and the
+    plate cache if they are enabled.
+
+    :rtype: dict[str, list[CandidateRow]]
+    """
+    possible = plate_filter.get_possible_plates(
+        domain_id, normalized_reg_nums, time_from)
+    rows_by_reg_num = {reg_num: [] for reg_num in normalized_reg_nums}
+    if possible:
+        rows_by_reg_num.update(plate_cache.get_rows(
+            [x for x in rows_by_reg_num if x in possible],
+            domain_id, time_from, time_to, fetch=fetch_candidate_rows))
+    return rows_by_reg_num
+
+
+def fetch_active_reg_nums(domain_id, ends_after, written_since=None):
+    """
+    Fetch registration numbers having rows which end after given time.
+
+    :type domain_id: int
+    :type ends_after: datetime.datetime
+    :type written_since: int|None
+    :param written_since: Limit to the rows written by transactions
+      with this or a later transaction id (as 64-bit xid8).  Permit
+      lookup items are included also if their permit or permit series
+      was written.
+    :rtype: Iterable[str]
+    """
+    parkings = Parking.objects.ends_after(ends_after)
+    event_parkings = EventParking.objects.ends_after(ends_after)
+    lookup_items = PermitLookupItem.objects.active().filter(
+        end_time__gte=ends_after)
+    if written_since is not None:
+        parkings = parkings.filter(
+            pk__in=_get_written_since_sql(Parking, written_since))
+        event_parkings = event_parkings.filter(
+            pk__in=_get_written_since_sql(EventParking, written_since))
+        lookup_items = lookup_items.filter(
+            Q(pk__in=_get_written_since_sql(PermitLookupItem, written_since))
+            | Q(permit__in=_get_written_since_sql(Permit, written_since))
+            | Q(permit__series__in=_get_written_since_sql(
+                PermitSeries, written_since)))
+    querysets = [
+        parkings.filter(domain_id=domain_id)
+        .values_list("normalized_reg_num", flat=True),
+        event_parkings.filter(domain_id=domain_id)
+        .values_list("normalized_reg_num", flat=True),
+        lookup_items.filter(permit__domain_id=domain_id)
+        .values_list("registration_number", flat=True),
+    ]
+    return querysets[0].order_by().union(
+        *(x.order_by() for x in querysets[1:])).iterator()
+
+
+def _get_written_since_sql(model, written_since):
+    connection = connections[router.db_for_read(model)]
+    quote = connection.ops.quote_name
+    # The age of a row's xmin is compared rather than the xid itself,
+    # since xmin is a 32-bit transaction id which wraps around
+    return RawSQL(WRITTEN_SINCE_SQL.format(
+        pk=quote(model._meta.pk.column), table=quote(model._meta.db_table)),
+        [written_since])
+
+
+def make_candidates(rows):
+    """
+    Make model instances from candidate rows.
+
+    The instances have only the fetched fields loaded.  Parkings have
+    also an extra attribute ``zone_number`` for the number of their
+    payment zone.
+
+    :type rows: list[CandidateRow]
+    :rtype: Candidates
+    """
+    db = router.db_for_read(Parking)
+    parkings = []
+    event_parkings = []
+    permit_lookup_items = []
+    for row in rows:
+        if row.kind == "parking":
+            parking = _make_instance(
+                Parking, db, id=row.id, time_start=row.time_start,
+                time_end=row.time_end, zone_id=row.zone_id,
+                operator_id=row.operator_id)
+            parking.zone_number = row.zone_number
+            parkings.append(parking)
+        elif row.kind == "event_parking":
+            event_parkings.append(_make_instance(
+                EventParking, db, id=row.id, time_start=row.time_start,
+                time_end=row.time_end, event_area_id=row.event_area_id,
+                operator_id=row.operator_id))
+        else:
+            permit_lookup_items.append(_make_instance(
+                PermitLookupItem, db, id=row.item_id,
+                start_time=row.time_start, end_time=row.time_end,
+                permit_id=row.permit_id, area_id=row.area_id,
+                registration_number=row.reg_num))
+    return Candidates(parkings, event_parkings, permit_lookup_items)
+
+
+def _make_instance(model, db, **values):
+    field_names = [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname in values]
+    return model.from_db(db, field_names, [values[x] for x in field_names])
@@ -0,0 +1,296 @@
+"""
+Storing of the performed checks.
+
+Every call of the check endpoints records a ParkingCheck (or a
+PermitCheck).  By default the records are inserted right away, but if
+PARKKIHUBI_BUFFERED_CHECK_LOGGING is enabled, they are collected into an
+in-memory buffer instead and inserted in bulk by a background thread,
+when the buffer has PARKKIHUBI_CHECK_LOG_BUFFER_SIZE records or its
+oldest record is older than PARKKIHUBI_CHECK_LOG_FLUSH_INTERVAL.  The
+buffer is also flushed when the process exits.
+
+Records of a crashed process would be lost from the memory buffer.  To
+deliver them at least once, PARKKIHUBI_CHECK_LOG_SPOOL_DIR may be set to
+a local directory.  Each process then appends its buffered records also
+to its own spool file, which it keeps locked.  The spool files are
+removed after their records are inserted, and spool files which are no
+longer locked by any process are inserted by the next process starting
+to use the directory.
+"""
+import atexit
+import fcntl
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core import serializers
+from django.db import connection, models, transaction
+
+LOG = logging.getLogger(__name__)
+
+SPOOL_FILE_SUFFIX = ".ndjson"
+
+
+def save_checks(objs):
+    """
+    Save given check records, or buffer them if buffering is enabled.
+
+    :type objs: list[parkings.models.ParkingCheck|parkings.models.PermitCheck]
+    """
+    if not objs:
+        return
+    model = type(objs[0])
+    if not getattr(settings, "PARKKIHUBI_BUFFERED_CHECK_LOGGING", False):
+        model.objects.bulk_create(objs)
+        return
+    get_writer(model).add(objs)
+
+
+class BufferedWriter:
+    """
+    Buffer of model instances to insert in bulk.
+
+    :param max_size: Number of buffered instances which triggers a flush
+    :param max_age: Seconds after which a buffered instance is flushed,
+      or None to flush only on size and explicit `flush` calls
+    :param spool_dir: Directory for the spool files, or None to keep the
+      buffered instances only in memory
+    """
+
+    def __init__(self, model, max_size=100, max_age=None, spool_dir=None):
+        self.model = model
+        self.max_size = max_size
+        self.max_age = max_age
+        self.spool_dir = spool_dir
+        self._buffer = []
+        self._oldest_added_at = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spool_file = None
+        self._flushed_spool_files = []
+        self._wakeup = threading.Event()
+        self._thread = None
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+            self.replay_spool_files()
+        if max_age is not None:
+            self._thread = threading.Thread(
+                target=self._run, name="{}-writer".format(
+                    model._meta.model_name), daemon=True)
+            self._thread.start()
+
+    def add(self, objs):
+        with self._lock:
+            if self.spool_dir:
+                self._spool(objs)
+            if not self._buffer:
+                self._oldest_added_at = time.monotonic()
+            self._buffer.extend(objs)
+            is_full = len(self._buffer) >= self.max_size
+        if is_full:
+            if self._thread:
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """
+        Insert the buffered instances to the database.
+
+        If the insert fails, the instances are returned to the buffer to
+        be retried on the next flush.
+
+        :rtype: int
+        :return: Number of inserted instances
+        """
+        with self._flush_lock:
+            with self._lock:
+                (objs, self._buffer) = (self._buffer, [])
+                self._oldest_added_at = None
+                if self._spool_file:
+                    self._flushed_spool_files.append(self._spool_file)
+                    self._spool_file = None
+                spool_files = self._flushed_spool_files
+                self._flushed_spool_files = []
+            if not objs:
+                return 0
+            try:
+                count = self._write(objs)
+            except Exception:
+                LOG.exception("Writing %d %s records failed",
+                              len(objs), self.model._meta.model_name)
+                with self._lock:
+                    self._buffer[:0] = objs
+                    if self._oldest_added_at is None:
+                        self._oldest_added_at = time.monotonic()
+                    self._flushed_spool_files[:0] = spool_files
+                return 0
+            for (spool_file, path) in spool_files:
+                os.unlink(path)
+                spool_file.close()
+            return count
+
+    def _write(self, objs):
+        objs = self._nullify_missing_references(objs)
+        self.model.objects.bulk_create(objs)
+        return len(objs)
+
+    def _nullify_missing_references(self, objs):
+        """
+        Handle references to objects deleted after buffering.
+
+        Nullable foreign keys are set to null, as the database would
+        have done on delete.  Instances with a missing non-nullable
+        reference are dropped.
+        """
+        fields = [
+            field for field in self.model._meta.concrete_fields
+            if isinstance(field, models.ForeignKey)]
+        for field in fields:
+            ids = {getattr(obj, field.attname) for obj in objs} - {None}
+            if not ids:
+                continue
+            existing = set(
+                field.remote_field.model._base_manager
+                .filter(pk__in=ids).values_list("pk", flat=True))
+            if len(existing) == len(ids):
+                continue
+            kept = []
+            for obj in objs:
+                value = getattr(obj, field.attname)
+                if value is not None and value not in existing:
+                    if not field.null:
+                        LOG.warning("Dropping %s record: %s %s not found",
+                                    self.model._meta.model_name,
+                                    field.name, value)
+                        continue
+                    setattr(obj, field.attname, None)
+                kept.append(obj)
+            objs = kept
+        return objs
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.max_age)
+            self._wakeup.clear()
+            with self._lock:
+                added_at = self._oldest_added_at
+                is_full = len(self._buffer) >= self.max_size
+            is_old = (
+                added_at is not None and
+                time.monotonic() - added_at >= self.max_age)
+            if is_full or is_old:
+                try:
+                    self.flush()
+                finally:
+                    connection.close()
+
+    def _get_spool_prefix(self):
+        return "{}-".format(self.model._meta.label_lower)
+
+    def _spool(self, objs):
+        if self._spool_file is None:
+            self._spool_file = self._create_spool_file()
+        (spool_file, _path) = self._spool_file
+        for obj in objs:
+            spool_file.write(serializers.serialize("json", [obj]) + "\n")
+        spool_file.flush()
+
+    def _create_spool_file(self):
+        name = "{}{}-{}".format(
+            self._get_spool_prefix(), os.getpid(), uuid.uuid4().hex)
+        tmp_path = os.path.join(self.spool_dir, "." + name)
+        spool_file = open(tmp_path, "a", encoding="utf-8")
+        fcntl.flock(spool_file, fcntl.LOCK_EX)
+        path = os.path.join(self.spool_dir, name + SPOOL_FILE_SUFFIX)
+        os.rename(tmp_path, path)
+        return (spool_file, path)
+
+    def replay_spool_files(self):
+        """
+        Insert records of the spool files left behind by dead processes.
+
+        :rtype: int
+        :return: Number of inserted records
+        """
+        count = 0
+        prefix = self._get_spool_prefix()
+        for name in sorted(os.listdir(self.spool_dir)):
+            if name.startswith(prefix) and name.endswith(SPOOL_FILE_SUFFIX):
+                path = os.path.join(self.spool_dir, name)
+                count += self._replay_spool_file(path)
+        return count
+
+    def _replay_spool_file(self, path):
+        try:
+            spool_file = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return 0
+        with spool_file:
+            try:
+                fcntl.flock(spool_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # The owner process is alive
+            if os.fstat(spool_file.fileno()).st_nlink == 0:
+                return 0  # Already replayed by another process
+            objs = [
+                deserialized.object
+                for line in spool_file if line.strip()
+                for deserialized in serializers.deserialize("json", line)]
+            with transaction.atomic():
+                count = self._write(objs)
+            os.unlink(path)
+        LOG.info("Replayed %d %s records from %s",
+                 count, self.model._meta.model_name, path)
+        return count
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(model):
+    """
+    Get the buffered writer of given model for the current settings.
+
+    :rtype: BufferedWriter
+    """
+    config = (
+        getattr(settings, "PARKKIHUBI_CHECK_LOG_BUFFER_SIZE", 100),
+        getattr(settings, "PARKKIHUBI_CHECK_LOG_FLUSH_INTERVAL", None),
+        getattr(settings, "PARKKIHUBI_CHECK_LOG_SPOOL_DIR", None) or None,
+    )
+    key = (model, config)
+    writer = _writers.get(key)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                (max_size, interval, spool_dir) = config
+                writer = BufferedWriter(
+                    model, max_size=max_size,
+                    max_age=interval.total_seconds() if interval else None,
+                    spool_dir=spool_dir)
+                if not _writers:
+                    atexit.register(flush_all)
+                _writers[key] = writer
+    return writer
+
+
+def flush_all():
+    """
+    Flush all buffered writers of the process.
+    """
+    for writer in list(_writers.values()):
+        writer.flush()
+
+
+def reset_writers():
+    """
+    Forget the buffered writers without flushing them.
+    """
+    with _writers_lock:
+        _writers.clear()
@@ -1,5 +1,6 @@
 from django.contrib.gis.geos import MultiPolygon, Point, Polygon
 
+from ..utils.coordinates import transform_points
 from .faker import fake
 
 
@@ -26,7 +27,7 @@ def generate_polygon():
         Point(center.x + 0.040, center.y + 0.022, srid=4326),
         Point(center.x - 0.040, center.y + 0.022, srid=4326),
     ]
-    points = [p.transform(3879, clone=True) for p in wgs84_points]
+    points = transform_points(wgs84_points, 3879)
     points.append(points[0])
     return Polygon(points)
 
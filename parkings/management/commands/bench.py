@@ -0,0 +1,147 @@
+"""
+Benchmark the API endpoints with a synthetic data set.
+
+The data set is generated to a test database, which is created like
+when running the tests and destroyed afterwards (unless --keepdb is
+given), so the command can be run against any settings without
+touching the actual data.  Caches are used as configured in the
+settings, so make sure they are not shared with production.
+
+The results are printed as JSON.  If a baseline file is given, the
+results are compared against it and the command fails if any of the
+latencies or query counts got worse.
+"""
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment)
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().splitlines()[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios", nargs="*", metavar="SCENARIO",
+            help="Scenarios to run (default: all)")
+        parser.add_argument(
+            "--iterations", "-n", type=int, default=200,
+            help="Number of measured requests per scenario")
+        parser.add_argument(
+            "--warmup", type=int, default=10,
+            help="Number of unmeasured requests per scenario")
+        parser.add_argument(
+            "--parkings", type=int, default=1000,
+            help="Number of parkings in the data set")
+        parser.add_argument(
+            "--permits", type=int, default=200,
+            help="Number of permits in the data set")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Seed of the random data and requests")
+        parser.add_argument(
+            "--output", "-o", metavar="FILE",
+            help="Write the results to FILE instead of stdout")
+        parser.add_argument(
+            "--baseline", "-b", metavar="FILE",
+            help="Compare the results to the results stored in FILE")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help=(
+                "Fraction by which the latencies may exceed the baseline "
+                "(default: 0.2)"))
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Preserve the test database between runs")
+
+    def handle(self, *args, **options):
+        try:
+            from parkings import benchmarking
+        except ImportError as error:
+            raise CommandError(
+                "{}; install the test requirements".format(error))
+
+        unknown = set(options["scenarios"]) - set(benchmarking.SCENARIOS)
+        if unknown:
+            raise CommandError("Unknown scenarios: {}. Available: {}".format(
+                ", ".join(sorted(unknown)),
+                ", ".join(benchmarking.SCENARIOS)))
+        baseline = self._read_baseline(options["baseline"])
+
+        results = self._run(benchmarking, options)
+        output = {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "config": {
+                key: options[key]
+                for key in ["iterations", "warmup", "parkings", "permits",
+                            "seed"]},
+            "results": results,
+        }
+        regressions = []
+        if baseline is not None:
+            regressions = benchmarking.find_regressions(
+                results, baseline.get("results", {}), options["tolerance"])
+            output["regressions"] = [
+                {"scenario": scenario, "metric": metric,
+                 "baseline": old, "current": new}
+                for (scenario, metric, old, new) in regressions]
+
+        self._write_output(output, options["output"])
+        if regressions:
+            raise CommandError("{} regression(s) compared to {}".format(
+                len(regressions), options["baseline"]))
+
+    def _run(self, benchmarking, options):
+        verbosity = options["verbosity"]
+        keepdb = options["keepdb"]
+        setup_test_environment(debug=False)
+        old_config = setup_databases(
+            verbosity, interactive=False, keepdb=keepdb,
+            aliases={"default"})
+        try:
+            if verbosity >= 2:
+                self.stderr.write("Creating data set")
+            dataset = benchmarking.create_dataset(
+                parking_count=options["parkings"],
+                permit_count=options["permits"],
+                seed=options["seed"])
+            results = {}
+            for name in options["scenarios"] or benchmarking.SCENARIOS:
+                if verbosity >= 2:
+                    self.stderr.write("Running {}".format(name))
+                try:
+                    results.update(benchmarking.run_benchmarks(
+                        dataset, [name], iterations=options["iterations"],
+                        warmup=options["warmup"], seed=options["seed"]))
+                except benchmarking.BenchmarkError as error:
+                    raise CommandError("{}: {}".format(name, error))
+            return results
+        finally:
+            teardown_databases(old_config, verbosity, keepdb=keepdb)
+            teardown_test_environment()
+
+    def _read_baseline(self, path):
+        if not path:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError) as error:
+            raise CommandError("Cannot read baseline: {}".format(error))
+
+    def _write_output(self, output, path):
+        text = json.dumps(output, indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as fp:
+                fp.write(text + "\n")
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,106 @@
+"""
+Benchmark iterating a large parking table in batches.
+
+Parkings are generated to a test database, which is created like when
+running the tests and destroyed afterwards (unless --keepdb is given).
+Then the ended parkings are walked through with the same batching as
+archiving uses and the time of finding and reading each batch is
+measured.  The mean batch times of the first and the last tenth of the
+batches are reported as JSON, so that any growth of the batch cost
+along the run is visible.
+"""
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment)
+from django.utils import timezone
+
+from parkings.models import Parking
+from parkings.synthetic_data import SyntheticDataGenerator
+from parkings.utils.querysets import make_batches
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().splitlines()[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--parkings", type=int, default=5000000,
+            help="Number of parkings in the data set")
+        parser.add_argument(
+            "--batch-size", type=int, default=10000,
+            help="Number of parkings per batch")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Seed of the random data")
+        parser.add_argument(
+            "--output", "-o", metavar="FILE",
+            help="Write the results to FILE instead of stdout")
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Preserve the test database between runs")
+
+    def handle(self, *args, **options):
+        self.verbosity = verbosity = options["verbosity"]
+        keepdb = options["keepdb"]
+        setup_test_environment(debug=False)
+        old_config = setup_databases(
+            verbosity, interactive=False, keepdb=keepdb,
+            aliases={"default"})
+        try:
+            generator = SyntheticDataGenerator(
+                domain_prefix="BENCH", open_ended_ratio=0,
+                seed=options["seed"])
+            generator.create_reference_data()
+            generator.generate_parkings(options["parkings"])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE " + connection.ops.quote_name(
+                    Parking._meta.db_table))
+            durations = self._run(options["batch_size"])
+        finally:
+            teardown_databases(old_config, verbosity, keepdb=keepdb)
+            teardown_test_environment()
+
+        if not durations:
+            raise CommandError("No parkings to iterate")
+        tenth = max(len(durations) // 10, 1)
+        output = {
+            "config": {
+                "parkings": options["parkings"],
+                "batch_size": options["batch_size"]},
+            "results": {
+                "batches": len(durations),
+                "seconds": round(sum(durations), 3),
+                "first_tenth_mean_ms": round(
+                    statistics.mean(durations[:tenth]) * 1000, 3),
+                "last_tenth_mean_ms": round(
+                    statistics.mean(durations[-tenth:]) * 1000, 3),
+            },
+        }
+        text = json.dumps(output, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fp:
+                fp.write(text + "\n")
+        else:
+            self.stdout.write(text)
+
+    def _run(self, batch_size):
+        parkings = Parking.objects.ends_before(timezone.now())
+        batches = make_batches(parkings, batch_size, "time_end")
+        durations = []
+        while True:
+            started_at = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                break
+            list(batch.values_list("pk", flat=True))
+            durations.append(time.perf_counter() - started_at)
+            if self.verbosity >= 2:
+                self.stderr.write("Batch {}: {:.1f} ms".format(
+                    len(durations), durations[-1] * 1000))
+        return durations
@@ -0,0 +1,152 @@
+"""
+Benchmark inserts with random and time-ordered UUID primary keys.
+
+For each key kind a table with a UUID primary key is filled with the
+given number of rows with COPY in batches, like the parking tables are
+filled at high insert rates.  The insert throughput of the whole run
+and of the last tenth of it, when the index has grown large, and the
+sizes of the primary key index and the table are reported as JSON.
+
+The tables are created to a test database, which is created like when
+running the tests and destroyed afterwards (unless --keepdb is given),
+so the command can be run against any settings without touching the
+actual data.
+"""
+import io
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment)
+from django.utils import timezone
+
+from parkings.utils.uuids import uuid7
+
+KEY_GENERATORS = {
+    "uuid4": uuid.uuid4,
+    "uuid7": uuid7,
+}
+
+TABLE_SQL = """
+CREATE TABLE {table} (
+  id uuid PRIMARY KEY,
+  created_at timestamptz NOT NULL,
+  registration_number varchar(20) NOT NULL
+)
+"""
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().splitlines()[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "kinds", nargs="*", metavar="KIND",
+            help="Key kinds to benchmark: {} (default: all)".format(
+                ", ".join(KEY_GENERATORS)))
+        parser.add_argument(
+            "--rows", "-n", type=int, default=5000000,
+            help="Number of rows to insert per key kind")
+        parser.add_argument(
+            "--batch-size", type=int, default=10000,
+            help="Number of rows per COPY")
+        parser.add_argument(
+            "--output", "-o", metavar="FILE",
+            help="Write the results to FILE instead of stdout")
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Preserve the test database between runs")
+
+    def handle(self, *args, **options):
+        kinds = options["kinds"] or list(KEY_GENERATORS)
+        unknown = set(kinds) - set(KEY_GENERATORS)
+        if unknown:
+            raise CommandError("Unknown key kinds: {}".format(
+                ", ".join(sorted(unknown))))
+        self.verbosity = verbosity = options["verbosity"]
+        keepdb = options["keepdb"]
+        setup_test_environment(debug=False)
+        old_config = setup_databases(
+            verbosity, interactive=False, keepdb=keepdb,
+            aliases={"default"})
+        try:
+            results = {
+                kind: self._run(kind, options["rows"], options["batch_size"])
+                for kind in kinds}
+        finally:
+            teardown_databases(old_config, verbosity, keepdb=keepdb)
+            teardown_test_environment()
+
+        output = {
+            "config": {
+                "rows": options["rows"],
+                "batch_size": options["batch_size"]},
+            "results": results,
+        }
+        text = json.dumps(output, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fp:
+                fp.write(text + "\n")
+        else:
+            self.stdout.write(text)
+
+    def _run(self, kind, row_count, batch_size):
+        generate_key = KEY_GENERATORS[kind]
+        table_name = "bench_primary_keys_" + kind
+        table = connection.ops.quote_name(table_name)
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS " + table)
+            cursor.execute(TABLE_SQL.format(table=table))
+        try:
+            batches = []
+            written = 0
+            while written < row_count:
+                size = min(batch_size, row_count - written)
+                data = self._make_rows(generate_key, written, size)
+                batches.append((size, self._copy(table, data)))
+                written += size
+                if self.verbosity >= 2:
+                    self.stderr.write("{}: {}/{} rows".format(
+                        kind, written, row_count))
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM ANALYZE " + table)
+                cursor.execute(
+                    "SELECT pg_relation_size(%s::regclass),"
+                    " pg_relation_size(%s::regclass)",
+                    [table_name + "_pkey", table_name])
+                (index_bytes, table_bytes) = cursor.fetchone()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS " + table)
+
+        seconds = sum(duration for (_size, duration) in batches)
+        tail = batches[-max(len(batches) // 10, 1):]
+        tail_rows = sum(size for (size, _duration) in tail)
+        tail_seconds = sum(duration for (_size, duration) in tail)
+        return {
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(row_count / seconds),
+            "last_tenth_rows_per_second": round(tail_rows / tail_seconds),
+            "index_bytes": index_bytes,
+            "table_bytes": table_bytes,
+        }
+
+    def _make_rows(self, generate_key, first, count):
+        now = timezone.now().isoformat()
+        data = io.StringIO()
+        for n in range(first, first + count):
+            data.write("{}\t{}\tABC-{}\n".format(generate_key(), now, n))
+        data.seek(0)
+        return data
+
+    def _copy(self, table, data):
+        with connection.cursor() as cursor:
+            started_at = time.perf_counter()
+            cursor.copy_expert(
+                "COPY {} (id, created_at, registration_number)"
+                " FROM STDIN".format(table), data)
+        return time.perf_counter() - started_at
@@ -0,0 +1,151 @@
+"""
+Benchmark validity queries with range columns against separate columns.
+
+A synthetic data set is generated to a test database, which is created
+like when running the tests and destroyed afterwards (unless --keepdb
+is given).  Then the queries finding parkings and permit lookup items
+valid at a random time are run both with the containment condition on
+the validity range column (as used by the querysets) and with the
+comparisons of the separate start and end time columns.  Median and
+95th percentile latencies are reported as JSON.
+"""
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment)
+
+from parkings.models import Parking, PermitLookupItem
+from parkings.synthetic_data import SyntheticDataGenerator
+
+
+def get_scenarios():
+    """
+    Get the benchmarked queries.
+
+    :return:
+      Scenario names mapped to functions which get the generator data
+      and a time and return the range query and the column query
+    """
+    def parkings_of_plate(data, time):
+        parkings = Parking.objects.registration_number_like(data["plate"])
+        return (
+            parkings.valid_at(time),
+            parkings.starts_before(time).ends_after(time))
+
+    def parkings_of_domain(data, time):
+        parkings = Parking.objects.filter(domain=data["domain"])
+        return (
+            parkings.valid_at(time),
+            parkings.starts_before(time).ends_after(time))
+
+    def lookup_items_of_plate(data, time):
+        items = PermitLookupItem.objects.by_subject(data["plate"])
+        return (
+            items.by_time(time),
+            items.filter(start_time__lte=time, end_time__gte=time))
+
+    return {
+        "parkings_of_plate": parkings_of_plate,
+        "parkings_of_domain": parkings_of_domain,
+        "lookup_items_of_plate": lookup_items_of_plate,
+    }
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().splitlines()[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--parkings", type=int, default=1000000,
+            help="Number of parkings in the data set")
+        parser.add_argument(
+            "--permits", type=int, default=200000,
+            help="Number of permits in the data set")
+        parser.add_argument(
+            "--iterations", "-n", type=int, default=200,
+            help="Number of measured queries per scenario and variant")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Seed of the random data and queries")
+        parser.add_argument(
+            "--output", "-o", metavar="FILE",
+            help="Write the results to FILE instead of stdout")
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Preserve the test database between runs")
+
+    def handle(self, *args, **options):
+        verbosity = options["verbosity"]
+        keepdb = options["keepdb"]
+        setup_test_environment(debug=False)
+        old_config = setup_databases(
+            verbosity, interactive=False, keepdb=keepdb,
+            aliases={"default"})
+        try:
+            generator = self._generate_data(options)
+            results = {
+                name: self._run(
+                    scenario, generator, options["iterations"],
+                    random.Random(options["seed"]))
+                for (name, scenario) in get_scenarios().items()}
+        finally:
+            teardown_databases(old_config, verbosity, keepdb=keepdb)
+            teardown_test_environment()
+
+        output = {
+            "config": {
+                key: options[key]
+                for key in ["parkings", "permits", "iterations", "seed"]},
+            "results": results,
+        }
+        text = json.dumps(output, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fp:
+                fp.write(text + "\n")
+        else:
+            self.stdout.write(text)
+
+    def _generate_data(self, options):
+        def progress(model, done, total):
+            if options["verbosity"] >= 2:
+                self.stderr.write("{}: {}/{}".format(
+                    model._meta.verbose_name_plural, done, total))
+
+        generator = SyntheticDataGenerator(
+            domain_prefix="BENCH", seed=options["seed"], progress=progress)
+        generator.create_reference_data()
+        generator.generate_parkings(options["parkings"])
+        generator.generate_permits(options["permits"])
+        with connection.cursor() as cursor:
+            for model in [Parking, PermitLookupItem]:
+                cursor.execute("ANALYZE " + connection.ops.quote_name(
+                    model._meta.db_table))
+        return generator
+
+    def _run(self, scenario, generator, iterations, rng):
+        durations = {"range": [], "columns": []}
+        for _ in range(iterations):
+            data = {
+                "plate": rng.choice(generator.plates),
+                "domain": rng.choice(generator.domains).domain,
+            }
+            time_ = generator.now - generator.time_span * rng.random()
+            (range_query, columns_query) = scenario(data, time_)
+            for (variant, queryset) in [
+                    ("range", range_query), ("columns", columns_query)]:
+                started_at = time.perf_counter()
+                list(queryset.values_list("pk", flat=True))
+                durations[variant].append(time.perf_counter() - started_at)
+        return {
+            variant: {
+                "median_ms": round(statistics.median(values) * 1000, 3),
+                "p95_ms": round(
+                    statistics.quantiles(values, n=20)[-1] * 1000, 3),
+            }
+            for (variant, values) in durations.items()}
@@ -7,12 +7,15 @@ import datetime
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
-from ...models import Parking, Region
+from ...models import Parking
+from ...models.utils import get_regions_and_areas
 
 
 class Command(BaseCommand):
     help = __doc__.strip().splitlines()[0]
 
+    chunk_size = 1000
+
     def add_arguments(self, parser):
         parser.add_argument(
             'block_size_target', type=int, nargs='?', default=20000,
@@ -25,7 +28,6 @@ class Command(BaseCommand):
         silent = (verbosity == 0)
         show_info = (self._print_and_flush if not silent else self._null_print)
 
-        regions = Region.objects.all()
         parkings = (
             Parking.objects
             .exclude(location=None)
@@ -57,13 +59,23 @@ class Command(BaseCommand):
                     block_start, block_end), ending='')
 
             with transaction.atomic():
-                for (n, region) in enumerate(regions):
-                    if n % 10 == 0:
-                        show_info('.', ending='')
-                    in_region = block.filter(location__intersects=region.geom)
-                    in_region.update(region=region)
+                rows = list(block.values_list('pk', 'location', 'domain_id'))
+                for chunk_start in range(0, len(rows), self.chunk_size):
+                    show_info('.', ending='')
+                    self._fill_regions(
+                        rows[chunk_start:chunk_start + self.chunk_size])
                 show_info('', ending='\n')  # Print end of line
 
+    def _fill_regions(self, rows):
+        regions_and_areas = get_regions_and_areas(
+            [location for (_pk, location, _domain_id) in rows],
+            [domain_id for (_pk, _location, domain_id) in rows])
+        in_region = [
+            Parking(pk=pk, region_id=region_id)
+            for ((pk, _location, _domain_id), (region_id, _area_id))
+            in zip(rows, regions_and_areas) if region_id]
+        Parking.objects.bulk_update(in_region, ['region'])
+
     def _print_and_flush(self, *args, ending='\n'):
         self.stdout.write(*args, ending=ending)
 
@@ -0,0 +1,123 @@
+"""
+Generate a large synthetic data set for benchmarking.
+
+New enforcement domains are created with payment zones, regions and
+permit areas laid out as a grid, and they are filled with parkings,
+archived parkings and permits written with PostgreSQL COPY.  Operators
+and the permit series owner are created as needed.
+
+The generated rows bypass the model save methods and signals, so the
+reference data and registration number caches are invalidated and the
+plate filters of the generated domains rebuilt afterwards.
+"""
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from parkings import plate_cache, plate_filter, reference_data
+from parkings.api.enforcement.utils import get_grace_duration
+from parkings.check_candidates import fetch_active_reg_nums
+from parkings.synthetic_data import DEFAULT_BOUNDS, SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().splitlines()[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--parkings", type=int, default=100000,
+            help="Number of parkings to generate")
+        parser.add_argument(
+            "--archived-parkings", type=int, default=0,
+            help="Number of archived parkings to generate")
+        parser.add_argument(
+            "--permits", type=int, default=0,
+            help="Number of permits to generate")
+        parser.add_argument(
+            "--domains", type=int, default=1,
+            help="Number of enforcement domains to create")
+        parser.add_argument(
+            "--domain-prefix", default="SYN",
+            help="Prefix of the codes of the created domains")
+        parser.add_argument(
+            "--zones", type=int, default=3,
+            help="Number of payment zones per domain")
+        parser.add_argument(
+            "--region-grid", type=int, default=4, metavar="N",
+            help="Create N x N regions per domain")
+        parser.add_argument(
+            "--permit-areas", type=int, default=5,
+            help="Number of permit areas per domain")
+        parser.add_argument(
+            "--operators", type=int, default=5,
+            help="Number of operators")
+        parser.add_argument(
+            "--plates", type=int, default=100000,
+            help="Number of distinct registration numbers")
+        parser.add_argument(
+            "--days", type=float, default=30,
+            help="Time span in days to the past to generate data for")
+        parser.add_argument(
+            "--open-ended-ratio", type=float, default=0.05,
+            help="Share of the parkings without end time")
+        parser.add_argument(
+            "--bounds", type=float, nargs=4, default=DEFAULT_BOUNDS,
+            metavar=("LON_MIN", "LAT_MIN", "LON_MAX", "LAT_MAX"),
+            help="Bounding box of the locations in WGS84")
+        parser.add_argument(
+            "--batch-size", type=int, default=100000,
+            help="Number of rows to write per COPY")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Seed of the random data")
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        generator = SyntheticDataGenerator(
+            domain_count=options["domains"],
+            domain_prefix=options["domain_prefix"],
+            zone_count=options["zones"],
+            region_grid_size=options["region_grid"],
+            permit_area_count=options["permit_areas"],
+            operator_count=options["operators"],
+            plate_count=options["plates"],
+            time_span=timedelta(days=options["days"]),
+            open_ended_ratio=options["open_ended_ratio"],
+            bounds=tuple(options["bounds"]),
+            batch_size=options["batch_size"],
+            seed=options["seed"],
+            progress=self._show_progress)
+        try:
+            generator.create_reference_data()
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        started_at = time.monotonic()
+        for (generate, count) in [
+                (generator.generate_parkings, options["parkings"]),
+                (partial(generator.generate_parkings, archived=True),
+                 options["archived_parkings"]),
+                (generator.generate_permits, options["permits"])]:
+            self._step_started_at = time.monotonic()
+            generate(count)
+
+        reference_data.invalidate_reference_data()
+        plate_cache.invalidate_all_plates()
+        if plate_filter.is_enabled():
+            for data in generator.domains:
+                plate_filter.rebuild(
+                    data.domain.pk, fetch_active_reg_nums,
+                    get_grace_duration())
+        if self.verbosity >= 1:
+            self.stdout.write("Generated domains {} in {:.1f} s".format(
+                ", ".join(x.domain.code for x in generator.domains),
+                time.monotonic() - started_at))
+
+    def _show_progress(self, model, done, total):
+        if self.verbosity >= 1:
+            elapsed = time.monotonic() - self._step_started_at
+            self.stdout.write("{}: {}/{} rows ({:.0f} rows/s)".format(
+                model._meta.verbose_name_plural, done, total,
+                done / elapsed if elapsed else 0))
@@ -0,0 +1,74 @@
+"""
+Maintain the monthly partitions of archived parkings and parking checks.
+
+Creates the partitions for the coming months and, when requested,
+detaches the partitions older than the retention period.  The detached
+partitions are left as separate tables, unless --drop is given, in
+which case their data is deleted permanently.
+
+Tables which are not partitioned yet are skipped, unless --convert is
+given.  The conversion rewrites the whole table, so it should be done
+in a maintenance break.  Run this command at least monthly, e.g. from
+cron, to keep the partitions of the coming months in place.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from parkings import partitioning
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().splitlines()[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "tables", nargs="*", metavar="TABLE",
+            help="Tables to maintain: {} (default: all)".format(
+                ", ".join(partitioning.PARTITIONED_TABLES)))
+        parser.add_argument(
+            "--convert", action="store_true",
+            help="Convert the tables which are not partitioned yet")
+        parser.add_argument(
+            "--months-ahead", type=int, default=3,
+            help="Number of months to create partitions ahead")
+        parser.add_argument(
+            "--keep-months", type=int, default=None,
+            help="Detach the partitions of months older than this")
+        parser.add_argument(
+            "--drop", action="store_true",
+            help="Drop the detached partitions, deleting their data")
+
+    def handle(self, *args, **options):
+        tables = options["tables"] or list(partitioning.PARTITIONED_TABLES)
+        unknown = set(tables) - set(partitioning.PARTITIONED_TABLES)
+        if unknown:
+            raise CommandError("Unknown tables: {}".format(
+                ", ".join(sorted(unknown))))
+        if options["drop"] and options["keep_months"] is None:
+            raise CommandError("--drop requires --keep-months")
+
+        now = timezone.now()
+        for name in tables:
+            if not partitioning.is_partitioned(name):
+                if not options["convert"]:
+                    self.stderr.write(
+                        "Skipping {}: not partitioned".format(name))
+                    continue
+                created = partitioning.convert_to_partitioned(
+                    name, options["months_ahead"], now=now)
+                self.stdout.write("Converted {}".format(name))
+            else:
+                created = partitioning.create_partitions(
+                    name, options["months_ahead"], now=now)
+            for partition in created:
+                self.stdout.write("Created {}".format(partition))
+
+            if options["keep_months"] is not None:
+                before = partitioning.get_month_start(
+                    now, -options["keep_months"])
+                removed = partitioning.remove_partitions(
+                    name, before, drop=options["drop"])
+                for partition in removed:
+                    self.stdout.write("{} {}".format(
+                        "Dropped" if options["drop"] else "Detached",
+                        partition))
@@ -0,0 +1,28 @@
+"""
+Rebuild the registration number filters of the enforcement domains.
+
+The filters are used only if PARKKIHUBI_PLATE_FILTER_ENABLED is set.
+Since registration numbers can only be added to a filter, this should
+be run periodically to drop the ones whose parkings or permits have
+ended.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from parkings import plate_filter
+from parkings.api.enforcement.utils import get_grace_duration
+from parkings.check_candidates import fetch_active_reg_nums
+from parkings.models import EnforcementDomain
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().splitlines()[0]
+
+    def handle(self, *args, **options):
+        if not plate_filter.is_enabled():
+            raise CommandError("PARKKIHUBI_PLATE_FILTER_ENABLED is not set")
+        for domain in EnforcementDomain.objects.order_by("id"):
+            count = plate_filter.rebuild(
+                domain.pk, fetch_active_reg_nums, get_grace_duration())
+            if options["verbosity"] >= 1:
+                self.stdout.write("{}: {} registration numbers".format(
+                    domain.code, count))
@@ -0,0 +1,32 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Set created_at of the checks when the record is made.
+
+    The records may be inserted later in bulk, so the auto_now_add value
+    would be the time of the insert instead of the time of the check.
+    """
+
+    dependencies = [
+        ("parkings", "0071_archivedparking_time_start_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="parkingcheck",
+            name="created_at",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now,
+                editable=False, verbose_name="time created"),
+        ),
+        migrations.AlterField(
+            model_name="permitcheck",
+            name="created_at",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now,
+                editable=False, verbose_name="time created"),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("parkings", "0072_check_created_at_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parking",
+            name="external_id",
+            field=models.CharField(
+                blank=True, help_text="Identifier given by the operator",
+                max_length=50, null=True, verbose_name="external id"),
+        ),
+        migrations.AddField(
+            model_name="archivedparking",
+            name="external_id",
+            field=models.CharField(
+                blank=True, help_text="Identifier given by the operator",
+                max_length=50, null=True, verbose_name="external id"),
+        ),
+        migrations.AddField(
+            model_name="eventparking",
+            name="external_id",
+            field=models.CharField(
+                blank=True, help_text="Identifier given by the operator",
+                max_length=50, null=True, verbose_name="external id"),
+        ),
+        migrations.AddConstraint(
+            model_name="parking",
+            constraint=models.UniqueConstraint(
+                fields=("operator", "external_id"),
+                name="unique_parking_operator_external_id"),
+        ),
+        migrations.AddConstraint(
+            model_name="eventparking",
+            constraint=models.UniqueConstraint(
+                fields=("operator", "external_id"),
+                name="unique_eventparking_operator_external_id"),
+        ),
+    ]
@@ -0,0 +1,102 @@
+from django.db import migrations, models
+
+import parkings.utils.uuids
+
+
+class Migration(migrations.Migration):
+    """
+    Generate the primary keys with the configurable UUID generator.
+
+    Only the Python side default of the id fields changes.
+    """
+
+    dependencies = [
+        ("parkings", "0073_parking_external_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="archivedparking",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="datauser",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="enforcer",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="eventarea",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="eventareastatistics",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="eventparking",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="monitor",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="operator",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="parking",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="parkingarea",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="parkingterminal",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="region",
+            name="id",
+            field=models.UUIDField(
+                default=parkings.utils.uuids.generate_uuid, editable=False,
+                primary_key=True, serialize=False),
+        ),
+    ]
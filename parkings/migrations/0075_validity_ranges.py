@@ -0,0 +1,61 @@
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+ADD_VALIDITY_SQL = """
+ALTER TABLE {table} ADD COLUMN validity tstzrange
+GENERATED ALWAYS AS (
+  CASE WHEN {end} < {start} THEN 'empty'::tstzrange
+  ELSE tstzrange({start}, {end}, '[]') END
+) STORED
+"""
+
+DROP_VALIDITY_SQL = "ALTER TABLE {table} DROP COLUMN validity"
+
+CREATE_INDEX_SQL = (
+    "CREATE INDEX {name} ON {table} USING gist ({columns}, validity)")
+
+DROP_INDEX_SQL = "DROP INDEX {name}"
+
+
+def add_validity(table, start, end, indexes):
+    """
+    Get operations adding a validity range column with GiST indexes.
+
+    :param indexes: Index names mapped to the columns to index with the
+      validity range
+    """
+    return [
+        migrations.RunSQL(
+            ADD_VALIDITY_SQL.format(table=table, start=start, end=end),
+            DROP_VALIDITY_SQL.format(table=table)),
+    ] + [
+        migrations.RunSQL(
+            CREATE_INDEX_SQL.format(name=name, table=table, columns=columns),
+            DROP_INDEX_SQL.format(name=name))
+        for (name, columns) in indexes.items()
+    ]
+
+
+class Migration(migrations.Migration):
+    """
+    Add generated validity range columns with GiST indexes.
+
+    The ranges are inclusive and open-ended when there is no end time.
+    Adding the columns rewrites the tables.
+    """
+
+    dependencies = [
+        ("parkings", "0074_time_ordered_uuids"),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+    ] + add_validity("parkings_parking", "time_start", "time_end", {
+        "parkings_parking_reg_num_validity": "normalized_reg_num",
+        "parkings_parking_domain_validity": "domain_id",
+    }) + add_validity("parkings_eventparking", "time_start", "time_end", {
+        "parkings_eventparking_reg_num_validity": "normalized_reg_num",
+        "parkings_eventparking_domain_validity": "domain_id",
+    }) + add_validity("parkings_permitlookupitem", "start_time", "end_time", {
+        "parkings_permitlookupitem_reg_num_validity": "registration_number",
+    })
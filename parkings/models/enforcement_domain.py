@@ -3,6 +3,7 @@ from django.contrib.gis.db import models as gis_models
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from .. import reference_data
 from .constants import GK25FIN_SRID
 from .mixins import TimestampedModelMixin, UUIDPrimaryKeyMixin
 
@@ -23,9 +24,7 @@ class EnforcementDomain(TimestampedModelMixin):
 
     @classmethod
     def get_default_domain(cls):
-        (name, code) = settings.DEFAULT_ENFORCEMENT_DOMAIN
-        return cls.objects.get_or_create(
-            code=code, defaults={"name": name})[0]
+        return reference_data.get_default_domain()
 
     @classmethod
     def get_default_domain_code(cls):
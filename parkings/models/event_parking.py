@@ -5,7 +5,7 @@ from parkings.models.event_area import EventArea
 from parkings.models.parking import (
     AbstractParking, EnforcementDomain, ParkingQuerySet)
 
-from .utils import get_closest_area
+from .utils import get_region_and_area, get_regions_and_areas
 
 
 class EventParkingQuerySet(ParkingQuerySet):
@@ -13,11 +13,17 @@ class EventParkingQuerySet(ParkingQuerySet):
 
 
 class EventParking(AbstractParking):
+    validity_column = "validity"
 
     class Meta:
         verbose_name = _("event parking")
         verbose_name_plural = _("event parkings")
         default_related_name = "event_parkings"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["operator", "external_id"],
+                name="unique_eventparking_operator_external_id"),
+        ]
 
     objects = EventParkingQuerySet.as_manager()
     event_area = models.ForeignKey(
@@ -30,6 +36,23 @@ class EventParking(AbstractParking):
             self.domain = EnforcementDomain.get_default_domain()
 
         if (update_fields is None or 'event_area' in update_fields) and not getattr(self, 'event_area', None):
-            self.event_area = get_closest_area(self.location, self.domain, area_model=EventArea)
+            (_region_id, self.event_area_id) = get_region_and_area(
+                self.location, self.domain_id, area_model=EventArea, region_model=None)
 
         super().save(update_fields=update_fields, *args, **kwargs)
+
+    @classmethod
+    def _prepare_for_insert(cls, parkings):
+        for parking in parkings:
+            if not parking.domain_id:
+                parking.domain = EnforcementDomain.get_default_domain()
+
+        super()._prepare_for_insert(parkings)
+
+        without_area = [x for x in parkings if not x.event_area_id]
+        regions_and_areas = get_regions_and_areas(
+            [x.location_gk25fin for x in without_area],
+            [x.domain_id for x in without_area],
+            area_model=EventArea, region_model=None)
+        for (parking, (_region_id, area_id)) in zip(without_area, regions_and_areas):
+            parking.event_area_id = area_id
@@ -1,8 +1,8 @@
-import uuid
-
 from django.contrib.gis.db import models
 from django.utils.translation import gettext_lazy as _
 
+from ..utils.uuids import generate_uuid
+
 
 class AnonymizableRegNumQuerySet(models.QuerySet):
     def anonymize(self):
@@ -21,7 +21,7 @@ class TimestampedModelMixin(models.Model):
 
 
 class UUIDPrimaryKeyMixin(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=generate_uuid, editable=False)
 
     class Meta:
         abstract = True
@@ -1,4 +1,7 @@
+from functools import partial
+
 from django.contrib.gis.db import models
+from django.core.exceptions import ImproperlyConfigured
 from django.db import connections, router, transaction
 from django.utils import timezone
 from django.utils.timezone import localtime, now
@@ -11,25 +14,91 @@ from parkings.models.parking_area import ParkingArea
 from parkings.models.zone import PaymentZone
 from parkings.utils.sanitizing import sanitize_registration_number
 
+from .. import plate_cache, plate_filter, reference_data
+from ..utils.coordinates import transform_point, transform_points
 from ..utils.model_fields import with_model_field_modifications
 from ..utils.querysets import make_batches
 from .enforcement_domain import EnforcementDomain
 from .mixins import AnonymizableRegNumQuerySet
 from .parking_terminal import ParkingTerminal
 from .region import Region
-from .utils import get_closest_area, normalize_reg_num
+from .utils import (
+    RangeContains, get_region_and_area, get_regions_and_areas,
+    normalize_reg_num)
 
 Q = models.Q
 
+SET_END_TIMES_SQL = """
+UPDATE {table} AS p
+SET time_end = v.time_end, modified_at = %s
+FROM unnest(%s::uuid[], %s::timestamptz[]) AS v(id, time_end)
+WHERE p.id = v.id
+  AND (v.time_end IS NULL OR p.time_start <= v.time_end)
+  AND p.id IN ({subquery})
+RETURNING p.id, p.domain_id, p.normalized_reg_num
+"""
+
+UPSERT_SQL = """
+WITH old AS (
+  SELECT domain_id, normalized_reg_num FROM {table}
+  WHERE operator_id = %s AND external_id = %s
+)
+INSERT INTO {table} AS p ({columns})
+VALUES ({values})
+ON CONFLICT (operator_id, external_id) DO UPDATE
+SET {updates}
+{where}
+RETURNING p.id, p.created_at, p.xmax = 0,
+  (SELECT domain_id FROM old), (SELECT normalized_reg_num FROM old)
+"""
+
+ARCHIVE_SQL = """
+WITH moved AS (
+  DELETE FROM {src_table} WHERE {pk_column} IN ({subquery})
+  RETURNING *
+){set_null_ctes},
+archived AS (
+  INSERT INTO {dest_table} ({dest_columns})
+  SELECT {src_columns} FROM moved
+)
+SELECT {pk_column}, domain_id, normalized_reg_num FROM moved
+"""
+
+SET_NULL_CTE_SQL = """,
+set_null_{n} AS (
+  UPDATE {table} SET {column} = NULL
+  WHERE {column} IN (SELECT {pk_column} FROM moved)
+)"""
+
+# Fields which are emptied when parkings are archived
+ARCHIVE_ANONYMIZED_FIELDS = {"registration_number", "normalized_reg_num"}
+
+
+def _get_set_null_cte_sql(n, relation, quote):
+    if relation.on_delete is not models.SET_NULL:
+        raise ImproperlyConfigured(
+            "Cannot archive parkings referred by {} with on_delete={}, "
+            "only SET_NULL is supported".format(
+                relation.field, relation.on_delete.__name__))
+    return SET_NULL_CTE_SQL.format(
+        n=n,
+        table=quote(relation.related_model._meta.db_table),
+        column=quote(relation.field.column),
+        pk_column=quote(relation.field.target_field.column))
+
 
 class ParkingQuerySet(AnonymizableRegNumQuerySet, models.QuerySet):
     def valid_at(self, time):
         """
         Filter to parkings which are valid at given time.
 
+        Uses the validity range column of the model, if it has one.
+
         :type time: datetime.datetime
         :rtype: ParkingQuerySet
         """
+        if self.model.validity_column:
+            return self.filter(RangeContains(self.model.validity_column, time))
         return self.starts_before(time).ends_after(time)
 
     def starts_before(self, time):
@@ -72,6 +141,54 @@ class ParkingQuerySet(AnonymizableRegNumQuerySet, models.QuerySet):
                 break
         return total_archived
 
+    def set_end_times(self, end_times):
+        """
+        Set end times of parkings with a single narrow update.
+
+        Only the end time and modification time columns are updated, so
+        none of the work of the save method is redone and no signals are
+        sent.  Instead the registration numbers of the updated parkings
+        are added to the plate filter and invalidated from the plate
+        cache on commit.
+
+        Parkings which are not in this queryset or which would end
+        before they start are left untouched.  An end time of None
+        makes the parking open-ended.
+
+        :type end_times: dict[uuid.UUID, datetime.datetime]
+        :rtype: dict[uuid.UUID, datetime.datetime]
+        :return: New modification times of the updated parkings by id
+        """
+        if not end_times:
+            return {}
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        (subquery, subquery_params) = (
+            self.order_by().values('pk').query.sql_with_params())
+        sql = SET_END_TIMES_SQL.format(
+            table=quote(self.model._meta.db_table), subquery=subquery)
+        modified_at = timezone.now()
+        params = [
+            modified_at,
+            [str(x) for x in end_times.keys()],
+            list(end_times.values()),
+        ] + list(subquery_params)
+        reg_nums_by_domain = {}
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                updated = cursor.fetchall()
+            for (_id, domain_id, reg_num) in updated:
+                reg_nums_by_domain.setdefault(domain_id, set()).add(reg_num)
+            for (domain_id, reg_nums) in reg_nums_by_domain.items():
+                # Add before the commit, since an extended parking may
+                # have dropped out of the filter already
+                plate_filter.add_plates(domain_id, reg_nums)
+                transaction.on_commit(partial(
+                    plate_cache.invalidate_plates, domain_id, reg_nums),
+                    using=connection.alias)
+        return {parking_id: modified_at for (parking_id, _, _) in updated}
+
     def registration_number_like(self, registration_number):
         """
         Filter to parkings having registration number like the given value.
@@ -88,6 +205,10 @@ class AbstractParking(TimestampedModelMixin, UUIDPrimaryKeyMixin):
     VALID = 'valid'
     NOT_VALID = 'not_valid'
 
+    # Name of the database generated tstzrange column of the validity
+    # period, which is open-ended when there is no end time
+    validity_column = None
+
     location = models.PointField(verbose_name=_("location"), null=True, blank=True)
     # Store location also in GK25, as area geometries are in GK25. This avoids performance intensive
     # SRS transformations when calculating area statistics.
@@ -110,6 +231,11 @@ class AbstractParking(TimestampedModelMixin, UUIDPrimaryKeyMixin):
     domain = models.ForeignKey(
         EnforcementDomain, on_delete=models.PROTECT,
         null=True,)
+    external_id = models.CharField(
+        max_length=50, null=True, blank=True,
+        verbose_name=_("external id"),
+        help_text=_("Identifier given by the operator"),
+    )
 
     class Meta:
         abstract = True
@@ -142,10 +268,26 @@ class AbstractParking(TimestampedModelMixin, UUIDPrimaryKeyMixin):
         if update_fields is None or 'normalized_reg_num' in update_fields:
             self.normalized_reg_num = normalize_reg_num(self.registration_number)
         if (update_fields is None or 'location' in update_fields) and self.location:
-            self.location_gk25fin = self.location.transform(GK25FIN_SRID, clone=True)
+            self.location_gk25fin = transform_point(self.location, GK25FIN_SRID)
 
         super().save(update_fields=update_fields, *args, **kwargs)
 
+    @classmethod
+    def _prepare_for_insert(cls, parkings):
+        """
+        Fill the fields which the save method would fill.
+        """
+        with_location = []
+        for parking in parkings:
+            parking.normalized_reg_num = normalize_reg_num(
+                parking.registration_number)
+            if parking.location:
+                with_location.append(parking)
+        gk25_locations = transform_points(
+            [x.location for x in with_location], GK25FIN_SRID)
+        for (parking, gk25_location) in zip(with_location, gk25_locations):
+            parking.location_gk25fin = gk25_location
+
 
 class AbstractArchivedParking(AbstractParking):
 
@@ -177,11 +319,17 @@ class AbstractArchivedParking(AbstractParking):
 
 
 class Parking(AbstractArchivedParking):
+    validity_column = "validity"
 
     class Meta:
         verbose_name = _("parking")
         verbose_name_plural = _("parkings")
         default_related_name = "parkings"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["operator", "external_id"],
+                name="unique_parking_operator_external_id"),
+        ]
 
     def archive(self):
         archived_parking = self.make_archived_parking()
@@ -195,34 +343,160 @@ class Parking(AbstractArchivedParking):
         values = {field: getattr(self, field) for field in fields}
         return ArchivedParking(**values)
 
-    def get_region(self):
-        if not self.location:
-            return None
-        region_srid = Region._meta.get_field('geom').srid
-        location = self.location.transform(region_srid, clone=True)
-        regions = Region.objects.filter(domain=self.domain)
-        intersecting = regions.filter(geom__intersects=location)
-        return intersecting.first()
-
     def save(self, update_fields=None, *args, **kwargs):
         if not self.domain_id:
             self.domain = EnforcementDomain.get_default_domain()
 
-        if not self.terminal and self.terminal_number:
-            self.terminal = ParkingTerminal.objects.filter(
-                domain=self.domain,
-                number=self.terminal_number).first()
+        if not self.terminal_id and self.terminal_number:
+            self.terminal = reference_data.get_terminal(
+                self.domain_id, self.terminal_number)
 
         if self.terminal and not self.location:
             self.location = self.terminal.location
 
-        if update_fields is None or 'region' in update_fields:
-            self.region = self.get_region()
-        if update_fields is None or 'parking_area' in update_fields:
-            self.parking_area = get_closest_area(self.location, self.domain)
+        update_region = (update_fields is None or 'region' in update_fields)
+        update_area = (update_fields is None or 'parking_area' in update_fields)
+        if update_region or update_area:
+            (region_id, area_id) = get_region_and_area(
+                self.location, self.domain_id)
+            if update_region:
+                self.region_id = region_id
+            if update_area:
+                self.parking_area_id = area_id
 
         super().save(update_fields=update_fields, *args, **kwargs)
 
+    def upsert(self, frozen_since=None, frozen_fields=()):
+        """
+        Insert the parking or update the operator's existing parking
+        with the same external id.
+
+        The insert or update is done with a single INSERT ... ON
+        CONFLICT DO UPDATE statement, so a retried request can never
+        create a duplicate and no row has to be read or locked before
+        the write.  No model signals are sent, but the plate filter and
+        cache are kept up to date like the signals would do.  Hence this
+        is only for parkings: event parkings need their signals to keep
+        the event area statistics up to date.
+
+        :type frozen_since: datetime.datetime|None
+        :param frozen_since:
+          Existing parking created before this time is updated only if
+          none of the `frozen_fields` would change
+        :type frozen_fields: Iterable[str]
+        :rtype: bool|None
+        :return:
+          True if the parking was inserted, False if an existing parking
+          was updated, or None if the existing parking was frozen
+        """
+        assert self.operator_id and self.external_id
+        model = type(self)
+        model._prepare_for_insert([self])
+        connection = connections[router.db_for_write(model)]
+        quote = connection.ops.quote_name
+        fields = model._meta.concrete_fields
+        values = [
+            field.get_db_prep_save(field.pre_save(self, True), connection)
+            for field in fields]
+        placeholders = [
+            field.get_placeholder(value, None, connection)
+            if hasattr(field, 'get_placeholder') else '%s'
+            for (field, value) in zip(fields, values)]
+        unchangeable = {'id', 'created_at', 'operator', 'external_id'}
+        updates = [
+            '{column} = EXCLUDED.{column}'.format(column=quote(field.column))
+            for field in fields if field.name not in unchangeable]
+        (where, where_params) = ('', [])
+        if frozen_since:
+            frozen_columns = [
+                quote(model._meta.get_field(name).column)
+                for name in frozen_fields]
+            where = 'WHERE p.created_at >= %s'
+            where_params = [frozen_since]
+            if frozen_columns:
+                where += (
+                    ' OR ROW({old}) IS NOT DISTINCT FROM ROW({new})'.format(
+                        old=', '.join('p.' + x for x in frozen_columns),
+                        new=', '.join('EXCLUDED.' + x for x in frozen_columns)))
+        sql = UPSERT_SQL.format(
+            table=quote(model._meta.db_table),
+            columns=', '.join(quote(field.column) for field in fields),
+            values=', '.join(placeholders),
+            updates=', '.join(updates),
+            where=where)
+        params = [self.operator_id, self.external_id] + values + where_params
+
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            (self.pk, self.created_at, created, old_domain_id, old_reg_num) = row
+            self._state.adding = False
+            self._state.db = connection.alias
+            # Add before the commit like the post_save signal does
+            plate_filter.add_plates(self.domain_id, [self.normalized_reg_num])
+            changed_plates = {(self.domain_id, self.normalized_reg_num)}
+            if not created:
+                changed_plates.add((old_domain_id, old_reg_num))
+            for (domain_id, reg_num) in changed_plates:
+                transaction.on_commit(partial(
+                    plate_cache.invalidate_plates, domain_id, [reg_num]),
+                    using=connection.alias)
+        return created
+
+    @classmethod
+    def create_in_bulk(cls, parkings):
+        """
+        Create many new parkings at once.
+
+        Does the same as saving each of the parkings, but resolves the
+        regions and parking areas set-wise and inserts the parkings with
+        a single bulk insert.
+
+        :type parkings: list[Parking]
+        :rtype: list[Parking]
+        """
+        if not parkings:
+            return []
+        cls._prepare_for_insert(parkings)
+
+        with transaction.atomic():
+            created = cls.objects.bulk_create(parkings)
+            reg_nums_by_domain = {}
+            for parking in created:
+                reg_nums_by_domain.setdefault(parking.domain_id, set()).add(
+                    parking.normalized_reg_num)
+            for (domain_id, reg_nums) in reg_nums_by_domain.items():
+                # Add before the commit like the post_save signal does
+                plate_filter.add_plates(domain_id, reg_nums)
+                transaction.on_commit(partial(
+                    plate_cache.invalidate_plates, domain_id, reg_nums))
+        return created
+
+    @classmethod
+    def _prepare_for_insert(cls, parkings):
+        default_domain = None
+        for parking in parkings:
+            if not parking.domain_id:
+                default_domain = (
+                    default_domain or EnforcementDomain.get_default_domain())
+                parking.domain = default_domain
+            if not parking.terminal_id and parking.terminal_number:
+                parking.terminal = reference_data.get_terminal(
+                    parking.domain_id, parking.terminal_number)
+            if parking.terminal and not parking.location:
+                parking.location = parking.terminal.location
+
+        super()._prepare_for_insert(parkings)
+
+        regions_and_areas = get_regions_and_areas(
+            [x.location_gk25fin for x in parkings],
+            [x.domain_id for x in parkings])
+        for (parking, (region_id, area_id)) in zip(parkings, regions_and_areas):
+            (parking.region_id, parking.parking_area_id) = (region_id, area_id)
+
 
 @with_model_field_modifications(
     created_at={"auto_now_add": False},
@@ -261,8 +535,9 @@ class ArchivedParking(AbstractArchivedParking):
         """
         Archive given parkings in bulk.
 
-        The data from the parkings will be moved to the ArchivedParking
-        table with the archived_at value filled with a fresh timestamp.
+        The parkings are moved to the ArchivedParking table with their
+        registration numbers anonymized and the archived_at value filled
+        with a fresh timestamp.
 
         :param parkings: QuerySet of Parking objects to archive.
         :returns: A tuple (qs, n) where qs is the queryset of the
@@ -272,29 +547,44 @@ class ArchivedParking(AbstractArchivedParking):
         if issubclass(parkings.model, cls):
             return 0  # Nothing to do, since already archived
         with transaction.atomic():
-            archive_copies = cls._create_copies_to_archive(parkings)
-            archive_copies.anonymize()
-            to_delete = parkings.filter(pk__in=archive_copies)
-            (deleted_count, _counts_by_type) = to_delete.delete()
-        return (archive_copies, deleted_count)
+            moved = cls._move_to_archive(parkings)
+            reg_nums_by_domain = {}
+            for (_id, domain_id, reg_num) in moved:
+                reg_nums_by_domain.setdefault(domain_id, set()).add(reg_num)
+            for (domain_id, reg_nums) in reg_nums_by_domain.items():
+                transaction.on_commit(partial(
+                    plate_cache.invalidate_plates, domain_id, reg_nums))
+        archived = cls.objects.filter(pk__in=[x[0] for x in moved])
+        return (archived, len(moved))
 
     @classmethod
-    def _create_copies_to_archive(cls, parkings):
+    def _move_to_archive(cls, parkings):
         """
-        Create copies of objects in current queryset to the archive table.
+        Move parkings to the archive table with a single statement.
 
         Generates and executes a SQL query of the form
 
-            INSERT INTO <archive_table> ... SELECT ... FROM <table> ...
+            WITH moved AS (DELETE FROM <table> ... RETURNING *)
+            INSERT INTO <archive_table> ... SELECT ... FROM moved
 
-        for copying data to the archive table from the current table.
+        which deletes the parkings and inserts their anonymized copies
+        to the archive table.  The references to the parkings from other
+        tables are cleared in the same statement, like deleting them
+        with the ORM would do.
 
         Effectively this is doing the same as the following Python code,
         but without pulling the data from the DBMS to Python side:
 
             archived_parkings = [x.make_archived_parking() for x in parkings]
-            created = cls.objects.bulk_create(archived_parkings)
-            return cls.objects.filter(pk__in=[x.pk for x in created])
+            for archived_parking in archived_parkings:
+                archived_parking.registration_number = ""
+                archived_parking.normalized_reg_num = ""
+            cls.objects.bulk_create(archived_parkings)
+            parkings.delete()
+
+        :rtype: list[(uuid.UUID, int, str)]
+        :return: Id, domain id and normalized registration number of
+                 each of the moved parkings
         """
         db = router.db_for_write(cls)
         connection = connections[db]
@@ -302,26 +592,27 @@ class ArchivedParking(AbstractArchivedParking):
         pk_field = parkings.model._meta.pk
         ids_queryset = parkings.values(pk_field.name)
         (ids_sql, ids_params) = ids_queryset.query.sql_with_params()
-        common_columns = [quote(x.column) for x in parkings.model._meta.fields]
-        dest_columns = common_columns + [quote("archived_at")]
-        src_columns = common_columns + ["%s"]
-        copy_values_with_insert_select_sql = (
-            "INSERT INTO {dest_table} ({dest_columns})"
-            " SELECT {src_columns} FROM {src_table}"
-            " WHERE {pk_column} IN ({subquery})"
-        ).format(
-            dest_table=quote(cls._meta.db_table),
-            dest_columns=",".join(dest_columns),
-            src_columns=",".join(src_columns),
+        fields = parkings.model._meta.fields
+        dest_columns = [quote(x.column) for x in fields] + [quote("archived_at")]
+        src_columns = [
+            ("''" if x.name in ARCHIVE_ANONYMIZED_FIELDS else quote(x.column))
+            for x in fields] + ["%s"]
+        sql = ARCHIVE_SQL.format(
             src_table=quote(parkings.model._meta.db_table),
             pk_column=quote(pk_field.column),
             subquery=ids_sql,
+            set_null_ctes="".join(
+                _get_set_null_cte_sql(n, relation, quote)
+                for (n, relation) in enumerate(
+                    parkings.model._meta.related_objects)),
+            dest_table=quote(cls._meta.db_table),
+            dest_columns=",".join(dest_columns),
+            src_columns=",".join(src_columns),
         )
-        archived_at = timezone.now()
-        params = (archived_at,) + ids_params
+        params = ids_params + (timezone.now(),)
         with connection.cursor() as cursor:
-            cursor.execute(copy_values_with_insert_select_sql, params)
-        return cls.objects.filter(archived_at=archived_at)
+            cursor.execute(sql, params)
+            return cursor.fetchall()
 
     def sanitize(self):
         self.registration_number = sanitize_registration_number(self.registration_number)
@@ -1,21 +1,28 @@
+from collections import defaultdict
 from datetime import datetime
+from functools import partial
+from itertools import chain
 
 from django.conf import settings
 from django.contrib.gis.db import models as gis_models
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import connections, models, router, transaction
+from django.db import (
+    DEFAULT_DB_ALIAS, connections, models, router, transaction)
 from django.db.models import JSONField
 from django.db.models.expressions import RawSQL
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext_lazy as _
 
+from .. import plate_cache, plate_filter, reference_data
 from ..fields import CleaningJsonField
 from ..validators import (
     DictListValidator, NullableTextField, TextField, TimestampField)
 from .constants import GK25FIN_SRID, PERMIT_TYPES
 from .enforcement_domain import EnforcementDomain
 from .mixins import AnonymizableRegNumQuerySet, TimestampedModelMixin
-from .utils import normalize_reg_num
+from .utils import RangeContains, normalize_reg_num
 
 
 class PermitAreaQuerySet(models.QuerySet):
@@ -48,11 +55,93 @@ class PermitArea(TimestampedModelMixin):
         return '{}/{}: {}'.format(self.domain.code, self.identifier, self.name)
 
     @classmethod
-    def get_identifier_map(cls, domain, using="default"):
+    def get_identifier_map(cls, domain, using="default", identifiers=()):
+        if using == DEFAULT_DB_ALIAS:
+            return reference_data.get_permit_area_identifier_map(
+                domain.pk, identifiers)
         areas = cls.objects.using(using).filter(domain=domain)
         return dict(areas.values_list("identifier", "id"))
 
 
+ANONYMIZE_SUBJECTS_SQL = """
+UPDATE {table} AS p
+SET subjects = (
+  SELECT coalesce(jsonb_agg(
+    jsonb_set(s.subject, '{{registration_number}}', '""')
+    ORDER BY s.n), '[]')
+  FROM jsonb_array_elements(p.subjects) WITH ORDINALITY AS s(subject, n)
+)
+WHERE p.id = ANY(%s) AND jsonb_typeof(p.subjects) = 'array'
+"""
+
+CLONE_SERIES_SQL = [
+    """
+    CREATE TEMPORARY TABLE permit_clone_ids AS
+    SELECT id AS old_id, nextval(pg_get_serial_sequence(%(permit)s, 'id'))
+      AS new_id
+    FROM {permit} WHERE series_id = %(source)s
+    """,
+    """
+    INSERT INTO {permit} (
+      id, created_at, modified_at, domain_id, series_id, external_id,
+      subjects, areas, properties)
+    SELECT
+      m.new_id, %(now)s, %(now)s, p.domain_id, %(target)s, p.external_id,
+      p.subjects, p.areas, p.properties
+    FROM {permit} p JOIN permit_clone_ids m ON m.old_id = p.id
+    """,
+    """
+    CREATE TEMPORARY TABLE permit_subject_item_clone_ids AS
+    SELECT
+      x.id AS old_id,
+      nextval(pg_get_serial_sequence(%(subject_item)s, 'id')) AS new_id,
+      m.new_id AS permit_id
+    FROM {subject_item} x JOIN permit_clone_ids m ON m.old_id = x.permit_id
+    """,
+    """
+    INSERT INTO {subject_item} (
+      id, permit_id, start_time, end_time, registration_number, address,
+      zip)
+    SELECT
+      m.new_id, m.permit_id, x.start_time, x.end_time,
+      x.registration_number, x.address, x.zip
+    FROM {subject_item} x
+    JOIN permit_subject_item_clone_ids m ON m.old_id = x.id
+    """,
+    """
+    CREATE TEMPORARY TABLE permit_area_item_clone_ids AS
+    SELECT
+      x.id AS old_id,
+      nextval(pg_get_serial_sequence(%(area_item)s, 'id')) AS new_id,
+      m.new_id AS permit_id
+    FROM {area_item} x JOIN permit_clone_ids m ON m.old_id = x.permit_id
+    """,
+    """
+    INSERT INTO {area_item} (id, permit_id, start_time, end_time, area_id)
+    SELECT m.new_id, m.permit_id, x.start_time, x.end_time, x.area_id
+    FROM {area_item} x JOIN permit_area_item_clone_ids m ON m.old_id = x.id
+    """,
+    """
+    INSERT INTO {lookup_item} (
+      permit_id, subject_item_id, area_item_id, registration_number,
+      area_id, start_time, end_time)
+    SELECT
+      pm.new_id, sm.new_id, am.new_id, x.registration_number,
+      x.area_id, x.start_time, x.end_time
+    FROM {lookup_item} x
+    JOIN permit_clone_ids pm ON pm.old_id = x.permit_id
+    LEFT JOIN permit_subject_item_clone_ids sm
+      ON sm.old_id = x.subject_item_id
+    LEFT JOIN permit_area_item_clone_ids am ON am.old_id = x.area_item_id
+    """,
+    """
+    DROP TABLE
+      permit_clone_ids, permit_subject_item_clone_ids,
+      permit_area_item_clone_ids
+    """,
+]
+
+
 class PermitSeriesQuerySet(models.QuerySet):
     def active(self):
         return self.filter(active=True)
@@ -87,6 +176,41 @@ class PermitSeries(TimestampedModelMixin, models.Model):
     def __str__(self):
         return str(self.id)
 
+    def clone(self, using=None):
+        """
+        Create a new inactive series with copies of the permits of this.
+
+        The permits and their subject, area and lookup items are copied
+        with INSERT ... SELECT statements inside the database, so the
+        cost does not depend on transferring or validating the permits
+        again.
+
+        :rtype: PermitSeries
+        """
+        using = using or router.db_for_write(type(self), instance=self)
+        models_by_name = {
+            "permit": Permit,
+            "subject_item": PermitSubjectItem,
+            "area_item": PermitAreaItem,
+            "lookup_item": PermitLookupItem,
+        }
+        connection = connections[using]
+        tables = {
+            name: connection.ops.quote_name(model._meta.db_table)
+            for (name, model) in models_by_name.items()}
+        with transaction.atomic(using=using):
+            new_series = type(self).objects.using(using).create(
+                owner_id=self.owner_id, type=self.type)
+            params = {
+                name: model._meta.db_table
+                for (name, model) in models_by_name.items()}
+            params.update(
+                source=self.pk, target=new_series.pk, now=timezone.now())
+            with connection.cursor() as cursor:
+                for sql in CLONE_SERIES_SQL:
+                    cursor.execute(sql.format(**tables), params)
+        return new_series
+
 
 class PermitQuerySet(models.QuerySet):
     def active(self):
@@ -149,47 +273,111 @@ class PermitQuerySet(models.QuerySet):
         permits_which_have_data = subjects.values("permit")
         return self.filter(id__in=permits_which_have_data)
 
-    @transaction.atomic
     def anonymize(self, batch_size=1000):
         """
         Anonymize registration numbers of the permits in this queryset.
+
+        The permits are processed in batches of consecutive ids, each in
+        its own transaction, so that the memory usage and the length of
+        the transactions do not depend on the number of the permits.
+        The subjects of the permits are anonymized with a single UPDATE
+        per batch and their subject and lookup items in the same batch.
         """
         count = 0
-        all_ids = self.order_by("id").values_list("id", flat=True)
-        for start_idx in range(0, len(all_ids), batch_size):
-            ids = all_ids[start_idx:start_idx + batch_size]
-            batch = self.model.objects.filter(id__in=ids).order_by()
-            updated_permits = []
-            for permit in batch.only("id", "subjects"):
-                permit.anonymize_subjects()
-                updated_permits.append(permit)
-            batch.bulk_update(updated_permits, ["subjects"], batch_size)
-            count += len(updated_permits)
-            lookup_items = PermitLookupItem.objects.filter(permit_id__in=ids)
-            assert isinstance(lookup_items, PermitLookupItemQuerySet)
-            lookup_items.anonymize()
-            subjects = PermitSubjectItem.objects.filter(permit_id__in=ids)
-            assert isinstance(subjects, PermitSubjectItemQuerySet)
-            subjects.anonymize()
+        connection = connections[self.db]
+        sql = ANONYMIZE_SUBJECTS_SQL.format(
+            table=connection.ops.quote_name(self.model._meta.db_table))
+        ids = self.order_by("id").values_list("id", flat=True)
+        last_id = None
+        while True:
+            batch_ids = list(
+                (ids.filter(id__gt=last_id) if last_id is not None else ids)
+                [:batch_size])
+            if not batch_ids:
+                break
+            last_id = batch_ids[-1]
+            with transaction.atomic(using=self.db):
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [batch_ids])
+                lookup_items = PermitLookupItem.objects.using(self.db).filter(
+                    permit_id__in=batch_ids)
+                assert isinstance(lookup_items, PermitLookupItemQuerySet)
+                lookup_items.anonymize()
+                subjects = PermitSubjectItem.objects.using(self.db).filter(
+                    permit_id__in=batch_ids)
+                assert isinstance(subjects, PermitSubjectItemQuerySet)
+                subjects.anonymize()
+            count += len(batch_ids)
         return count
 
     def bulk_create(self, permits, *args, **kwargs):
+        """
+        Create many permits and their items at once.
+
+        The permits are validated in one pass, which checks the related
+        objects and the uniqueness of the external ids with a single
+        query each.  Then the permits and their subject, area and
+        lookup items are inserted with a single bulk insert per table,
+        regardless of the number of the permits.
+        """
         for permit in permits:
             assert isinstance(permit, Permit)
-            permit.full_clean()
-
-        area_ids_cache = {}
+        self._validate_in_bulk(permits)
 
         with transaction.atomic(using=self.db, savepoint=False):
             created_permits = super().bulk_create(permits, *args, **kwargs)
-            for permit in created_permits:
-                area_ids = area_ids_cache.get(permit.domain_id) or (
-                    area_ids_cache.setdefault(
-                        permit.domain_id,
-                        PermitArea.get_identifier_map(permit.domain, self.db)))
-                permit._create_all_items(area_ids, using=self.db, is_new=True)
+            Permit._create_items_in_bulk(created_permits, using=self.db)
             return created_permits
 
+    def _validate_in_bulk(self, permits):
+        """
+        Do the same validation as full_clean for each of the permits.
+        """
+        related_fields = ['domain', 'series']
+        for permit in permits:
+            permit.full_clean(exclude=related_fields, validate_unique=False)
+        for name in related_fields:
+            self._validate_related_objects(permits, name)
+        self._validate_unique_external_ids(permits)
+
+    def _validate_related_objects(self, permits, field_name):
+        field = self.model._meta.get_field(field_name)
+        values = {getattr(permit, field.attname) for permit in permits}
+        if None in values:
+            raise ValidationError({field_name: [field.error_messages['null']]})
+        related_model = field.remote_field.model
+        found = set(
+            related_model._base_manager.using(self.db)
+            .filter(pk__in=values).values_list('pk', flat=True)
+        ) if values else set()
+        for value in values - found:
+            raise ValidationError({field_name: [ValidationError(
+                field.error_messages['invalid'], code='invalid', params={
+                    'model': related_model._meta.verbose_name,
+                    'pk': value,
+                    'field': field.remote_field.field_name,
+                    'value': value,
+                })]})
+
+    def _validate_unique_external_ids(self, permits):
+        keys = [
+            (permit.series_id, permit.external_id) for permit in permits
+            if permit.external_id is not None]
+        if not keys:
+            return
+        taken = set(
+            self.model._base_manager.using(self.db)
+            .filter(series__in={series_id for (series_id, _) in keys},
+                    external_id__in={external_id for (_, external_id) in keys})
+            .values_list('series', 'external_id'))
+        for (permit, key) in zip(
+                (x for x in permits if x.external_id is not None), keys):
+            if key in taken:
+                raise ValidationError({NON_FIELD_ERRORS: [
+                    permit.unique_error_message(
+                        self.model, ('series', 'external_id'))]})
+            taken.add(key)
+
 
 class Permit(TimestampedModelMixin, models.Model):
     domain = models.ForeignKey(
@@ -245,45 +433,123 @@ class Permit(TimestampedModelMixin, models.Model):
             super(Permit, self).save(using=using, *args, **kwargs)
             self._create_all_items(using=using, is_new=is_new)
 
-    def _create_all_items(self, area_ids=None, using="default", is_new=False):
-        if area_ids is None:
-            area_ids = PermitArea.get_identifier_map(self.domain, using)
-        if not is_new:
-            self.lookup_items.all().using(using).delete()
-            self.subject_items.all().using(using).delete()
-            self.area_items.all().using(using).delete()
-        subject_items = self._create_subject_items(using)
-        area_items = self._create_area_items(using, area_ids)
-        lookup_items = self._make_lookup_items(area_items, subject_items)
+    def _create_all_items(self, using="default", is_new=False):
+        if is_new:
+            type(self)._create_items_in_bulk([self], using=using)
+        else:
+            self._update_items(using)
+
+    def _update_items(self, using):
+        """
+        Update the items of this permit to match its subjects and areas.
+
+        Only the changed item rows are written: unchanged items are
+        kept as they are, changed items are updated in place and the
+        rest are deleted or inserted.  E.g. changing the end time of
+        a single subject updates only its subject item and the lookup
+        items derived from it.
+        """
+        old_reg_nums = set()
+        if plate_cache.is_enabled():
+            old_reg_nums.update(
+                self.lookup_items.using(using)
+                .values_list("registration_number", flat=True))
+        area_ids = PermitArea.get_identifier_map(
+            self.domain, using, self._get_area_identifiers())
+        subject_items = _sync_items(
+            self.subject_items.using(using), self._make_subject_items(),
+            fields=SUBJECT_ITEM_FIELDS, match_fields=["registration_number"])
+        area_items = _sync_items(
+            self.area_items.using(using), self._make_area_items(area_ids),
+            fields=AREA_ITEM_FIELDS, match_fields=["area_id"])
+        lookup_items = _sync_items(
+            self.lookup_items.using(using),
+            self._make_lookup_items(area_items, subject_items),
+            fields=LOOKUP_ITEM_FIELDS,
+            match_fields=["subject_item_id", "area_item_id"])
+
+        reg_nums = {x.registration_number for x in lookup_items}
+        plate_filter.add_plates(self.domain_id, reg_nums)
+        if plate_cache.is_enabled():
+            transaction.on_commit(partial(
+                plate_cache.invalidate_plates, self.domain_id,
+                old_reg_nums | reg_nums), using=using)
+
+    @classmethod
+    def _create_items_in_bulk(cls, permits, using="default"):
+        """
+        Create the items of the given new permits.
+
+        The subject, area and lookup items of all the permits are
+        inserted with a single bulk insert per item type.
+
+        :type permits: list[Permit]
+        """
+        area_identifiers_by_domain = defaultdict(set)
+        for permit in permits:
+            area_identifiers_by_domain[permit.domain_id].update(
+                permit._get_area_identifiers())
+        area_ids_by_domain = {}
+        items_by_permit = []
+        for permit in permits:
+            if permit.domain_id not in area_ids_by_domain:
+                area_ids_by_domain[permit.domain_id] = (
+                    PermitArea.get_identifier_map(
+                        permit.domain, using,
+                        area_identifiers_by_domain[permit.domain_id]))
+            items_by_permit.append((
+                permit,
+                permit._make_subject_items(),
+                permit._make_area_items(area_ids_by_domain[permit.domain_id])))
+        PermitSubjectItem.objects.using(using).bulk_create(
+            [x for (_, subject_items, _) in items_by_permit for x in subject_items])
+        PermitAreaItem.objects.using(using).bulk_create(
+            [x for (_, _, area_items) in items_by_permit for x in area_items])
+
+        lookup_items = []
+        reg_nums_by_domain = {}
+        for (permit, subject_items, area_items) in items_by_permit:
+            permit_lookup_items = list(
+                permit._make_lookup_items(area_items, subject_items))
+            lookup_items.extend(permit_lookup_items)
+            reg_nums_by_domain.setdefault(permit.domain_id, set()).update(
+                x.registration_number for x in permit_lookup_items)
         PermitLookupItem.objects.using(using).bulk_create(lookup_items)
 
-    def _create_subject_items(self, using):
-        subject_items = [
+        for (domain_id, reg_nums) in reg_nums_by_domain.items():
+            plate_filter.add_plates(domain_id, reg_nums)
+        if plate_cache.is_enabled():
+            for (domain_id, reg_nums) in reg_nums_by_domain.items():
+                transaction.on_commit(partial(
+                    plate_cache.invalidate_plates, domain_id, reg_nums),
+                    using=using)
+
+    def _make_subject_items(self):
+        return [
             PermitSubjectItem(
                 permit_id=self.id,
                 registration_number=subject["registration_number"],
-                start_time=subject["start_time"],
-                end_time=subject["end_time"],
+                start_time=parse_datetime(subject["start_time"]),
+                end_time=parse_datetime(subject["end_time"]),
                 address=subject["address"],
                 zip=subject["zip"]
             )
             for subject in self.subjects
         ]
-        PermitSubjectItem.objects.using(using).bulk_create(subject_items)
-        return subject_items
 
-    def _create_area_items(self, using, area_ids):
-        area_items = [
+    def _get_area_identifiers(self):
+        return {area["area"] for area in self.areas}
+
+    def _make_area_items(self, area_ids):
+        return [
             PermitAreaItem(
                 permit_id=self.id,
                 area_id=area_ids[area["area"]],
-                start_time=area["start_time"],
-                end_time=area["end_time"],
+                start_time=parse_datetime(area["start_time"]),
+                end_time=parse_datetime(area["end_time"]),
             )
             for area in self.areas
         ]
-        PermitAreaItem.objects.using(using).bulk_create(area_items)
-        return area_items
 
     def _make_lookup_items(self, area_items, subject_items):
         for area_item in area_items:
@@ -325,6 +591,70 @@ class Permit(TimestampedModelMixin, models.Model):
                 )
 
 
+def _sync_items(queryset, new_items, fields, match_fields):
+    """
+    Make the items of the queryset match the given new items.
+
+    New items which are equal to an existing item in the given fields
+    are not saved, but the existing item is used instead.  The rest of
+    the existing items are updated to match a new item with the same
+    values in the match fields, if there is one, or deleted otherwise.
+    The remaining new items are inserted.
+
+    :type queryset: django.db.models.QuerySet
+    :type new_items: Iterable[django.db.models.Model]
+    :param fields: Attribute names of the compared fields
+    :param match_fields: Attribute names identifying an updatable item
+    :return: The saved items, in the order of the new items
+    :rtype: list[django.db.models.Model]
+    """
+    (pairs, old_items) = _pair_items(new_items, list(queryset), fields)
+    (updates, old_items) = _pair_items(
+        [new for (new, old) in pairs if old is None], old_items, match_fields)
+    updated_items = {}
+    to_create = []
+    for (new_item, old_item) in updates:
+        if old_item is None:
+            to_create.append(new_item)
+            continue
+        for name in fields:
+            setattr(old_item, name, getattr(new_item, name))
+        updated_items[id(new_item)] = old_item
+
+    if old_items:
+        queryset.model.objects.using(queryset.db).filter(
+            pk__in=[x.pk for x in old_items]).delete()
+    if updated_items:
+        meta = queryset.model._meta
+        queryset.bulk_update(
+            updated_items.values(), [meta.get_field(x).name for x in fields])
+    if to_create:
+        queryset.bulk_create(to_create)
+    return [
+        old or updated_items.get(id(new), new) for (new, old) in pairs]
+
+
+def _pair_items(new_items, old_items, fields):
+    """
+    Pair the new items with old items having the same field values.
+
+    :return:
+      List of (new item, old item or None) pairs and a list of the
+      old items left unpaired
+    """
+    def get_values(item):
+        return tuple(getattr(item, name) for name in fields)
+
+    old_items_by_values = defaultdict(list)
+    for old_item in old_items:
+        old_items_by_values[get_values(old_item)].append(old_item)
+    pairs = []
+    for new_item in new_items:
+        equal_items = old_items_by_values.get(get_values(new_item))
+        pairs.append((new_item, equal_items.pop() if equal_items else None))
+    return (pairs, list(chain.from_iterable(old_items_by_values.values())))
+
+
 class PermitSubjectItemQuerySet(AnonymizableRegNumQuerySet):
     pass
 
@@ -368,7 +698,7 @@ class PermitLookupItemQuerySet(AnonymizableRegNumQuerySet, models.QuerySet):
         return self.filter(permit__series__active=True)
 
     def by_time(self, timestamp):
-        return self.filter(start_time__lte=timestamp, end_time__gte=timestamp)
+        return self.filter(RangeContains("validity", timestamp))
 
     def by_subject(self, registration_number):
         normalized_reg_num = normalize_reg_num(registration_number)
@@ -413,3 +743,11 @@ class PermitLookupItem(models.Model):
             start_time=self.start_time, end_time=self.end_time,
             registration_number=self.registration_number,
             area=self.area.identifier)
+
+
+SUBJECT_ITEM_FIELDS = [
+    "registration_number", "start_time", "end_time", "address", "zip"]
+AREA_ITEM_FIELDS = ["area_id", "start_time", "end_time"]
+LOOKUP_ITEM_FIELDS = [
+    "subject_item_id", "area_item_id", "registration_number", "area_id",
+    "start_time", "end_time"]
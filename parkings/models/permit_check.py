@@ -3,6 +3,7 @@ from django.contrib.gis.db import models as gis_models
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import JSONField
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from parkings.models import Permit
@@ -26,7 +27,8 @@ class PermitCheck(models.Model):
     """
     # Metadata
     created_at = models.DateTimeField(
-        auto_now_add=True, db_index=True, verbose_name=_("time created"))
+        default=timezone.now, editable=False, db_index=True,
+        verbose_name=_("time created"))
     performer = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.PROTECT, editable=False,
         verbose_name=_("performer"),
@@ -1,7 +1,57 @@
 from django.contrib.gis.db.models.functions import Distance
+from django.db import connections, router
+from django.db.models import BooleanField, Expression
 
+from ..utils.coordinates import transform_point, transform_points
 from .constants import WGS84_SRID
 from .parking_area import ParkingArea
+from .region import Region
+
+REGIONS_AND_AREAS_SQL = """
+SELECT {region_column}, a.id
+FROM unnest(%(domain_ids)s::integer[], %(ewkts)s::text[])
+    WITH ORDINALITY AS p(domain_id, ewkt, n)
+CROSS JOIN LATERAL (SELECT ST_GeomFromEWKT(p.ewkt) AS geom) g
+{region_join}
+LEFT JOIN LATERAL (
+    SELECT id FROM {area_table}
+    WHERE domain_id = p.domain_id
+      AND ST_DWithin(geom, g.geom, %(max_distance)s)
+    ORDER BY geom <-> g.geom LIMIT 1
+) a ON true
+ORDER BY p.n
+"""
+
+REGION_JOIN_SQL = """
+LEFT JOIN LATERAL (
+    SELECT id FROM {region_table}
+    WHERE domain_id = p.domain_id AND ST_Intersects(geom, g.geom)
+    ORDER BY id LIMIT 1
+) r ON true
+"""
+
+
+class RangeContains(Expression):
+    """
+    Condition that a range column of the model contains a timestamp.
+
+    The range column is generated by the database from other columns,
+    so it is not a model field and is referred to by its column name.
+    The containment operator allows using a GiST index of the column.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, column, value):
+        super().__init__()
+        self.column = column
+        self.value = value
+
+    def as_sql(self, compiler, connection):
+        alias = compiler.query.get_initial_alias()
+        sql = '{}.{} @> %s::timestamptz'.format(
+            compiler.quote_name_unless_alias(alias),
+            connection.ops.quote_name(self.column))
+        return (sql, [self.value])
 
 
 def normalize_reg_num(registration_number):
@@ -14,7 +64,9 @@ def get_closest_area(location, domain, max_distance=50, area_model=ParkingArea):
     if not location:
         return None
     area_srid = area_model._meta.get_field('geom').srid
-    location = location.transform(area_srid, clone=True)
+    location = transform_point(location, area_srid)
+    if not location:
+        return None
     areas = area_model.objects.filter(domain=domain)
     with_distance = areas.annotate(distance=Distance('geom', location))
     within_range = with_distance.filter(distance__lte=max_distance)
@@ -22,6 +74,65 @@ def get_closest_area(location, domain, max_distance=50, area_model=ParkingArea):
     return closest_area
 
 
+def get_region_and_area(
+        location, domain_id, max_distance=50,
+        area_model=ParkingArea, region_model=Region):
+    """
+    Get region and closest area of a location with a single query.
+
+    :type location: django.contrib.gis.geos.Point|None
+    :type domain_id: int
+    :rtype: (uuid.UUID|None, uuid.UUID|None)
+    :return: Region id and area id
+    """
+    return get_regions_and_areas(
+        [location], [domain_id], max_distance, area_model, region_model)[0]
+
+
+def get_regions_and_areas(
+        locations, domain_ids, max_distance=50,
+        area_model=ParkingArea, region_model=Region):
+    """
+    Get regions and closest areas of many locations at once.
+
+    The region is the one intersecting the location and the area is the
+    closest one within the maximum distance, as found by KNN ordering
+    on the geometry index.  Both are looked up from the domain of the
+    location with a single query for all the locations.
+
+    :type locations: list[django.contrib.gis.geos.Point|None]
+    :type domain_ids: list[int]
+    :param area_model: ParkingArea or EventArea
+    :param region_model: Region or None to skip the region lookup
+    :rtype: list[(uuid.UUID|None, uuid.UUID|None)]
+    :return: Region id and area id for each location
+    """
+    result = [(None, None)] * len(locations)
+    srid = area_model._meta.get_field('geom').srid
+    indexes = [n for (n, location) in enumerate(locations) if location]
+    transformed = transform_points([locations[n] for n in indexes], srid)
+    points = {n: point for (n, point) in zip(indexes, transformed) if point}
+    if not points:
+        return result
+    connection = connections[router.db_for_read(area_model)]
+    quote = connection.ops.quote_name
+    sql = REGIONS_AND_AREAS_SQL.format(
+        region_column=('r.id' if region_model else 'NULL'),
+        region_join=(REGION_JOIN_SQL.format(
+            region_table=quote(region_model._meta.db_table))
+            if region_model else ''),
+        area_table=quote(area_model._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'max_distance': max_distance,
+            'domain_ids': [domain_ids[n] for n in points],
+            'ewkts': [point.ewkt for point in points.values()],
+        })
+        for (n, row) in zip(points, cursor.fetchall()):
+            result[n] = tuple(row)
+    return result
+
+
 def _format_coordinates(location, prec=5):
     assert location.srid == WGS84_SRID
     longitude = location.coords[0]
@@ -0,0 +1,313 @@
+"""
+Monthly range partitioning of the ever growing tables.
+
+The archived parkings and the parking checks are only inserted and
+later anonymized or removed by their age.  Their tables can be converted
+to tables partitioned by month on a time column.  After that, removing
+old data is done by detaching or dropping whole partitions, and queries
+filtering by the time column read only the matching partitions.
+
+The partitions are named ``<table>_pYYYYMM`` and their bounds are months
+in UTC.  Rows outside of the created partitions go to a default
+partition named ``<table>_default``.  Each partition has BRIN indexes on
+the time columns, which are small and suit the append-only data.
+"""
+import datetime
+import re
+from collections import namedtuple
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import ArchivedParking, ParkingCheck
+
+PartitionedTable = namedtuple("PartitionedTable", [
+    "model",
+    "key",
+    "brin_columns",
+])
+
+PARTITIONED_TABLES = {
+    "archived_parking": PartitionedTable(
+        ArchivedParking, "time_end", ["time_end", "archived_at"]),
+    "parking_check": PartitionedTable(
+        ParkingCheck, "created_at", ["created_at"]),
+}
+
+PARTITION_NAME_RX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def is_partitioned(name):
+    """
+    Check if the table of given name is partitioned.
+
+    :param name: Key of the table in PARTITIONED_TABLES
+    :rtype: bool
+    """
+    model = PARTITIONED_TABLES[name].model
+    with _get_connection(model).cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def get_partitions(name):
+    """
+    Get the monthly partitions of a table.
+
+    :rtype: list[(str, datetime.date)]
+    :return: Names and months of the partitions, ordered by the month
+    """
+    model = PARTITIONED_TABLES[name].model
+    with _get_connection(model).cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i"
+            " JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = %s::regclass",
+            [model._meta.db_table])
+        partition_names = [row[0] for row in cursor.fetchall()]
+    result = []
+    for partition_name in partition_names:
+        match = PARTITION_NAME_RX.search(partition_name)
+        if match:
+            month = datetime.date(int(match.group(1)), int(match.group(2)), 1)
+            result.append((partition_name, month))
+    return sorted(result, key=(lambda x: x[1]))
+
+
+def convert_to_partitioned(name, months_ahead=3, now=None):
+    """
+    Convert a table to a table partitioned by month.
+
+    The rows are copied to a new partitioned table with partitions for
+    all the months from the oldest row to the given number of months
+    ahead, and the old table is dropped.  The indexes and foreign keys
+    of the old table are recreated on the new table.  If the partition
+    key column is not nullable, the primary key is extended with it,
+    since PostgreSQL requires that; otherwise the primary key column is
+    only indexed.
+
+    This locks and rewrites the whole table, so it should be run in a
+    maintenance break.
+
+    :rtype: list[str]
+    :return: Names of the created monthly partitions
+    """
+    (model, key, brin_columns) = PARTITIONED_TABLES[name]
+    connection = _get_connection(model)
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    old_table = table + "_unpartitioned"
+    pk_column = model._meta.pk.column
+    key_is_nullable = model._meta.get_field(key).null
+    with transaction.atomic(using=connection.alias):
+        if is_partitioned(name):
+            raise ValueError("Table {} is already partitioned".format(table))
+        with connection.cursor() as cursor:
+            # Fire the pending deferred constraint checks, since a table
+            # with pending trigger events cannot be altered
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            (pk_name, index_defs, foreign_keys) = _get_table_definitions(
+                cursor, table)
+            cursor.execute("ALTER TABLE {} RENAME TO {}".format(
+                quote(table), quote(old_table)))
+            cursor.execute("ALTER TABLE {} RENAME CONSTRAINT {} TO {}".format(
+                quote(old_table), quote(pk_name), quote(old_table + "_pkey")))
+            cursor.execute(
+                "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS"
+                " INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+                " PARTITION BY RANGE ({})".format(
+                    quote(table), quote(old_table), quote(key)))
+            if key_is_nullable:
+                index_defs.append("CREATE INDEX {} ON {} ({})".format(
+                    quote(table + "_" + pk_column), quote(table),
+                    quote(pk_column)))
+            else:
+                cursor.execute(
+                    "ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY ({}, {})"
+                    .format(quote(table), quote(pk_name), quote(pk_column),
+                            quote(key)))
+            cursor.execute("CREATE TABLE {} PARTITION OF {} DEFAULT".format(
+                quote(table + "_default"), quote(table)))
+
+            cursor.execute("SELECT min({}) FROM {}".format(
+                quote(key), quote(old_table)))
+            oldest = cursor.fetchone()[0]
+            created = create_partitions(
+                name, months_ahead, now=now, since=oldest)
+
+            cursor.execute("INSERT INTO {} SELECT * FROM {}".format(
+                quote(table), quote(old_table)))
+            _move_sequence(cursor, table, old_table, pk_column)
+            cursor.execute("DROP TABLE {}".format(quote(old_table)))
+            for index_def in index_defs:
+                cursor.execute(index_def)
+            for column in brin_columns:
+                cursor.execute("CREATE INDEX {} ON {} USING brin ({})".format(
+                    quote("{}_{}_brin".format(table, column)), quote(table),
+                    quote(column)))
+            for (constraint_name, definition) in foreign_keys:
+                cursor.execute("ALTER TABLE {} ADD CONSTRAINT {} {}".format(
+                    quote(table), quote(constraint_name), definition))
+    return created
+
+
+def _get_table_definitions(cursor, table):
+    cursor.execute(
+        "SELECT conname FROM pg_constraint"
+        " WHERE conrelid = %s::regclass AND contype = 'p'", [table])
+    pk_name = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes"
+        " WHERE schemaname = current_schema() AND tablename = %s"
+        " AND indexname <> %s", [table, pk_name])
+    index_defs = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+        " WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+    foreign_keys = cursor.fetchall()
+    return (pk_name, index_defs, foreign_keys)
+
+
+def _move_sequence(cursor, table, old_table, pk_column):
+    """
+    Make the primary key sequence of the old table continue on the new.
+    """
+    cursor.execute(
+        "SELECT pg_get_serial_sequence(%s, %s),"
+        " pg_get_serial_sequence(%s, %s)",
+        [table, pk_column, old_table, pk_column])
+    (new_sequence, old_sequence) = cursor.fetchone()
+    quote = cursor.db.ops.quote_name
+    if new_sequence:  # Identity column, which got a new sequence
+        cursor.execute(
+            "SELECT setval(%s, coalesce(max({}), 0) + 1, false)"
+            " FROM {}".format(quote(pk_column), quote(table)),
+            [new_sequence])
+    elif old_sequence:  # Serial column, whose sequence is owned by old
+        cursor.execute("ALTER SEQUENCE {} OWNED BY {}.{}".format(
+            old_sequence, quote(table), quote(pk_column)))
+
+
+def create_partitions(name, months_ahead=3, now=None, since=None):
+    """
+    Create the missing monthly partitions up to given months ahead.
+
+    The partitions are created from the month of `since` (or of the
+    current time) onwards.  Rows of the default partition which belong
+    to a created partition are moved to it.
+
+    :type since: datetime.datetime|None
+    :rtype: list[str]
+    :return: Names of the created partitions
+    """
+    (model, key, _brin_columns) = PARTITIONED_TABLES[name]
+    now = now or timezone.now()
+    first_month = _get_month(min(since, now) if since else now)
+    last_month = _add_months(_get_month(now), months_ahead)
+    existing = {month for (_name, month) in get_partitions(name)}
+    connection = _get_connection(model)
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    created = []
+    month = first_month
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            while month <= last_month:
+                if month not in existing:
+                    partition = "{}_p{:%Y%m}".format(table, month)
+                    bounds = (_get_utc_time(month),
+                              _get_utc_time(_add_months(month, 1)))
+                    cursor.execute(
+                        "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS"
+                        " INCLUDING CONSTRAINTS)".format(
+                            quote(partition), quote(table)))
+                    cursor.execute(
+                        "WITH moved AS (DELETE FROM {default}"
+                        " WHERE {key} >= %s AND {key} < %s RETURNING *)"
+                        " INSERT INTO {partition} SELECT * FROM moved".format(
+                            default=quote(table + "_default"),
+                            key=quote(key), partition=quote(partition)),
+                        bounds)
+                    cursor.execute(
+                        "ALTER TABLE {} ATTACH PARTITION {}"
+                        " FOR VALUES FROM (%s) TO (%s)".format(
+                            quote(table), quote(partition)),
+                        bounds)
+                    created.append(partition)
+                month = _add_months(month, 1)
+    return created
+
+
+def remove_partitions(name, before, drop=False):
+    """
+    Detach, and optionally drop, the partitions of months before given.
+
+    Only the partitions whose whole month is before the given time are
+    removed.  Detached partitions are left as separate tables.
+
+    :type before: datetime.datetime
+    :rtype: list[str]
+    :return: Names of the removed partitions
+    """
+    model = PARTITIONED_TABLES[name].model
+    connection = _get_connection(model)
+    quote = connection.ops.quote_name
+    removed = []
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            for (partition, month) in get_partitions(name):
+                if _get_utc_time(_add_months(month, 1)) > before:
+                    break
+                cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(
+                    quote(model._meta.db_table), quote(partition)))
+                if drop:
+                    cursor.execute("DROP TABLE {}".format(quote(partition)))
+                removed.append(partition)
+    return removed
+
+
+def get_month_start(time, months=0):
+    """
+    Get the start of the UTC month of given time, shifted by months.
+
+    >>> get_month_start(datetime.datetime(
+    ...     2024, 3, 31, 23, 30, tzinfo=datetime.timezone.utc), -3)
+    datetime.datetime(2023, 12, 1, 0, 0, tzinfo=datetime.timezone.utc)
+    """
+    return _get_utc_time(_add_months(_get_month(time), months))
+
+
+def _get_connection(model):
+    return connections[router.db_for_write(model)]
+
+
+def _get_month(time):
+    """
+    Get the first day of the UTC month of given time.
+
+    >>> _get_month(datetime.datetime(2024, 3, 31, 23, 30,
+    ...                              tzinfo=datetime.timezone.utc))
+    datetime.date(2024, 3, 1)
+    """
+    utc_time = time.astimezone(datetime.timezone.utc)
+    return datetime.date(utc_time.year, utc_time.month, 1)
+
+
+def _add_months(month, count):
+    """
+    Add months to a month given as its first day.
+
+    >>> _add_months(datetime.date(2024, 11, 1), 3)
+    datetime.date(2025, 2, 1)
+    >>> _add_months(datetime.date(2024, 1, 1), -1)
+    datetime.date(2023, 12, 1)
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _get_utc_time(month):
+    return datetime.datetime(
+        month.year, month.month, 1, tzinfo=datetime.timezone.utc)
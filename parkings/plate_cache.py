@@ -0,0 +1,243 @@
+"""
+Cache of the check candidates of registration numbers.
+
+Most of the checked registration numbers have no valid parkings or
+permits at all.  To answer those checks without querying the database,
+the candidate rows of `parkings.check_candidates` can be cached per
+enforcement domain and normalized registration number.  The cache is
+enabled by setting PARKKIHUBI_PLATE_CACHE_TIMEOUT.
+
+The entries are stored to the Django cache configured by
+PARKKIHUBI_PLATE_CACHE_ALIAS, which should be shared by the processes
+(e.g. Redis via django-redis), since the writes of parkings and permits
+invalidate the entries there.  Additionally an in-process tier can be
+enabled with PARKKIHUBI_PLATE_CACHE_LOCAL_TIMEOUT.  The local tier is
+invalidated only within the process, so its timeout should be short.
+
+Each registration number has also a version, which is changed when its
+entries are invalidated.  The rows fetched on a miss are stored only if
+the version did not change during the fetch, since otherwise they may
+be older than the invalidating change.
+
+An entry covers a time range: it has all the rows valid at some point
+of the range.  It is used only for lookups whose time range is within
+the covered range, and it expires at the end of the range or at the
+earliest ending time of its rows, whichever comes first.
+"""
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+GENERATION_CACHE_KEY = "parkings:plate_cache:generation"
+ENTRY_CACHE_KEY = "parkings:plate_cache:{generation}:{domain_id}:{reg_num}"
+VERSION_CACHE_KEY = "parkings:plate_cache:version:{domain_id}:{reg_num}"
+
+LOCAL_TIER_MAX_SIZE = 10000
+
+CacheEntry = namedtuple("CacheEntry", ["time_from", "time_to", "rows"])
+
+
+def is_enabled():
+    return bool(_get_timeout())
+
+
+def get_rows(normalized_reg_nums, domain_id, time_from, time_to, fetch):
+    """
+    Get candidate rows of registration numbers from cache or by fetching.
+
+    The rows of the registration numbers missing from the cache are
+    fetched with a single call of the fetch function and then stored to
+    the cache.
+
+    :type normalized_reg_nums: list[str]
+    :type domain_id: int
+    :type time_from: datetime.datetime
+    :type time_to: datetime.datetime
+    :param fetch: Function to fetch the rows, see
+      `parkings.check_candidates.fetch_candidate_rows`
+    :rtype: dict[str, list]
+    """
+    timeout = _get_timeout()
+    now = timezone.now()
+    if not timeout or time_to < now - timeout:
+        return fetch(normalized_reg_nums, domain_id, time_from, time_to)
+
+    generation = _get_generation()
+    keys = {
+        reg_num: _make_key(generation, domain_id, reg_num)
+        for reg_num in normalized_reg_nums}
+    entries = _get_entries(keys.values())
+    result = {}
+    missing = []
+    for (reg_num, key) in keys.items():
+        entry = entries.get(key)
+        if entry and entry.time_from <= time_from and time_to <= entry.time_to:
+            result[reg_num] = list(entry.rows)
+        else:
+            missing.append(reg_num)
+    if not missing:
+        return result
+
+    cover_to = max(time_to, now) + timeout
+    versions = _get_versions(domain_id, missing)
+    fetched = fetch(missing, domain_id, time_from, cover_to)
+    # Do not store the rows if everything was invalidated during the
+    # fetch, since they may be older than the invalidating change
+    if _get_generation() == generation:
+        for (reg_num, rows) in fetched.items():
+            _set_entry(
+                keys[reg_num], CacheEntry(time_from, cover_to, rows), now)
+        # Remove the stored rows of the plates invalidated meanwhile.
+        # An invalidation after this check removes them by itself.
+        new_versions = _get_versions(domain_id, missing)
+        _delete_entries([
+            keys[reg_num] for reg_num in missing
+            if new_versions.get(reg_num) != versions.get(reg_num)])
+    for (reg_num, rows) in fetched.items():
+        result[reg_num] = [
+            row for row in rows if row.time_start <= time_to]
+    return result
+
+
+def peek_rows(normalized_reg_num, domain_id, time_from, time_to):
+    """
+    Get cached candidate rows of a registration number, if any.
+
+    :rtype: list|None
+    :return: The cached rows, or None if there is no usable entry
+    """
+    if not is_enabled():
+        return None
+    key = _make_key(_get_generation(), domain_id, normalized_reg_num)
+    entry = _get_entries([key]).get(key)
+    if entry and entry.time_from <= time_from and time_to <= entry.time_to:
+        return list(entry.rows)
+    return None
+
+
+def invalidate_plates(domain_id, normalized_reg_nums):
+    """
+    Invalidate cached entries of given registration numbers.
+    """
+    if not is_enabled():
+        return
+    reg_nums = set(normalized_reg_nums)
+    _get_cache().set_many({
+        _make_version_key(domain_id, reg_num): uuid.uuid4().hex
+        for reg_num in reg_nums}, _get_timeout().total_seconds())
+    generation = _get_generation()
+    _delete_entries([
+        _make_key(generation, domain_id, reg_num) for reg_num in reg_nums])
+
+
+def invalidate_all_plates():
+    """
+    Invalidate all cached entries of all domains.
+    """
+    if not is_enabled():
+        return
+    _get_cache().set(GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+    clear_local_entries()
+
+
+def clear_local_entries():
+    with _local_lock:
+        _local_entries.clear()
+
+
+_local_entries = {}
+_local_lock = threading.Lock()
+
+
+def _get_timeout():
+    return getattr(settings, "PARKKIHUBI_PLATE_CACHE_TIMEOUT", None)
+
+
+def _get_local_timeout():
+    return getattr(settings, "PARKKIHUBI_PLATE_CACHE_LOCAL_TIMEOUT", None)
+
+
+def _get_cache():
+    alias = getattr(settings, "PARKKIHUBI_PLATE_CACHE_ALIAS", "default")
+    return caches[alias]
+
+
+def _get_generation():
+    cache = _get_cache()
+    generation = cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        cache.add(GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_CACHE_KEY)
+    return generation
+
+
+def _make_key(generation, domain_id, reg_num):
+    return ENTRY_CACHE_KEY.format(
+        generation=generation, domain_id=domain_id, reg_num=reg_num)
+
+
+def _make_version_key(domain_id, reg_num):
+    return VERSION_CACHE_KEY.format(domain_id=domain_id, reg_num=reg_num)
+
+
+def _get_versions(domain_id, reg_nums):
+    keys = {_make_version_key(domain_id, x): x for x in reg_nums}
+    versions = _get_cache().get_many(keys)
+    return {keys[key]: version for (key, version) in versions.items()}
+
+
+def _delete_entries(keys):
+    if not keys:
+        return
+    _get_cache().delete_many(keys)
+    with _local_lock:
+        for key in keys:
+            _local_entries.pop(key, None)
+
+
+def _get_entries(keys):
+    entries = {}
+    remote_keys = []
+    local_now = time.monotonic()
+    with _local_lock:
+        for key in keys:
+            (expires_at, entry) = _local_entries.get(key, (0, None))
+            if entry and expires_at > local_now:
+                entries[key] = entry
+            else:
+                remote_keys.append(key)
+    if remote_keys:
+        remote_entries = _get_cache().get_many(remote_keys)
+        _set_local_entries(remote_entries)
+        entries.update(remote_entries)
+    return entries
+
+
+def _set_entry(key, entry, now):
+    expires_at = entry.time_to
+    for row in entry.rows:
+        if row.time_end is not None and now < row.time_end < expires_at:
+            expires_at = row.time_end
+    timeout = max((expires_at - now).total_seconds(), 1)
+    _get_cache().set(key, entry, timeout)
+    _set_local_entries({key: entry}, timeout)
+
+
+def _set_local_entries(entries, max_timeout=None):
+    local_timeout = _get_local_timeout()
+    if not local_timeout or not entries:
+        return
+    timeout = local_timeout.total_seconds()
+    if max_timeout is not None:
+        timeout = min(timeout, max_timeout)
+    expires_at = time.monotonic() + timeout
+    with _local_lock:
+        if len(_local_entries) + len(entries) > LOCAL_TIER_MAX_SIZE:
+            _local_entries.clear()
+        for (key, entry) in entries.items():
+            _local_entries[key] = (expires_at, entry)
@@ -0,0 +1,280 @@
+"""
+Bloom filter of the registration numbers having possibly valid rows.
+
+Most of the checked registration numbers have no parkings or permits at
+all.  A Bloom filter per enforcement domain tells which registration
+numbers definitely have no parkings, event parkings or permit lookup
+items that could be valid now, so that those checks can be answered
+without querying the database.  A hit in the filter is only a possible
+match and is resolved with SQL as usual.
+
+The filter is enabled with the PARKKIHUBI_PLATE_FILTER_ENABLED setting.
+It is built by the rebuild_plate_filters management command, which
+should be run periodically to drop the registration numbers whose rows
+have ended, and kept up to date by adding the registration numbers of
+saved parkings and permits.
+
+If the Django cache configured by PARKKIHUBI_PLATE_FILTER_CACHE_ALIAS is
+a django-redis cache, the filter is stored as a Redis bitmap shared by
+all processes.  Otherwise it is stored in the process memory, which is
+correct only when all writes happen in the same process, i.e. it is
+meant for development and testing.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils import timezone
+
+try:
+    from django_redis import get_redis_connection
+except ImportError:  # pragma: no cover
+    get_redis_connection = None
+
+FILTER_CACHE_KEY = "parkings:plate_filter:{domain_id}:{size}:{hash_count}"
+
+# Seconds between the checks of the transactions a rebuild waits for
+REBUILD_WAIT_INTERVAL = 0.5
+
+# Transactions which were in progress at the time of the snapshot, except
+# the current transaction, and are still in progress
+IN_PROGRESS_SQL = """
+SELECT count(*) FROM unnest(pg_snapshot_xip(%s::pg_snapshot)) AS xid
+WHERE xid IS DISTINCT FROM pg_current_xact_id_if_assigned()
+AND pg_xact_status(xid) = 'in progress'
+"""
+
+
+def is_enabled():
+    return getattr(settings, "PARKKIHUBI_PLATE_FILTER_ENABLED", False)
+
+
+def get_bit_positions(value, size, hash_count):
+    """
+    Get the bit positions of a value in a Bloom filter.
+
+    >>> get_bit_positions("ABC123", 1024, 3)
+    [922, 939, 956]
+    """
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % size for i in range(hash_count)]
+
+
+def add_plates(domain_id, normalized_reg_nums):
+    """
+    Add registration numbers to the filter of a domain.
+    """
+    if not is_enabled():
+        return
+    positions = {
+        position
+        for reg_num in normalized_reg_nums if reg_num
+        for position in _get_positions(reg_num)}
+    if positions:
+        _get_storage().set_bits(_get_key(domain_id), positions)
+
+
+def get_possible_plates(domain_id, normalized_reg_nums, time_from):
+    """
+    Get the registration numbers which may have rows valid after a time.
+
+    :type normalized_reg_nums: list[str]
+    :type time_from: datetime.datetime
+    :rtype: set[str]
+    :return: The registration numbers found from the filter, or all of
+      them if the filter is not usable for the given time
+    """
+    reg_nums = set(normalized_reg_nums)
+    if not is_enabled() or not reg_nums:
+        return reg_nums
+    positions_by_reg_num = {x: _get_positions(x) for x in reg_nums}
+    all_positions = sorted({
+        position
+        for positions in positions_by_reg_num.values()
+        for position in positions})
+    (covers_from, bits) = _get_storage().get_bits(
+        _get_key(domain_id), all_positions)
+    if covers_from is None or time_from < covers_from:
+        return reg_nums
+    bit_map = dict(zip(all_positions, bits))
+    return {
+        reg_num for (reg_num, positions) in positions_by_reg_num.items()
+        if all(bit_map[position] for position in positions)}
+
+
+def rebuild(domain_id, fetch_reg_nums, grace_duration):
+    """
+    Rebuild the filter of a domain.
+
+    The registration numbers are added to the filter before the commit
+    of their rows, so a row committed after the snapshot of the fetch
+    may have been added only to the replaced filter.  Therefore, after
+    the replace, the rebuild waits for the transactions which were in
+    progress at that moment to end, like CREATE INDEX CONCURRENTLY does,
+    and then re-adds the rows written by the transactions which may be
+    missing from the snapshot.
+
+    :param fetch_reg_nums: Function returning the normalized
+      registration numbers of a domain, see
+      `parkings.check_candidates.fetch_active_reg_nums`
+    :type grace_duration: datetime.timedelta
+    :rtype: int
+    :return: Number of registration numbers in the filter
+    """
+    # Transactions older than the xmin of a snapshot taken before the
+    # fetch have ended before the fetch, so the fetch sees their rows
+    written_since = _get_snapshot_xmin(_get_snapshot())
+    covers_from = timezone.now() - grace_duration
+    (size, hash_count) = _get_dimensions()
+    bits = bytearray(size // 8)
+    count = 0
+    for reg_num in fetch_reg_nums(domain_id, covers_from):
+        if not reg_num:
+            continue
+        for position in get_bit_positions(reg_num, size, hash_count):
+            bits[position >> 3] |= 0x80 >> (position & 7)
+        count += 1
+    _get_storage().replace(_get_key(domain_id), bytes(bits), covers_from)
+    _wait_for_transactions(_get_snapshot())
+    add_plates(domain_id, fetch_reg_nums(
+        domain_id, covers_from, written_since=written_since))
+    return count
+
+
+def _get_snapshot():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_current_snapshot()::text")
+        return cursor.fetchone()[0]
+
+
+def _get_snapshot_xmin(snapshot):
+    """
+    Get the xmin of a snapshot in the text format.
+
+    >>> _get_snapshot_xmin("10:20:10,14,15")
+    10
+    """
+    return int(snapshot.split(":")[0])
+
+
+def _wait_for_transactions(snapshot):
+    """
+    Wait for the transactions in progress at the snapshot to end.
+    """
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(IN_PROGRESS_SQL, [snapshot])
+            if not cursor.fetchone()[0]:
+                return
+        time.sleep(REBUILD_WAIT_INTERVAL)
+
+
+def _get_dimensions():
+    size = getattr(settings, "PARKKIHUBI_PLATE_FILTER_SIZE", 2 ** 23)
+    hash_count = getattr(settings, "PARKKIHUBI_PLATE_FILTER_HASH_COUNT", 7)
+    return (size - size % 8, hash_count)
+
+
+def _get_positions(reg_num):
+    (size, hash_count) = _get_dimensions()
+    return get_bit_positions(reg_num, size, hash_count)
+
+
+def _get_key(domain_id):
+    (size, hash_count) = _get_dimensions()
+    return FILTER_CACHE_KEY.format(
+        domain_id=domain_id, size=size, hash_count=hash_count)
+
+
+def _get_storage():
+    alias = getattr(settings, "PARKKIHUBI_PLATE_FILTER_CACHE_ALIAS", "default")
+    if get_redis_connection is not None:
+        try:
+            client = get_redis_connection(alias)
+        except NotImplementedError:  # Not a django-redis cache
+            pass
+        else:
+            return RedisStorage(client, caches[alias].make_key)
+    return _local_storage
+
+
+class RedisStorage:
+    """
+    Storage of the filters as Redis bitmaps.
+    """
+
+    def __init__(self, client, make_key):
+        self.client = client
+        self.make_key = make_key
+
+    def set_bits(self, key, positions):
+        pipeline = self.client.pipeline(transaction=False)
+        for position in positions:
+            pipeline.setbit(self.make_key(key), position, 1)
+        pipeline.execute()
+
+    def get_bits(self, key, positions):
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.get(self.make_key(key + ":covers_from"))
+        pipeline.exists(self.make_key(key))
+        for position in positions:
+            pipeline.getbit(self.make_key(key), position)
+        (covers_from, exists, *bits) = pipeline.execute()
+        if covers_from is None or not exists:
+            return (None, bits)
+        return (datetime.fromisoformat(covers_from.decode()), bits)
+
+    def replace(self, key, bits, covers_from):
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.set(self.make_key(key), bits)
+        pipeline.set(self.make_key(key + ":covers_from"),
+                     covers_from.isoformat())
+        pipeline.execute()
+
+
+class LocalStorage:
+    """
+    Storage of the filters in the process memory.
+    """
+
+    def __init__(self):
+        self.filters = {}
+        self.lock = threading.Lock()
+
+    def set_bits(self, key, positions):
+        with self.lock:
+            (covers_from, bits) = self.filters.get(key, (None, None))
+            if bits is None:
+                return  # Not built yet
+            for position in positions:
+                bits[position >> 3] |= 0x80 >> (position & 7)
+
+    def get_bits(self, key, positions):
+        with self.lock:
+            (covers_from, bits) = self.filters.get(key, (None, None))
+            if bits is None:
+                return (None, [])
+            return (covers_from, [
+                bits[position >> 3] & (0x80 >> (position & 7))
+                for position in positions])
+
+    def replace(self, key, bits, covers_from):
+        with self.lock:
+            self.filters[key] = (covers_from, bytearray(bits))
+
+    def clear(self):
+        with self.lock:
+            self.filters.clear()
+
+
+_local_storage = LocalStorage()
+
+
+def clear_local_filters():
+    _local_storage.clear()
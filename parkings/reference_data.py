@@ -0,0 +1,254 @@
+"""
+In-process cache of the rarely changing reference data.
+
+Enforcement domains, payment zones, operators, parking terminals and
+the permit area identifiers are needed by almost every write of the
+operator and permit APIs and by the checks of the enforcement API, but
+they change only when an administrator edits them.  Instead of querying
+them for every request, each table is loaded once per process and kept
+in memory.
+
+The cached data is versioned per table.  The version token is stored in
+the Django cache, so that saving or deleting a row of a cached table in
+any process (see `parkings.signals`) makes the other processes reload
+the table on the next lookup, provided that the configured cache is
+shared between the processes.  Changes made without the model signals,
+e.g. with bulk_create or queryset updates, must be followed by a call
+to `invalidate_reference_data`.
+
+Since the cache may also be local to the process, a loaded table is
+kept only for `LOCAL_TTL` seconds and a row missing from the loaded
+table is queried by itself.  Hence rows created in another process are
+found immediately and changed rows are seen after the TTL, while a
+lookup of an unknown key costs a single indexed query.
+
+The returned objects are shared by all the threads of the process and
+must not be modified.
+"""
+import threading
+import time
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_CACHE_KEY = "parkings:reference_data:{table}:version"
+
+# Seconds to keep a loaded table in the process
+LOCAL_TTL = 60
+
+# Model names of the cached tables
+TABLES = [
+    "enforcementdomain",
+    "paymentzone",
+    "operator",
+    "parkingterminal",
+    "permitarea",
+]
+
+_entries = {}
+_entries_lock = threading.Lock()
+
+
+def get_default_domain():
+    """
+    Get the default enforcement domain, creating it if needed.
+
+    :rtype: parkings.models.EnforcementDomain
+    """
+    return _get("enforcementdomain", "default", _load_default_domain)
+
+
+def get_domain(domain_id):
+    """
+    Get enforcement domain by its id.
+
+    :rtype: parkings.models.EnforcementDomain|None
+    """
+    return _get_item(_get_domains()[0], domain_id, lambda: (
+        _model("EnforcementDomain").objects.defer("geom")
+        .filter(pk=domain_id).first()))
+
+
+def get_domain_by_code(code):
+    """
+    Get enforcement domain by its code.
+
+    :rtype: parkings.models.EnforcementDomain|None
+    """
+    return _get_item(_get_domains()[1], code, lambda: (
+        _model("EnforcementDomain").objects.defer("geom")
+        .filter(code=code).first()))
+
+
+def get_payment_zone(domain_id, code):
+    """
+    Get payment zone of an enforcement domain by its code.
+
+    :type code: str
+    :rtype: parkings.models.PaymentZone|None
+    """
+    zones = _model("PaymentZone").objects.filter(
+        domain_id=domain_id).defer("geom")
+    zones_by_code = _get("paymentzone", domain_id, lambda: {
+        zone.code: zone for zone in zones})
+    return _get_item(
+        zones_by_code, code, lambda: zones.filter(code=code).first())
+
+
+def get_operators():
+    """
+    Get all operators by their ids.
+
+    :rtype: dict[uuid.UUID, parkings.models.Operator]
+    """
+    return _get_operators()[0]
+
+
+def get_operator(operator_id):
+    """
+    Get operator by its id.
+
+    :rtype: parkings.models.Operator|None
+    """
+    return _get_item(_get_operators()[0], operator_id, lambda: (
+        _model("Operator").objects.filter(pk=operator_id).first()))
+
+
+def get_operator_of_user(user_id):
+    """
+    Get operator of the given user.
+
+    :rtype: parkings.models.Operator|None
+    """
+    return _get_item(_get_operators()[1], user_id, lambda: (
+        _model("Operator").objects.filter(user_id=user_id).first()))
+
+
+def get_terminal(domain_id, number):
+    """
+    Get parking terminal of an enforcement domain by its number.
+
+    :type number: str
+    :rtype: parkings.models.ParkingTerminal|None
+    """
+    terminals = _model("ParkingTerminal").objects.all()
+    terminals_by_key = _get("parkingterminal", "all", lambda: {
+        (terminal.domain_id, terminal.number): terminal
+        for terminal in terminals})
+    return _get_item(
+        terminals_by_key, (domain_id, str(number)), lambda: (
+            terminals.filter(domain_id=domain_id, number=str(number))
+            .first()))
+
+
+def get_permit_area_identifier_map(domain_id, identifiers=()):
+    """
+    Get mapping from permit area identifiers to ids in given domain.
+
+    :param identifiers:
+      Identifiers which should be in the mapping.  The missing ones are
+      queried and added to the mapping, if found.
+    :rtype: dict[str, int]
+    """
+    areas = _model("PermitArea").objects.filter(domain_id=domain_id)
+    area_ids = _get("permitarea", domain_id, lambda: dict(
+        areas.values_list("identifier", "id")))
+    missing = set(identifiers) - set(area_ids)
+    if missing:
+        found = dict(
+            areas.filter(identifier__in=missing)
+            .values_list("identifier", "id"))
+        with _entries_lock:
+            area_ids.update(found)
+    return area_ids
+
+
+def invalidate_reference_data(*tables):
+    """
+    Make all processes reload the given tables, or all of them.
+    """
+    for table in (tables or TABLES):
+        cache.set(VERSION_CACHE_KEY.format(table=table),
+                  uuid.uuid4().hex, None)
+    with _entries_lock:
+        for key in list(_entries):
+            if not tables or key[0] in tables:
+                del _entries[key]
+
+
+def clear_reference_data():
+    with _entries_lock:
+        _entries.clear()
+
+
+def _get_domains():
+    def load():
+        domains = list(_model("EnforcementDomain").objects.defer("geom"))
+        return (
+            {domain.pk: domain for domain in domains},
+            {domain.code: domain for domain in domains})
+    return _get("enforcementdomain", "all", load)
+
+
+def _get_operators():
+    def load():
+        operators = list(_model("Operator").objects.all())
+        return (
+            {operator.pk: operator for operator in operators},
+            {operator.user_id: operator for operator in operators})
+    return _get("operator", "all", load)
+
+
+def _load_default_domain():
+    (name, code) = settings.DEFAULT_ENFORCEMENT_DOMAIN
+    return _model("EnforcementDomain").objects.get_or_create(
+        code=code, defaults={"name": name})[0]
+
+
+def _get(table, key, load):
+    version = _get_version(table)
+    now = time.monotonic()
+    entry = _entries.get((table, key))
+    if (entry is not None and entry[0] == version
+            and now - entry[1] < LOCAL_TTL):
+        return entry[2]
+    value = load()
+    with _entries_lock:
+        _entries[(table, key)] = (version, now, value)
+    return value
+
+
+def _get_item(items, key, fetch):
+    """
+    Get an item from cached items, fetching it if it is missing.
+
+    The item may have been created in another process after the items
+    were loaded, and the version token of the table is not necessarily
+    shared with that process.  Hence a missing item is queried by its
+    key and added to the items if found.
+
+    :type items: dict
+    :param fetch: Function querying the item or returning None
+    """
+    item = items.get(key)
+    if item is None:
+        item = fetch()
+        if item is not None:
+            with _entries_lock:
+                items[key] = item
+    return item
+
+
+def _get_version(table):
+    key = VERSION_CACHE_KEY.format(table=table)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def _model(name):
+    return apps.get_model("parkings", name)
@@ -6,7 +6,14 @@ from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
-from parkings.models import EventArea, EventAreaStatistics, EventParking
+from parkings.models import (
+    EnforcementDomain, EventArea, EventAreaStatistics, EventParking, Operator,
+    Parking, ParkingTerminal, PaymentZone, Permit, PermitArea)
+from parkings.models.utils import normalize_reg_num
+from parkings.plate_cache import invalidate_plates
+from parkings.plate_filter import add_plates
+from parkings.reference_data import invalidate_reference_data
+from parkings.spatial_index import invalidate_area_index
 
 
 @transaction.atomic
@@ -50,3 +57,58 @@ def event_area_on_delete(sender, **kwargs):
     # Only test event areas can be deleted.
     if obj.is_test:
         EventAreaStatistics.objects.filter(event_area=obj).delete()
+
+
+@receiver(post_save, sender=PaymentZone)
+@receiver(post_save, sender=PermitArea)
+@receiver(post_save, sender=EventArea)
+@receiver(post_delete, sender=PaymentZone)
+@receiver(post_delete, sender=PermitArea)
+@receiver(post_delete, sender=EventArea)
+def area_on_change(sender, **kwargs):
+    domain_id = kwargs["instance"].domain_id
+    invalidate_area_index(domain_id)
+    # Invalidate again after the commit, since the index may have been
+    # rebuilt from the old areas in the meanwhile
+    transaction.on_commit(lambda: invalidate_area_index(domain_id))
+
+
+@receiver(post_save, sender=EnforcementDomain)
+@receiver(post_save, sender=PaymentZone)
+@receiver(post_save, sender=Operator)
+@receiver(post_save, sender=ParkingTerminal)
+@receiver(post_save, sender=PermitArea)
+@receiver(post_delete, sender=EnforcementDomain)
+@receiver(post_delete, sender=PaymentZone)
+@receiver(post_delete, sender=Operator)
+@receiver(post_delete, sender=ParkingTerminal)
+@receiver(post_delete, sender=PermitArea)
+def reference_data_on_change(sender, **kwargs):
+    table = sender._meta.model_name
+    invalidate_reference_data(table)
+    # Invalidate again after the commit, since other processes may
+    # have reloaded the old data in the meanwhile
+    transaction.on_commit(lambda: invalidate_reference_data(table))
+
+
+@receiver(post_save, sender=Parking)
+@receiver(post_save, sender=EventParking)
+@receiver(post_delete, sender=Parking)
+@receiver(post_delete, sender=EventParking)
+def parking_on_change(sender, **kwargs):
+    obj = kwargs["instance"]
+    if kwargs["signal"] is post_save:
+        # Add before the commit, so that the row is never visible
+        # without being in the filter
+        add_plates(obj.domain_id, [obj.normalized_reg_num])
+    transaction.on_commit(lambda: invalidate_plates(
+        obj.domain_id, [obj.normalized_reg_num]))
+
+
+@receiver(post_delete, sender=Permit)
+def permit_on_delete(sender, **kwargs):
+    obj = kwargs["instance"]
+    reg_nums = [
+        normalize_reg_num(subject["registration_number"])
+        for subject in obj.subjects]
+    transaction.on_commit(lambda: invalidate_plates(obj.domain_id, reg_nums))
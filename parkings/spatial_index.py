@@ -0,0 +1,224 @@
+"""
+In-process spatial index of the enforcement area geometries.
+
+The check_parking endpoint has to find the payment zone, permit area
+and event area of the checked location for every request.  These
+geometries change only a few times a year, so instead of asking
+PostGIS each time, the polygons of an enforcement domain are loaded
+once per process into an STR-packed R-tree and the point-in-polygon
+tests are done in memory with prepared GEOS geometries.
+
+The indexes are versioned per domain.  The version token is stored in
+the Django cache, so that saving or deleting a PaymentZone, PermitArea
+or EventArea in any process (see `parkings.signals`) makes the other
+processes rebuild their index on the next lookup, provided that the
+configured cache is shared between the processes.  Since the cache may
+also be local to the process, an index is rebuilt anyway when it is
+older than `LOCAL_TTL` seconds.
+"""
+import math
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import EventArea, PaymentZone, PermitArea
+
+VERSION_CACHE_KEY = "parkings:spatial_index:{domain_id}:version"
+
+# Seconds to keep a built index in the process
+LOCAL_TTL = 60
+
+STRTREE_NODE_CAPACITY = 10
+
+
+class STRtree:
+    """
+    Static R-tree packed with the Sort-Tile-Recursive algorithm.
+
+    The tree is built from (extent, value) pairs, where extent is a
+    tuple (xmin, ymin, xmax, ymax).  Querying a point returns the values
+    whose extents contain the point, so the exact geometry test is left
+    to the caller.
+
+    >>> tree = STRtree([((0, 0, 2, 2), "a"), ((1, 1, 3, 3), "b")])
+    >>> sorted(tree.query_point(1.5, 1.5))
+    ['a', 'b']
+    >>> list(tree.query_point(2.5, 2.5))
+    ['b']
+    >>> list(tree.query_point(5, 5))
+    []
+    """
+
+    def __init__(self, items, node_capacity=STRTREE_NODE_CAPACITY):
+        self.node_capacity = node_capacity
+        level = [(extent, value, True) for (extent, value) in items]
+        while len(level) > 1:
+            level = self._pack(level)
+        self.root = level[0] if level else None
+
+    def _pack(self, nodes):
+        capacity = self.node_capacity
+        node_count = math.ceil(len(nodes) / capacity)
+        slice_count = math.ceil(math.sqrt(node_count))
+        slice_size = slice_count * capacity
+        by_x = sorted(nodes, key=_center_x)
+        parents = []
+        for slice_start in range(0, len(by_x), slice_size):
+            vertical_slice = sorted(
+                by_x[slice_start:slice_start + slice_size], key=_center_y)
+            for start in range(0, len(vertical_slice), capacity):
+                children = vertical_slice[start:start + capacity]
+                parents.append((_union_extent(children), children, False))
+        return parents
+
+    def query_point(self, x, y):
+        if self.root is None:
+            return
+        stack = [self.root]
+        while stack:
+            ((xmin, ymin, xmax, ymax), content, is_leaf) = stack.pop()
+            if not (xmin <= x <= xmax and ymin <= y <= ymax):
+                continue
+            if is_leaf:
+                yield content
+            else:
+                stack.extend(content)
+
+
+def _center_x(node):
+    extent = node[0]
+    return extent[0] + extent[2]
+
+
+def _center_y(node):
+    extent = node[0]
+    return extent[1] + extent[3]
+
+
+def _union_extent(nodes):
+    return (
+        min(node[0][0] for node in nodes),
+        min(node[0][1] for node in nodes),
+        max(node[0][2] for node in nodes),
+        max(node[0][3] for node in nodes),
+    )
+
+
+class AreaIndex:
+    """
+    Spatial index of the areas of a single enforcement domain.
+
+    The lookup methods return the same results as the corresponding
+    PostGIS queries with the ``geom__contains`` filter would.
+    """
+
+    def __init__(self, domain_id, version=None):
+        self.domain_id = domain_id
+        self.version = version
+        self.built_at = time.monotonic()
+        self.payment_zones = self._build(
+            PaymentZone.objects.filter(domain_id=domain_id)
+            .only("id", "number", "geom"))
+        self.permit_areas = self._build(
+            PermitArea.objects.filter(domain_id=domain_id))
+        self.event_areas = self._build(
+            EventArea.objects.filter(domain_id=domain_id))
+
+    @staticmethod
+    def _build(queryset):
+        return STRtree(
+            (obj.geom.extent, (obj.geom.prepared, obj))
+            for obj in queryset)
+
+    def _find(self, tree, location):
+        candidates = tree.query_point(location.x, location.y)
+        return [obj for (prepared, obj) in candidates
+                if prepared.contains(location)]
+
+    def get_payment_zone(self, location):
+        """
+        Get number of the payment zone containing the location.
+
+        If there are several, the one with the highest number wins.
+
+        :rtype: int|None
+        """
+        zones = self._find(self.payment_zones, location)
+        return max((zone.number for zone in zones), default=None)
+
+    def get_permit_area(self, location):
+        """
+        Get the permit area containing the location.
+
+        :rtype: PermitArea|None
+        """
+        areas = self._find(self.permit_areas, location)
+        return min(areas, key=(lambda x: x.identifier), default=None)
+
+    def get_event_area(self, location, now=None):
+        """
+        Get the event area containing the location, if not yet ended.
+
+        :rtype: EventArea|None
+        """
+        now = now or timezone.now()
+        areas = [
+            area for area in self._find(self.event_areas, location)
+            if area.time_end >= now]
+        return min(areas, key=(lambda x: x.pk), default=None)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_area_index(domain):
+    """
+    Get an up-to-date area index of given enforcement domain.
+
+    :type domain: parkings.models.EnforcementDomain
+    :rtype: AreaIndex
+    """
+    domain_id = domain.pk
+    version = _get_version(domain_id)
+    index = _indexes.get(domain_id)
+    if not _is_fresh(index, version):
+        with _indexes_lock:
+            index = _indexes.get(domain_id)
+            if not _is_fresh(index, version):
+                index = AreaIndex(domain_id, version)
+                _indexes[domain_id] = index
+    return index
+
+
+def invalidate_area_index(domain_id):
+    """
+    Make all processes rebuild their area index of given domain.
+    """
+    cache.set(VERSION_CACHE_KEY.format(domain_id=domain_id),
+              uuid.uuid4().hex, None)
+    with _indexes_lock:
+        _indexes.pop(domain_id, None)
+
+
+def clear_area_indexes():
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def _is_fresh(index, version):
+    return (
+        index is not None and index.version == version
+        and time.monotonic() - index.built_at < LOCAL_TTL)
+
+
+def _get_version(domain_id):
+    key = VERSION_CACHE_KEY.format(domain_id=domain_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
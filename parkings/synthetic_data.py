@@ -0,0 +1,438 @@
+"""
+Generation of large synthetic data sets for benchmarking.
+
+The rows of the big tables (parkings, archived parkings and permits with
+their items) are generated in Python and written with PostgreSQL COPY in
+batches, bypassing the model `save` methods and their per-row queries.
+The few rows of the other tables (domains, zones, regions, permit areas,
+operators) are created with the ORM.
+
+The zones, regions and permit areas of a generated domain are laid out
+as a grid over a bounding box, so the zone and region of each generated
+parking can be computed from its location without spatial queries.
+
+The generator reserves primary keys by advancing the sequences, so it
+should not be run while other processes are inserting permits.
+"""
+import io
+import json
+import random
+import string
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import (
+    ArchivedParking, EnforcementDomain, Operator, Parking, PaymentZone, Permit,
+    PermitArea, PermitAreaItem, PermitLookupItem, PermitSeries,
+    PermitSubjectItem, Region)
+from .models.constants import GK25FIN_SRID, WGS84_SRID
+from .models.utils import normalize_reg_num
+from .utils.coordinates import transform_coordinates
+from .utils.uuids import uuid7
+
+# (min longitude, min latitude, max longitude, max latitude)
+DEFAULT_BOUNDS = (24.82, 60.15, 25.05, 60.25)
+
+REG_NUM_LETTERS = string.ascii_uppercase
+REG_NUM_SPACE = len(REG_NUM_LETTERS) ** 3 * 999
+
+PARKING_FIELDS = [
+    "id", "created_at", "modified_at", "location", "location_gk25fin",
+    "operator", "registration_number", "normalized_reg_num", "time_start",
+    "time_end", "domain", "region", "zone", "terminal_number",
+    "is_disc_parking"]
+
+ARCHIVED_PARKING_FIELDS = PARKING_FIELDS + ["archived_at"]
+
+MIN_PARKING_DURATION = 5 * 60
+MEAN_PARKING_DURATION = 90 * 60
+MAX_PARKING_DURATION = 24 * 60 * 60
+
+
+class Grid:
+    """
+    Grid of cells over a rectangle.
+
+    >>> grid = Grid((0.0, 0.0, 30.0, 20.0), columns=3, rows=2)
+    >>> grid.get_cell(25.0, 5.0)
+    2
+    >>> grid.get_cell(30.0, 20.0)
+    5
+    >>> grid.get_cell_bounds(4)
+    (10.0, 10.0, 20.0, 20.0)
+    """
+
+    def __init__(self, bounds, columns, rows):
+        self.bounds = bounds
+        self.columns = columns
+        self.rows = rows
+        self.cell_width = (bounds[2] - bounds[0]) / columns
+        self.cell_height = (bounds[3] - bounds[1]) / rows
+
+    def get_cell(self, x, y):
+        column = min(int((x - self.bounds[0]) / self.cell_width),
+                     self.columns - 1)
+        row = min(int((y - self.bounds[1]) / self.cell_height), self.rows - 1)
+        return row * self.columns + column
+
+    def get_cell_bounds(self, cell):
+        (row, column) = divmod(cell, self.columns)
+        x = self.bounds[0] + column * self.cell_width
+        y = self.bounds[1] + row * self.cell_height
+        return (x, y, x + self.cell_width, y + self.cell_height)
+
+    def get_cell_geometry(self, cell):
+        polygon = Polygon.from_bbox(self.get_cell_bounds(cell))
+        polygon.srid = GK25FIN_SRID
+        return MultiPolygon(polygon, srid=GK25FIN_SRID)
+
+
+class DomainData:
+    """
+    Generated reference data of an enforcement domain.
+    """
+
+    def __init__(self, domain, zone_grid, zones, region_grid, regions,
+                 area_grid, areas, permit_series):
+        self.domain = domain
+        self.zone_grid = zone_grid
+        self.zones = zones
+        self.region_grid = region_grid
+        self.regions = regions
+        self.area_grid = area_grid
+        self.areas = areas
+        self.permit_series = permit_series
+
+
+class SyntheticDataGenerator:
+    """
+    Generator of synthetic domains, parkings and permits.
+
+    :param plate_count: Number of distinct registration numbers used
+    :param time_span: How far to the past the parkings and permits start
+    :type time_span: datetime.timedelta
+    :param open_ended_ratio: Share of the parkings without an end time
+    :param progress: Function called with the model, the number of
+      written rows and the total number of rows after each batch
+    """
+
+    def __init__(self, domain_count=1, domain_prefix="SYN", zone_count=3,
+                 region_grid_size=4, permit_area_count=5, operator_count=5,
+                 plate_count=100000, time_span=timedelta(days=30),
+                 open_ended_ratio=0.05, bounds=DEFAULT_BOUNDS,
+                 batch_size=100000, seed=0, progress=None, using=None):
+        self.domain_count = domain_count
+        self.domain_prefix = domain_prefix
+        self.zone_count = zone_count
+        self.region_grid_size = region_grid_size
+        self.permit_area_count = permit_area_count
+        self.operator_count = operator_count
+        self.plate_count = plate_count
+        self.time_span = time_span
+        self.open_ended_ratio = open_ended_ratio
+        self.bounds = bounds
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.progress = progress or (lambda model, done, total: None)
+        self.using = using or router.db_for_write(Parking)
+        self.now = timezone.now()
+        self.domains = []
+        self.operator_ids = []
+        self.plates = []
+
+    def create_reference_data(self):
+        """
+        Create the domains, their areas, operators and the plate pool.
+        """
+        codes = [
+            "{}{}".format(self.domain_prefix, n + 1)
+            for n in range(self.domain_count)]
+        existing = EnforcementDomain.objects.using(self.using).filter(
+            code__in=codes).values_list("code", flat=True)
+        if existing:
+            raise ValueError("Domains already exist: {}".format(
+                ", ".join(sorted(existing))))
+        gk25_bounds = self._get_gk25_bounds()
+        with transaction.atomic(using=self.using):
+            owner = self._get_user("synthetic_permit_owner")
+            self.domains = [
+                self._create_domain(code, gk25_bounds, owner)
+                for code in codes]
+            self.operator_ids = [
+                Operator.objects.using(self.using).get_or_create(
+                    user=self._get_user("synthetic_operator_{}".format(n + 1)),
+                    defaults={"name": "Synthetic operator {}".format(n + 1)},
+                )[0].pk
+                for n in range(self.operator_count)]
+        self.plates = [
+            format_reg_num(x)
+            for x in self.rng.sample(range(REG_NUM_SPACE), self.plate_count)]
+
+    def _get_gk25_bounds(self):
+        (lon_min, lat_min, lon_max, lat_max) = self.bounds
+        (xs, ys) = transform_coordinates(
+            [lon_min, lon_max, lon_min, lon_max],
+            [lat_min, lat_min, lat_max, lat_max], WGS84_SRID, GK25FIN_SRID)
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def _get_user(self, username):
+        return get_user_model().objects.using(self.using).get_or_create(
+            username=username)[0]
+
+    def _create_domain(self, code, gk25_bounds, owner):
+        domain = EnforcementDomain.objects.using(self.using).create(
+            code=code, name="Synthetic {}".format(code))
+        zone_grid = Grid(gk25_bounds, self.zone_count, 1)
+        zones = PaymentZone.objects.using(self.using).bulk_create([
+            PaymentZone(
+                domain=domain, number=n + 1, code=str(n + 1),
+                name="Zone {}".format(n + 1),
+                geom=zone_grid.get_cell_geometry(n))
+            for n in range(self.zone_count)])
+        size = self.region_grid_size
+        region_grid = Grid(gk25_bounds, size, size)
+        regions = Region.objects.using(self.using).bulk_create([
+            Region(
+                domain=domain, name="Region {}".format(n + 1),
+                capacity_estimate=100, geom=region_grid.get_cell_geometry(n))
+            for n in range(size * size)])
+        area_grid = Grid(gk25_bounds, 1, self.permit_area_count)
+        areas = PermitArea.objects.using(self.using).bulk_create([
+            PermitArea(
+                domain=domain, identifier=get_area_identifier(n),
+                name="Area {}".format(get_area_identifier(n)),
+                geom=area_grid.get_cell_geometry(n))
+            for n in range(self.permit_area_count)])
+        permit_series = PermitSeries.objects.using(self.using).create(
+            active=True, owner=owner)
+        return DomainData(
+            domain, zone_grid, zones, region_grid, regions, area_grid, areas,
+            permit_series)
+
+    def generate_parkings(self, count, archived=False):
+        """
+        Generate parkings, or archived parkings, to the domains.
+
+        :rtype: int
+        :return: Number of generated rows
+        """
+        model = ArchivedParking if archived else Parking
+        field_names = ARCHIVED_PARKING_FIELDS if archived else PARKING_FIELDS
+        written = 0
+        while written < count:
+            size = min(self.batch_size, count - written)
+            rows = self._make_parking_rows(size, archived)
+            with connections[self.using].cursor() as cursor:
+                copy_rows(cursor, model, field_names, rows)
+            written += size
+            self.progress(model, written, count)
+        return written
+
+    def _make_parking_rows(self, count, archived):
+        rng = self.rng
+        domain_data = [rng.choice(self.domains) for _ in range(count)]
+        (min_x, min_y, max_x, max_y) = self.domains[0].zone_grid.bounds
+        gk25_xs = [rng.uniform(min_x, max_x) for _ in range(count)]
+        gk25_ys = [rng.uniform(min_y, max_y) for _ in range(count)]
+        (lons, lats) = transform_coordinates(
+            gk25_xs, gk25_ys, GK25FIN_SRID, WGS84_SRID)
+        open_ended_ratio = 0 if archived else self.open_ended_ratio
+        for (data, x, y, lon, lat) in zip(
+                domain_data, gk25_xs, gk25_ys, lons, lats):
+            reg_num = rng.choice(self.plates)
+            (time_start, time_end) = self._make_parking_times(
+                open_ended_ratio)
+            row = [
+                self._make_uuid(time_start),
+                time_start,
+                time_end or time_start,
+                "SRID={};POINT({:.7f} {:.7f})".format(WGS84_SRID, lon, lat),
+                "SRID={};POINT({:.3f} {:.3f})".format(GK25FIN_SRID, x, y),
+                rng.choice(self.operator_ids),
+                reg_num,
+                normalize_reg_num(reg_num),
+                time_start,
+                time_end,
+                data.domain.pk,
+                data.regions[data.region_grid.get_cell(x, y)].pk,
+                data.zones[data.zone_grid.get_cell(x, y)].pk,
+                "",
+                False,
+            ]
+            if archived:
+                row.append(min(time_end + timedelta(days=1), self.now))
+            yield row
+
+    def _make_uuid(self, created_at):
+        """
+        Make a reproducible UUID like the primary key generator would.
+        """
+        if getattr(settings, "PARKKIHUBI_TIME_ORDERED_UUIDS", False):
+            return uuid7(created_at.timestamp(), self.rng.getrandbits(74))
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def _make_parking_times(self, open_ended_ratio):
+        rng = self.rng
+        time_start = self.now - self.time_span * rng.random()
+        if rng.random() < open_ended_ratio:
+            return (time_start, None)
+        duration = min(max(
+            rng.expovariate(1.0 / MEAN_PARKING_DURATION),
+            MIN_PARKING_DURATION), MAX_PARKING_DURATION)
+        time_end = min(time_start + timedelta(seconds=duration), self.now)
+        return (time_start, time_end)
+
+    def generate_permits(self, count):
+        """
+        Generate permits with a subject and an area to the domains.
+
+        Each permit gets a subject item, an area item and a lookup item.
+
+        :rtype: int
+        :return: Number of generated permits
+        """
+        written = 0
+        while written < count:
+            size = min(self.batch_size, count - written)
+            with transaction.atomic(using=self.using):
+                with connections[self.using].cursor() as cursor:
+                    self._write_permit_batch(cursor, size)
+            written += size
+            self.progress(Permit, written, count)
+        return written
+
+    def _write_permit_batch(self, cursor, count):
+        rng = self.rng
+        permit_ids = reserve_ids(cursor, Permit, count)
+        subject_item_ids = reserve_ids(cursor, PermitSubjectItem, count)
+        area_item_ids = reserve_ids(cursor, PermitAreaItem, count)
+        permits = []
+        subject_items = []
+        area_items = []
+        lookup_items = []
+        for (permit_id, subject_item_id, area_item_id) in zip(
+                permit_ids, subject_item_ids, area_item_ids):
+            data = rng.choice(self.domains)
+            area = rng.choice(data.areas)
+            reg_num = rng.choice(self.plates)
+            start_time = self.now - self.time_span * rng.random()
+            end_time = start_time + timedelta(days=rng.randint(1, 365))
+            (start, end) = (start_time.isoformat(), end_time.isoformat())
+            permits.append([
+                permit_id, start_time, start_time, data.domain.pk,
+                data.permit_series.pk, "SYN-{}".format(permit_id),
+                [{"registration_number": reg_num, "start_time": start,
+                  "end_time": end, "address": None, "zip": None}],
+                [{"area": area.identifier, "start_time": start,
+                  "end_time": end}]])
+            subject_items.append([
+                subject_item_id, permit_id, start_time, end_time, reg_num])
+            area_items.append([
+                area_item_id, permit_id, start_time, end_time, area.pk])
+            lookup_items.append([
+                permit_id, subject_item_id, area_item_id,
+                normalize_reg_num(reg_num), area.pk, start_time, end_time])
+        copy_rows(cursor, Permit, [
+            "id", "created_at", "modified_at", "domain", "series",
+            "external_id", "subjects", "areas"], permits)
+        copy_rows(cursor, PermitSubjectItem, [
+            "id", "permit", "start_time", "end_time", "registration_number",
+        ], subject_items)
+        copy_rows(cursor, PermitAreaItem, [
+            "id", "permit", "start_time", "end_time", "area"], area_items)
+        copy_rows(cursor, PermitLookupItem, [
+            "permit", "subject_item", "area_item", "registration_number",
+            "area", "start_time", "end_time"], lookup_items)
+
+
+def get_area_identifier(index):
+    """
+    Get identifier of a generated permit area.
+
+    >>> [get_area_identifier(x) for x in [0, 1, 25, 26]]
+    ['A', 'B', 'Z', 'A1']
+    """
+    (number, letter_index) = divmod(index, len(string.ascii_uppercase))
+    return string.ascii_uppercase[letter_index] + (
+        str(number) if number else "")
+
+
+def format_reg_num(index):
+    """
+    Format a registration number from its index.
+
+    >>> [format_reg_num(x) for x in [0, 1, 998, 999, REG_NUM_SPACE - 1]]
+    ['AAA-1', 'AAA-2', 'AAA-999', 'AAB-1', 'ZZZ-999']
+    """
+    (letters_index, number_index) = divmod(index, 999)
+    letters = ""
+    for _ in range(3):
+        (letters_index, letter) = divmod(letters_index, len(REG_NUM_LETTERS))
+        letters = REG_NUM_LETTERS[letter] + letters
+    return "{}-{}".format(letters, number_index + 1)
+
+
+def reserve_ids(cursor, model, count):
+    """
+    Reserve a block of consecutive primary keys of a model.
+
+    :rtype: range
+    """
+    table = cursor.db.ops.quote_name(model._meta.db_table)
+    column = model._meta.pk.column
+    cursor.execute(
+        "SELECT setval(pg_get_serial_sequence(%s, %s),"
+        " nextval(pg_get_serial_sequence(%s, %s)) + %s - 1)",
+        [table, column, table, column, count])
+    last_id = cursor.fetchone()[0]
+    return range(last_id - count + 1, last_id + 1)
+
+
+def copy_rows(cursor, model, field_names, rows):
+    """
+    Write rows to the table of a model with COPY.
+
+    :param field_names: Names of the fields in the order of the values
+      of the rows
+    :type rows: Iterable[list]
+    """
+    quote = cursor.db.ops.quote_name
+    columns = [
+        quote(model._meta.get_field(name).column) for name in field_names]
+    data = io.StringIO()
+    for row in rows:
+        data.write("\t".join(format_copy_value(x) for x in row))
+        data.write("\n")
+    data.seek(0)
+    cursor.copy_expert("COPY {table} ({columns}) FROM STDIN".format(
+        table=quote(model._meta.db_table), columns=", ".join(columns)), data)
+
+
+def format_copy_value(value):
+    r"""
+    Format a value for the text format of COPY.
+
+    >>> format_copy_value(None)
+    '\\N'
+    >>> format_copy_value(True)
+    't'
+    >>> format_copy_value([{"a": "b\tc"}])
+    '[{"a": "b\\\\tc"}]'
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value)
+    elif not isinstance(value, str):
+        value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+    return (
+        value.replace("\\", "\\\\").replace("\t", "\\t")
+        .replace("\n", "\\n").replace("\r", "\\r"))
@@ -7,11 +7,16 @@ from datetime import timedelta
 
 import pytest
 from django.contrib.gis.geos import MultiPolygon, Point, Polygon
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
 
 from parkings.api.monitoring.region import WGS84_SRID
+from parkings.check_log import get_writer
 from parkings.factories import EnforcerFactory
 from parkings.factories.parking import create_payment_zone
 from parkings.factories.permit import create_permit_series
@@ -265,6 +270,37 @@ def test_check_parking_not_allowed_multiple_active_parkings_and_permits_permissi
         registration_number=PARKING_DATA["registration_number"]).first().result["allowed"] is False
 
 
+def test_permissions_details_query_count_is_constant(
+        enforcer_api_client, operator, enforcer, parking_factory):
+    domain = enforcer.enforced_domain
+    zone = create_payment_zone(domain=domain)
+    create_payment_zone(geom=create_area_geom(geom=GEOM_2), number=2, code="2", domain=domain)
+    create_permit_area(enforcer_api_client)
+    data = dict(deepcopy(PARKING_DATA), details=["operator", "time_start", "permissions"])
+
+    def add_parking_and_permit():
+        parking_factory(registration_number="ABC-123", operator=operator, zone=zone, domain=domain)
+        create_permit(domain=domain)
+
+    def count_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = enforcer_api_client.post(list_url, data=data)
+        assert response.status_code == HTTP_200_OK
+        return (len(context.captured_queries), response.data)
+
+    add_parking_and_permit()
+    (query_count, _data) = count_queries()
+    for _ in range(4):
+        add_parking_and_permit()
+    (new_query_count, response_data) = count_queries()
+
+    assert new_query_count == query_count
+    assert response_data["allowed"] is True
+    assert response_data["operator"] == operator.name
+    assert response_data["permissions"]["zones"] == [zone.number]
+    assert len(response_data["permissions"]["permits"]) == 5
+
+
 def test_check_event_parking_outside_event_area(
         enforcer_api_client, event_parking_factory, enforcer, event_area_factory):
     event_area = event_area_factory.create(geom=create_area_geom(), domain=enforcer.enforced_domain)
@@ -399,6 +435,34 @@ def test_check_parking_invalid_time_parking(operator, enforcer, enforcer_api_cli
     assert response.data["allowed"] is False
 
 
+@pytest.mark.parametrize("ended_ago, grace_end_time", [
+    (timedelta(minutes=5), True),
+    (timedelta(minutes=20), False),
+])
+def test_check_parking_recently_ended_parking(
+        operator, enforcer, enforcer_api_client, parking_factory,
+        ended_ago, grace_end_time):
+    zone = create_payment_zone(domain=enforcer.enforced_domain)
+    now = timezone.now()
+    parking = parking_factory(
+        registration_number="ABC-123", operator=operator, zone=zone,
+        domain=zone.domain, time_start=now - timedelta(hours=1),
+        time_end=now - ended_ago)
+    data = dict(deepcopy(PARKING_DATA), time=now.isoformat())
+    data["details"] = ["permissions"]
+
+    response = enforcer_api_client.post(list_url, data=data)
+
+    assert response.status_code == HTTP_200_OK
+    assert response.data["allowed"] is False
+    if grace_end_time:
+        assert response.data["end_time"] == parking.time_end
+        assert response.data["permissions"]["zones"] == [zone.number]
+    else:
+        assert response.data["end_time"] is None
+        assert response.data["permissions"]["zones"] == []
+
+
 def test_check_parking_invalid_zone_parking(operator, enforcer_api_client, parking_factory):
     create_payment_zone(geom=create_area_geom(), number=1, code="1")
     zone = create_payment_zone(geom=create_area_geom(geom=GEOM_2), number=2, code="2")
@@ -656,6 +720,52 @@ def test_action_is_logged(enforcer_api_client):
     assert recorded_check.performer
 
 
+@override_settings(
+    PARKKIHUBI_BUFFERED_CHECK_LOGGING=True,
+    PARKKIHUBI_CHECK_LOG_BUFFER_SIZE=10,
+    PARKKIHUBI_CHECK_LOG_FLUSH_INTERVAL=None)
+def test_buffered_action_is_logged_on_flush(enforcer_api_client):
+    response = enforcer_api_client.post(list_url, data=PARKING_DATA)
+
+    assert response.status_code == HTTP_200_OK
+    assert ParkingCheck.objects.count() == 0
+
+    assert get_writer(ParkingCheck).flush() == 1
+    assert ParkingCheck.objects.get().result["allowed"] is False
+
+
+@override_settings(PARKKIHUBI_PLATE_CACHE_TIMEOUT=timedelta(minutes=1))
+def test_cached_result_is_invalidated_by_new_parking(
+        operator, enforcer, enforcer_api_client, parking_factory):
+    zone = create_payment_zone(domain=enforcer.enforced_domain)
+    response = enforcer_api_client.post(list_url, data=PARKING_DATA)
+    assert response.data["allowed"] is False
+
+    parking = parking_factory(
+        registration_number="ABC-123", operator=operator, zone=zone,
+        domain=zone.domain, time_start=timezone.now())
+    response = enforcer_api_client.post(list_url, data=PARKING_DATA)
+
+    assert response.data["allowed"] is True
+    assert response.data["end_time"] == parking.time_end
+
+
+@override_settings(PARKKIHUBI_PLATE_FILTER_ENABLED=True)
+def test_plate_filter_is_kept_up_to_date(
+        operator, enforcer, enforcer_api_client, parking_factory):
+    zone = create_payment_zone(domain=enforcer.enforced_domain)
+    call_command("rebuild_plate_filters", verbosity=0)
+    response = enforcer_api_client.post(list_url, data=PARKING_DATA)
+    assert response.data["allowed"] is False
+
+    parking_factory(
+        registration_number="ABC-123", operator=operator, zone=zone,
+        domain=zone.domain)
+    response = enforcer_api_client.post(list_url, data=PARKING_DATA)
+
+    assert response.data["allowed"] is True
+
+
 def test_enforcer_can_view_only_own_parking(enforcer_api_client, parking_factory, enforcer):
     zone = create_payment_zone(domain=enforcer.enforced_domain)
     parking = parking_factory(registration_number='ABC-123', zone=zone, domain=zone.domain)
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+
+from parkings.factories.parking import create_payment_zone
+from parkings.models import ParkingCheck
+
+from .test_check_parking import (
+    PARKING_DATA, PARKING_DATA_2, create_permit, create_permit_area)
+
+list_url = reverse("enforcement:v1:check_parking_batch")
+single_url = reverse("enforcement:v1:check_parking")
+
+
+def test_results_match_single_checks(
+        operator, enforcer, enforcer_api_client, parking_factory):
+    domain = enforcer.enforced_domain
+    zone = create_payment_zone(domain=domain)
+    parking = parking_factory(
+        registration_number="ABC-123", operator=operator, zone=zone,
+        domain=domain)
+    create_permit_area(enforcer_api_client)
+    create_permit(domain=domain, registration_number="XYZ-987")
+    time = timezone.now()
+    items = [
+        dict(PARKING_DATA, time=time, details=["operator", "permissions"]),
+        dict(PARKING_DATA, registration_number="XYZ-987", time=time),
+        dict(PARKING_DATA_2, time=time),
+        dict(PARKING_DATA, registration_number="NOT-123", time=time),
+    ]
+
+    response = enforcer_api_client.post(list_url, data=items)
+
+    assert response.status_code == HTTP_200_OK
+    assert [x["allowed"] for x in response.data] == [True, True, False, False]
+    assert response.data[0]["end_time"] == parking.time_end
+    assert response.data[0]["operator"] == operator.name
+    for (item, result) in zip(items, response.data):
+        single_response = enforcer_api_client.post(single_url, data=item)
+        assert single_response.data == result
+    assert ParkingCheck.objects.count() == 2 * len(items)
+    assert ParkingCheck.objects.filter(found_parking=parking).count() == 2
+
+
+def test_grace_duration_is_applied_per_item(
+        operator, enforcer, enforcer_api_client, parking_factory):
+    zone = create_payment_zone(domain=enforcer.enforced_domain)
+    now = timezone.now()
+    parking = parking_factory(
+        registration_number="ABC-123", operator=operator, zone=zone,
+        domain=zone.domain, time_start=now - timedelta(hours=2),
+        time_end=now - timedelta(hours=1))
+    items = [
+        dict(PARKING_DATA, time=now - timedelta(minutes=70)),
+        dict(PARKING_DATA, time=now - timedelta(minutes=50)),
+        dict(PARKING_DATA, time=now),
+    ]
+
+    response = enforcer_api_client.post(list_url, data=items)
+
+    assert response.status_code == HTTP_200_OK
+    assert [(x["allowed"], x["end_time"]) for x in response.data] == [
+        (True, parking.time_end),
+        (False, parking.time_end),
+        (False, None),
+    ]
+
+
+def test_empty_batch(enforcer_api_client):
+    response = enforcer_api_client.post(list_url, data=[])
+
+    assert (response.status_code, response.data) == (HTTP_200_OK, [])
+    assert ParkingCheck.objects.count() == 0
+
+
+def test_invalid_item_returns_bad_request(enforcer_api_client):
+    items = [PARKING_DATA, dict(PARKING_DATA, registration_number="")]
+
+    response = enforcer_api_client.post(list_url, data=items)
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert response.data[0] == {}
+    assert "registration_number" in response.data[1]
+    assert ParkingCheck.objects.count() == 0
+
+
+@override_settings(PARKKIHUBI_CHECK_PARKING_BATCH_MAX_SIZE=2)
+def test_batch_size_is_limited(enforcer_api_client):
+    response = enforcer_api_client.post(list_url, data=[PARKING_DATA] * 3)
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert ParkingCheck.objects.count() == 0
+
+
+@override_settings(PARKKIHUBI_CHECK_PARKING_BATCH_MAX_SIZE=2)
+def test_oversized_batch_is_not_validated(enforcer_api_client):
+    response = enforcer_api_client.post(list_url, data=[{}] * 3)
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert response.data == ["At most 2 items can be checked at once."]
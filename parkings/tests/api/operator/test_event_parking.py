@@ -60,7 +60,7 @@ def check_response_data(posted_data, response_data):
         'id', 'registration_number',
         'time_start', 'time_end',
         'location', 'created_at', 'modified_at',
-        'status', 'event_area_id', 'domain',
+        'status', 'event_area_id', 'domain', 'external_id',
     }
 
     posted_data_keys = set(posted_data)
@@ -71,7 +71,7 @@ def check_response_parking_data(posted_parking_data, response_parking_data):
         'terminal_number',
         'time_start', 'time_end',
         'location', 'created_at', 'modified_at',
-        'status', 'domain',
+        'status', 'domain', 'external_id',
     }
 
     posted_data_keys = set(posted_parking_data)
@@ -456,3 +456,40 @@ def test_zone_in_correct_domain_is_set_for_parking(operator_api_client, new_park
 
     assert new_parking_1.zone == zone_1
     assert new_parking_2.zone == zone_2
+
+
+def test_patch_time_end_skips_geo_work(operator_api_client, parking, region):
+    Parking.objects.filter(pk=parking.pk).update(region=region)
+    time_end = '2116-12-10T23:33:29Z'
+
+    response_parking_data = patch(
+        operator_api_client, get_detail_url(parking), {'time_end': time_end})
+
+    assert response_parking_data['time_end'] == time_end
+    updated_parking = Parking.objects.get(pk=parking.pk)
+    assert updated_parking.time_end.strftime('%Y-%m-%dT%H:%M:%SZ') == time_end
+    assert updated_parking.modified_at > parking.modified_at
+    # Region was not resolved again
+    assert updated_parking.region == region
+
+
+def test_patch_time_end_to_null_reopens_parking(operator_api_client, parking):
+    assert parking.time_end is not None
+
+    response_parking_data = patch(
+        operator_api_client, get_detail_url(parking), {'time_end': None})
+
+    assert response_parking_data['time_end'] is None
+    assert Parking.objects.get(pk=parking.pk).time_end is None
+
+
+def test_patch_time_end_before_time_start(operator_api_client, parking):
+    time_end = parking.time_start - datetime.timedelta(hours=1)
+
+    error_data = patch(
+        operator_api_client, get_detail_url(parking),
+        {'time_end': time_end.strftime('%Y-%m-%dT%H:%M:%SZ')}, status_code=400)
+
+    assert error_data['non_field_errors'] == [
+        '"time_start" cannot be after "time_end".']
+    assert Parking.objects.get(pk=parking.pk).time_end == parking.time_end
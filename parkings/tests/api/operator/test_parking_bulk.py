@@ -0,0 +1,226 @@
+import json
+
+import pytest
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from parkings.factories import ParkingAreaFactory, RegionFactory
+from parkings.factories.parking import create_payment_zone
+from parkings.models import EnforcementDomain, Parking, ParkingTerminal
+from parkings.models.constants import GK25FIN_SRID, WGS84_SRID
+
+from ..enforcement.test_check_parking import create_area_geom
+
+bulk_url = reverse('operator:v1:parking-bulk')
+end_url = reverse('operator:v1:parking-end')
+
+
+@pytest.fixture
+def domain():
+    domain = EnforcementDomain.get_default_domain()
+    create_payment_zone(code='1', number=1, domain=domain)
+    create_payment_zone(code='2', number=2, domain=domain)
+    return domain
+
+
+def make_item(n, **kwargs):
+    item = {
+        'zone': 1,
+        'registration_number': 'ABC-{}'.format(n),
+        'time_start': '2016-12-10T20:34:38Z',
+        'time_end': '2016-12-10T23:33:29Z',
+        'location': {'coordinates': [24.9, 60.2], 'type': 'Point'},
+    }
+    item.update(kwargs)
+    return item
+
+
+def post_bulk(api_client, items, status_code=201):
+    response = api_client.post(bulk_url, items, format='json')
+    assert response.status_code == status_code, response.data
+    return response.data
+
+
+def test_parkings_are_created(operator_api_client, operator, domain):
+    items = [make_item(n) for n in range(3)] + [make_item(9, zone='2')]
+
+    data = post_bulk(operator_api_client, items)
+
+    assert data['created'] == 4
+    assert data['failed'] == 0
+    ids = [result['id'] for result in data['results']]
+    parkings = Parking.objects.in_bulk(ids)
+    for (item, parking_id) in zip(items, ids):
+        parking = parkings[parking_id]
+        assert parking.operator == operator
+        assert parking.domain == domain
+        assert parking.zone.code == str(item['zone'])
+        assert parking.registration_number == item['registration_number']
+        assert parking.normalized_reg_num == (
+            item['registration_number'].replace('-', ''))
+        assert parking.location_gk25fin.wkt == parking.location.transform(
+            GK25FIN_SRID, clone=True).wkt
+
+
+def test_ndjson_input(operator_api_client, domain):
+    body = '\n'.join(json.dumps(make_item(n)) for n in range(2)) + '\n'
+
+    response = operator_api_client.post(
+        bulk_url, body, content_type='application/x-ndjson')
+
+    assert response.status_code == 201, response.data
+    assert response.data['created'] == 2
+    assert Parking.objects.count() == 2
+
+
+def test_invalid_ndjson_is_rejected(operator_api_client, domain):
+    body = json.dumps(make_item(1)) + '\n{"zone": \n'
+
+    response = operator_api_client.post(
+        bulk_url, body, content_type='application/x-ndjson')
+
+    assert response.status_code == 400
+    assert str(response.data['detail']).startswith(
+        'NDJSON parse error on line 2:')
+    assert not Parking.objects.exists()
+
+
+def test_errors_are_reported_per_item(operator_api_client, domain):
+    items = [
+        make_item(1),
+        make_item(2, zone=99),
+        make_item(3, domain='NONE'),
+        make_item(4, time_end='2016-12-10T20:00:00Z'),
+        'not a parking',
+        make_item(5, registration_number=None),
+    ]
+
+    data = post_bulk(operator_api_client, items, status_code=200)
+
+    assert data['created'] == 1
+    assert data['failed'] == 5
+    results = data['results']
+    assert set(results[0]) == {'id'}
+    assert results[1] == {'errors': {
+        'zone': ['Object with code=99 does not exist.']}}
+    assert results[2]['errors']['domain'] == [
+        'Object with code=NONE does not exist.']
+    assert results[3] == {'errors': {
+        'non_field_errors': ['"time_start" cannot be after "time_end".']}}
+    assert results[4] == {'errors': {'non_field_errors': [
+        'Invalid data. Expected a dictionary, but got str.']}}
+    assert list(results[5]['errors']) == ['registration_number']
+    assert Parking.objects.get().pk == results[0]['id']
+
+
+def test_all_failed_is_bad_request(operator_api_client, domain):
+    data = post_bulk(
+        operator_api_client, [make_item(1, zone=99)], status_code=400)
+
+    assert data['created'] == 0
+    assert data['failed'] == 1
+
+
+def test_non_list_is_rejected(operator_api_client, domain):
+    data = post_bulk(operator_api_client, make_item(1), status_code=400)
+
+    assert data == ['Expected a list of parkings.']
+
+
+@override_settings(PARKKIHUBI_OPERATOR_PARKING_BULK_MAX_SIZE=2)
+def test_too_many_items_are_rejected(operator_api_client, domain):
+    data = post_bulk(
+        operator_api_client, [make_item(n) for n in range(3)],
+        status_code=400)
+
+    assert data == ['At most 2 parkings can be processed at once.']
+    assert not Parking.objects.exists()
+
+
+def test_terminal_region_and_area_are_resolved(operator_api_client, domain):
+    terminal = ParkingTerminal.objects.create(
+        number='4567', name="Test terminal", domain=domain,
+        location=Point(24.95, 60.2, srid=WGS84_SRID))
+    region = RegionFactory(domain=domain, geom=create_area_geom())
+    area = ParkingAreaFactory(domain=domain, geom=create_area_geom())
+    items = [
+        make_item(1, location=None, terminal_number='4567'),
+        make_item(2),
+        make_item(3, location={'coordinates': [26.0, 64.0], 'type': 'Point'}),
+        make_item(4, location=None),
+    ]
+
+    data = post_bulk(operator_api_client, items)
+
+    parkings = [Parking.objects.get(pk=x['id']) for x in data['results']]
+    assert parkings[0].terminal == terminal
+    assert parkings[0].location == terminal.location
+    assert [x.region for x in parkings] == [region, region, None, None]
+    assert [x.parking_area for x in parkings] == [area, area, None, None]
+
+
+def test_query_count_does_not_depend_on_item_count(
+        operator_api_client, domain):
+    RegionFactory(domain=domain, geom=create_area_geom())
+    post_bulk(operator_api_client, [make_item(0)])
+
+    query_counts = []
+    for count in [1, 20]:
+        with CaptureQueriesContext(connection) as context:
+            post_bulk(operator_api_client, [
+                make_item(n, terminal_number=str(n)) for n in range(count)])
+        query_counts.append(len(context.captured_queries))
+
+    assert query_counts[0] == query_counts[1]
+
+
+def test_end_times_are_set(operator_api_client, operator, region, parking_factory):
+    parkings = parking_factory.create_batch(
+        3, operator=operator, time_end=None)
+    Parking.objects.filter(pk=parkings[0].pk).update(region=region)
+    time_end = '2116-12-10T23:33:29Z'
+    items = [{'id': str(x.pk), 'time_end': time_end} for x in parkings[:2]]
+
+    response = operator_api_client.post(end_url, items, format='json')
+
+    assert response.status_code == 200, response.data
+    assert response.data['updated'] == 2
+    assert response.data['failed'] == 0
+    assert [x['id'] for x in response.data['results']] == [
+        parkings[0].pk, parkings[1].pk]
+    ended = Parking.objects.filter(time_end__isnull=False)
+    assert set(ended.values_list('pk', flat=True)) == {
+        parkings[0].pk, parkings[1].pk}
+    assert Parking.objects.get(pk=parkings[0].pk).region == region
+
+
+def test_end_time_errors_are_reported_per_item(
+        operator_api_client, operator, operator_2, parking_factory):
+    parking = parking_factory(operator=operator)
+    other_parking = parking_factory(operator=operator_2)
+    items = [
+        {'id': str(parking.pk), 'time_end': '2116-12-10T23:33:29Z'},
+        {'id': str(other_parking.pk), 'time_end': '2116-12-10T23:33:29Z'},
+        {'id': str(parking.pk), 'time_end': '2000-01-01T00:00:00Z'},
+        {'id': 'abc', 'time_end': '2116-12-10T23:33:29Z'},
+    ]
+
+    response = operator_api_client.post(end_url, items[1:], format='json')
+
+    assert response.status_code == 400
+    assert response.data['results'] == [
+        {'id': other_parking.pk, 'errors': {'id': ['Parking not found.']}},
+        {'id': parking.pk, 'errors': {'non_field_errors': [
+            '"time_start" cannot be after "time_end".']}},
+        {'errors': {'id': ['Must be a valid UUID.']}},
+    ]
+    assert Parking.objects.get(pk=other_parking.pk).time_end == (
+        other_parking.time_end)
+
+    response = operator_api_client.post(end_url, items[:2], format='json')
+
+    assert response.status_code == 200
+    assert (response.data['updated'], response.data['failed']) == (1, 1)
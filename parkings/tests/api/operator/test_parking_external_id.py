@@ -0,0 +1,187 @@
+import datetime
+
+import pytest
+from django.conf import settings
+from django.db import IntegrityError
+from django.urls import reverse
+from freezegun import freeze_time
+
+from parkings.api.common import save_with_unique_external_id
+from parkings.factories.parking import create_payment_zone
+from parkings.models import EnforcementDomain, Parking
+
+from ..utils import post, put
+
+list_url = reverse('operator:v1:parking-list')
+bulk_url = reverse('operator:v1:parking-bulk')
+
+
+def get_external_url(external_id):
+    return reverse('operator:v1:parking-external', kwargs={
+        'external_id': external_id})
+
+
+@pytest.fixture(autouse=True)
+def zones():
+    domain = EnforcementDomain.get_default_domain()
+    return [
+        create_payment_zone(code=str(n), number=n, domain=domain)
+        for n in [1, 2]]
+
+
+@pytest.fixture
+def parking_data():
+    return {
+        'zone': 1,
+        'registration_number': 'ABC-123',
+        'time_start': '2016-12-10T20:34:38Z',
+        'time_end': None,
+        'location': {'coordinates': [24.9, 60.2], 'type': 'Point'},
+    }
+
+
+def test_upsert_creates_and_updates(operator_api_client, operator, parking_data):
+    url = get_external_url('ext-1')
+
+    created_data = put(operator_api_client, url, parking_data, 201)
+
+    parking = Parking.objects.get()
+    assert created_data['id'] == str(parking.pk)
+    assert created_data['external_id'] == 'ext-1'
+    assert parking.operator == operator
+    assert parking.external_id == 'ext-1'
+    assert parking.normalized_reg_num == 'ABC123'
+    assert parking.location_gk25fin is not None
+
+    parking_data.update(
+        zone=2, registration_number='XYZ-987',
+        time_end='2016-12-10T23:33:29Z')
+    updated_data = put(operator_api_client, url, parking_data, 200)
+
+    assert updated_data['id'] == created_data['id']
+    assert updated_data['created_at'] == created_data['created_at']
+    parking = Parking.objects.get()
+    assert parking.zone.code == '2'
+    assert parking.normalized_reg_num == 'XYZ987'
+    assert parking.time_end.hour == 23
+
+
+def test_upsert_is_idempotent(operator_api_client, parking_data):
+    url = get_external_url('ext-1')
+
+    put(operator_api_client, url, parking_data, 201)
+    put(operator_api_client, url, parking_data, 200)
+
+    assert Parking.objects.count() == 1
+
+
+def test_external_ids_are_operator_specific(
+        operator_api_client, operator_2_api_client, parking_data):
+    url = get_external_url('ext-1')
+
+    first = put(operator_api_client, url, parking_data, 201)
+    second = put(operator_2_api_client, url, parking_data, 201)
+
+    assert first['id'] != second['id']
+    assert Parking.objects.count() == 2
+
+
+def test_only_time_end_can_be_changed_after_grace_period(
+        operator_api_client, parking_data):
+    url = get_external_url('ext-1')
+    start_time = datetime.datetime(2010, 1, 1, 12, 00)
+    with freeze_time(start_time):
+        put(operator_api_client, url, parking_data, 201)
+
+    end_time = (
+        start_time + settings.PARKKIHUBI_TIME_PARKINGS_EDITABLE
+        + datetime.timedelta(minutes=1))
+    with freeze_time(end_time):
+        error_data = put(
+            operator_api_client, url,
+            dict(parking_data, registration_number='XYZ-987'), 403)
+        assert error_data['code'] == 'grace_period_over'
+
+        put(operator_api_client, url,
+            dict(parking_data, time_end='2016-12-12T23:33:29Z'), 200)
+
+    parking = Parking.objects.get()
+    assert parking.registration_number == 'ABC-123'
+    assert parking.time_end.day == 12
+
+
+def test_upsert_validates_data(operator_api_client, parking_data):
+    put(operator_api_client, get_external_url('ext-1'),
+        dict(parking_data, zone=99), 400)
+
+    assert not Parking.objects.exists()
+
+
+def test_taken_external_id_cannot_be_created(operator_api_client, parking_data):
+    post(operator_api_client, list_url, dict(parking_data, external_id='x'))
+
+    error_data = post(
+        operator_api_client, list_url, dict(parking_data, external_id='x'),
+        400)
+
+    assert error_data == {
+        'external_id': ['Parking with this external id already exists.']}
+    assert Parking.objects.count() == 1
+
+
+def test_taken_external_ids_are_reported_in_bulk(
+        operator_api_client, parking_data):
+    put(operator_api_client, get_external_url('x'), parking_data, 201)
+    items = [
+        dict(parking_data, external_id='x'),
+        dict(parking_data, external_id='y'),
+        dict(parking_data, external_id='y'),
+        parking_data,
+    ]
+
+    response = operator_api_client.post(bulk_url, items, format='json')
+
+    assert response.status_code == 200
+    results = response.data['results']
+    error = {'external_id': ['Parking with this external id already exists.']}
+    assert [x.get('errors') for x in results] == [error, None, error, None]
+    assert Parking.objects.count() == 3
+
+
+def test_concurrently_taken_external_ids_are_reported_in_bulk(
+        monkeypatch, operator_api_client, operator, parking_factory,
+        parking_data):
+    create_in_bulk = Parking.create_in_bulk
+    concurrent = []
+
+    def create_after_concurrent_request(parkings):
+        if not concurrent:
+            # Taken by a concurrent request after the external id check
+            concurrent.append(parking_factory(operator=operator, external_id='y'))
+        return create_in_bulk(parkings)
+
+    monkeypatch.setattr(Parking, 'create_in_bulk', create_after_concurrent_request)
+    items = [
+        dict(parking_data, external_id='x'),
+        dict(parking_data, external_id='y'),
+        parking_data,
+    ]
+
+    response = operator_api_client.post(bulk_url, items, format='json')
+
+    assert response.status_code == 200
+    results = response.data['results']
+    error = {'external_id': ['Parking with this external id already exists.']}
+    assert [x.get('errors') for x in results] == [None, error, None]
+    assert Parking.objects.count() == 3
+    assert Parking.objects.get(external_id='y') == concurrent[0]
+
+
+@pytest.mark.django_db
+def test_other_integrity_errors_are_not_reported_as_taken():
+    class FailingSerializer:
+        def save(self, **kwargs):
+            raise IntegrityError('null value in column "external_id"')
+
+    with pytest.raises(IntegrityError):
+        save_with_unique_external_id(FailingSerializer())
@@ -0,0 +1,145 @@
+import io
+import json
+
+import pytest
+from django.db import IntegrityError
+from django.test import override_settings
+from django.urls import reverse
+
+from parkings.factories.parking import create_payment_zone
+from parkings.models import EnforcementDomain, Parking
+
+from .test_parking_bulk import make_item
+
+stream_url = reverse('operator:v1:parking-stream')
+
+
+@pytest.fixture(autouse=True)
+def zone():
+    return create_payment_zone(
+        code='1', number=1, domain=EnforcementDomain.get_default_domain())
+
+
+def post_stream(api_client, events):
+    body = ''.join(
+        (x if isinstance(x, str) else json.dumps(x)) + '\n' for x in events)
+    response = api_client.post(
+        stream_url, body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/x-ndjson'
+    content = b''.join(response.streaming_content).decode('utf-8')
+    return [json.loads(line) for line in content.splitlines()]
+
+
+def test_events_are_applied(operator_api_client, operator, parking_factory):
+    parking = parking_factory(operator=operator, time_end=None)
+    events = [
+        dict(make_item(1), op='create'),
+        dict(make_item(2, external_id='ext'), op='upsert'),
+        {'op': 'end', 'id': str(parking.pk), 'time_end': '2116-12-10T23:33:29Z'},
+        dict(make_item(3, external_id='ext'), op='upsert'),
+    ]
+
+    acks = post_stream(operator_api_client, events)
+
+    assert [(x['line'], x['op']) for x in acks] == [
+        (1, 'create'), (2, 'upsert'), (3, 'end'), (4, 'upsert')]
+    assert not any('errors' in x for x in acks)
+    assert (acks[1]['created'], acks[3]['created']) == (True, False)
+    assert acks[1]['id'] == acks[3]['id']
+    assert acks[2]['id'] == str(parking.pk)
+    upserted = Parking.objects.get(external_id='ext')
+    assert upserted.registration_number == 'ABC-3'
+    assert Parking.objects.get(pk=acks[0]['id']).registration_number == 'ABC-1'
+    assert Parking.objects.get(pk=parking.pk).time_end.year == 2116
+
+
+def test_errors_are_acknowledged_per_event(operator_api_client):
+    events = [
+        '{"op": ',
+        make_item(1),
+        dict(make_item(2, zone=99), op='create'),
+        dict(make_item(3), op='upsert'),
+        {'op': 'end', 'id': '2b3ad5c0-7c58-4e4d-b2cd-5d32a12f0d3a',
+         'time_end': '2116-12-10T23:33:29Z'},
+        '',
+        dict(make_item(4), op='create'),
+    ]
+
+    acks = post_stream(operator_api_client, events)
+
+    assert [x['line'] for x in acks] == [1, 2, 3, 4, 5, 7]
+    assert acks[0]['errors']['non_field_errors'][0].startswith(
+        'JSON parse error - ')
+    assert acks[1]['errors'] == {'op': ['Expected "create", "upsert" or "end".']}
+    assert acks[2]['errors'] == {
+        'zone': ['Object with code=99 does not exist.']}
+    assert acks[3]['errors'] == {'external_id': ['This field is required.']}
+    assert acks[4]['errors'] == {'id': ['Parking not found.']}
+    assert 'errors' not in acks[5]
+    assert str(Parking.objects.get().pk) == acks[5]['id']
+
+
+@override_settings(PARKKIHUBI_OPERATOR_PARKING_STREAM_BATCH_SIZE=2)
+def test_events_are_applied_in_batches(operator_api_client):
+    events = [dict(make_item(n), op='create') for n in range(5)]
+
+    acks = post_stream(operator_api_client, events)
+
+    assert [x['line'] for x in acks] == [1, 2, 3, 4, 5]
+    assert Parking.objects.filter(pk__in=[x['id'] for x in acks]).count() == 5
+
+
+@override_settings(PARKKIHUBI_OPERATOR_PARKING_STREAM_BATCH_SIZE=2)
+def test_failed_batch_is_acknowledged_with_errors(operator_api_client, monkeypatch):
+    create_in_bulk = Parking.create_in_bulk
+    calls = []
+
+    def fail_second_batch(parkings):
+        calls.append(parkings)
+        if len(calls) == 2:
+            raise IntegrityError("duplicate key value")
+        return create_in_bulk(parkings)
+
+    monkeypatch.setattr(Parking, 'create_in_bulk', fail_second_batch)
+    events = [dict(make_item(n), op='create') for n in range(5)]
+
+    acks = post_stream(operator_api_client, events)
+
+    assert [x['line'] for x in acks] == [1, 2, 3, 4, 5]
+    assert ['errors' in x for x in acks] == [False, False, True, True, False]
+    assert acks[2]['errors'] == {'non_field_errors': [
+        'The batch of this event failed and it was not applied.']}
+    assert Parking.objects.count() == 3
+
+
+def test_chunked_stream_is_applied(operator_api_client):
+    events = [dict(make_item(n), op='create') for n in range(2)]
+    body = ''.join(json.dumps(x) + '\n' for x in events).encode('utf-8')
+
+    response = operator_api_client.generic(
+        'POST', stream_url, body, content_type='application/x-ndjson',
+        CONTENT_LENGTH='', HTTP_TRANSFER_ENCODING='chunked',
+        **{'wsgi.input': io.BytesIO(body)})
+
+    assert response.status_code == 200
+    content = b''.join(response.streaming_content).decode('utf-8')
+    acks = [json.loads(line) for line in content.splitlines()]
+    assert [x['line'] for x in acks] == [1, 2]
+    assert Parking.objects.count() == 2
+
+
+def test_stream_without_length_is_rejected(operator_api_client):
+    response = operator_api_client.generic(
+        'POST', stream_url, b'{}\n', content_type='application/x-ndjson',
+        CONTENT_LENGTH='')
+
+    assert response.status_code == 411
+    assert Parking.objects.count() == 0
+
+
+def test_stream_requires_operator(user_api_client):
+    response = user_api_client.post(
+        stream_url, '', content_type='application/x-ndjson')
+
+    assert response.status_code == 403
@@ -137,6 +137,17 @@ def test_activate_with_empty_payload(
     assert PermitSeries.objects.filter(active=False).count() == 0
 
 
+def test_activate_updates_modified_at(operator_api_client, operator):
+    series = PermitSeries.objects.create(owner=operator.user, active=False)
+    modified_at = series.modified_at
+
+    response = operator_api_client.post(get_activate_url(series))
+
+    assert response.status_code == HTTP_200_OK
+    series.refresh_from_db()
+    assert series.modified_at > modified_at
+
+
 def test_activate_wont_deactivate_enforcer_series(
     operator_api_client, operator, staff_user
 ):
@@ -0,0 +1,116 @@
+from django.urls import reverse
+from rest_framework.status import (
+    HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND)
+
+from parkings.models import Permit, PermitSeries
+
+from ....factories.permit import (
+    create_permit, create_permit_series, generate_areas, generate_subjects)
+
+
+def get_clone_url(series):
+    return reverse(
+        'operator:v1:permitseries-clone', kwargs={'pk': series.pk})
+
+
+def create_series_with_permits(operator, external_ids):
+    series = create_permit_series(owner=operator.user)
+    for external_id in external_ids:
+        create_permit(
+            series=series, external_id=external_id, owner=operator.user)
+    return series
+
+
+def make_permit_data(external_id, operator, domain):
+    return {
+        'external_id': external_id,
+        'domain': domain.code,
+        'subjects': generate_subjects(),
+        'areas': generate_areas(domain, allowed_user=operator.user),
+    }
+
+
+def test_series_is_cloned_with_delta(operator_api_client, operator):
+    series = create_series_with_permits(operator, ['a', 'b', 'c'])
+    domain = Permit.objects.first().domain
+    changed = make_permit_data('b', operator, domain)
+    added = make_permit_data('d', operator, domain)
+
+    response = operator_api_client.post(get_clone_url(series), data={
+        'permits': [changed, added],
+        'removed': ['c'],
+    }, format='json')
+
+    assert response.status_code == HTTP_201_CREATED
+    new_series = PermitSeries.objects.get(pk=response.data['id'])
+    assert not new_series.active
+    assert new_series.owner == operator.user
+    new_permits = {x.external_id: x for x in new_series.permit_set.all()}
+    assert set(new_permits) == {'a', 'b', 'd'}
+    old_a = series.permit_set.get(external_id='a')
+    assert new_permits['a'].subjects == old_a.subjects
+    assert new_permits['a'].areas == old_a.areas
+    assert new_permits['a'].lookup_items.count() == old_a.lookup_items.count()
+    assert new_permits['b'].subjects == changed['subjects']
+    assert new_permits['d'].subjects == added['subjects']
+    assert series.permit_set.count() == 3
+
+
+def test_cloned_items_refer_to_cloned_permits(operator):
+    series = create_series_with_permits(operator, ['a'])
+
+    new_series = series.clone()
+
+    permit = new_series.permit_set.get()
+    lookup_items = list(permit.lookup_items.all())
+    assert lookup_items
+    assert all(x.subject_item.permit_id == permit.pk for x in lookup_items)
+    assert all(x.area_item.permit_id == permit.pk for x in lookup_items)
+    assert permit.subject_items.count() == 2
+    assert permit.area_items.count() == 3
+
+
+def test_invalid_delta_creates_no_series(operator_api_client, operator):
+    series = create_series_with_permits(operator, ['a'])
+    domain = Permit.objects.first().domain
+    invalid = dict(make_permit_data('b', operator, domain), areas=[{
+        'area': 'XX', 'start_time': '2019-05-01T12:00:00+00:00',
+        'end_time': '2019-05-30T12:00:00+00:00'}])
+
+    response = operator_api_client.post(get_clone_url(series), data={
+        'permits': [make_permit_data('a', operator, domain), invalid],
+    }, format='json')
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert response.data['permits'][0] == {}
+    assert 'areas' in response.data['permits'][1]
+    assert PermitSeries.objects.count() == 1
+
+
+def test_delta_permits_need_unique_external_ids(operator_api_client, operator):
+    series = create_series_with_permits(operator, ['a'])
+    domain = Permit.objects.first().domain
+    permit = make_permit_data('b', operator, domain)
+
+    duplicate_response = operator_api_client.post(get_clone_url(series), data={
+        'permits': [permit, permit],
+    }, format='json')
+    missing_response = operator_api_client.post(get_clone_url(series), data={
+        'permits': [dict(permit, external_id=None)],
+    }, format='json')
+
+    assert duplicate_response.status_code == HTTP_400_BAD_REQUEST
+    assert duplicate_response.data['permits'] == ['Duplicate external ids: b']
+    assert missing_response.status_code == HTTP_400_BAD_REQUEST
+    assert missing_response.data['permits'] == [
+        'Every permit must have an external id']
+    assert PermitSeries.objects.count() == 1
+
+
+def test_series_of_other_operator_cannot_be_cloned(
+        operator_api_client, operator_2):
+    series = create_series_with_permits(operator_2, ['a'])
+
+    response = operator_api_client.post(get_clone_url(series), data={})
+
+    assert response.status_code == HTTP_404_NOT_FOUND
@@ -49,6 +49,13 @@ def test_filter_time_start(api_client, archived_parking):
     assert data['count'] == 0
 
 
+def test_filter_time_start_includes_unended(api_client, archived_parking_factory):
+    parking = archived_parking_factory(time_end=None)
+    time_start_str = datetime.strftime(parking.time_start - timedelta(hours=1), '%Y-%m-%dT%H:%M:%S.%fZ')
+    data = get(api_client, list_url + f'?time_start__gte={time_start_str}')
+    assert data['count'] == 1
+
+
 def test_filter_archived_at(api_client, archived_parking):
     archived_at_str = datetime.strftime(archived_parking.archived_at + timedelta(hours=1), '%Y-%m-%dT%H:%M:%S.%fZ')
     data = get(api_client, list_url + f'?archived_at__gte={archived_at_str}')
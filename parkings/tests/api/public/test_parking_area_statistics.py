@@ -67,7 +67,7 @@ def test_overlapping_event_areas(api_client, parking_factory, enforcer, operator
     stats_data = find_by_obj_id(parking_area, results)
     assert stats_data['current_parking_count'] == 0
 
-    with patch('parkings.models.parking.get_closest_area', return_value=parking_area):
+    with patch('parkings.models.parking.get_region_and_area', return_value=(None, parking_area.pk)):
         parking_factory.create_batch(4)
 
     results = get(api_client, list_url)['results']
@@ -135,16 +135,16 @@ def test_list_endpoint_base_fields(api_client):
 def test_get_list_check_data(api_client, parking_factory, parking_area_factory, history_parking_factory):
     parking_area_1, parking_area_2, parking_area_3, parking_area_4 = parking_area_factory.create_batch(4)
 
-    with patch('parkings.models.parking.get_closest_area', return_value=parking_area_1):
+    with patch('parkings.models.parking.get_region_and_area', return_value=(None, parking_area_1.pk)):
         parking_factory.create_batch(4)
 
-    with patch('parkings.models.parking.get_closest_area', return_value=parking_area_2):
+    with patch('parkings.models.parking.get_region_and_area', return_value=(None, parking_area_2.pk)):
         parking_factory.create_batch(3)
 
-    with patch('parkings.models.parking.get_closest_area', return_value=parking_area_3):
+    with patch('parkings.models.parking.get_region_and_area', return_value=(None, parking_area_3.pk)):
         history_parking_factory.create_batch(5)
 
-    with patch('parkings.models.parking.get_closest_area', return_value=parking_area_4):
+    with patch('parkings.models.parking.get_region_and_area', return_value=(None, parking_area_4.pk)):
         history_parking_factory.create_batch(5, time_end=None)
 
     results = get(api_client, list_url)['results']
@@ -163,14 +163,14 @@ def test_get_list_check_data(api_client, parking_factory, parking_area_factory,
 
 
 def test_get_detail_check_data(api_client, parking_factory, parking_area):
-    with patch('parkings.models.parking.get_closest_area', return_value=parking_area):
+    with patch('parkings.models.parking.get_region_and_area', return_value=(None, parking_area.pk)):
         parking_factory.create_batch(3)
 
     stats_data = get(api_client, get_detail_url(parking_area))
     assert stats_data.keys() == {'id', 'current_parking_count'}
     assert stats_data['current_parking_count'] == 0
 
-    with patch('parkings.models.parking.get_closest_area', return_value=parking_area):
+    with patch('parkings.models.parking.get_region_and_area', return_value=(None, parking_area.pk)):
         parking_factory()
 
     stats_data = get(api_client, get_detail_url(parking_area))
@@ -1,6 +1,8 @@
 import pytest
+from django.core.cache import cache
 from pytest_factoryboy import register
 
+from parkings.check_log import reset_writers
 from parkings.factories import (
     AdminUserFactory, ArchivedParkingFactory, CompleteEventParkingFactory,
     DataUserFactory, DiscParkingFactory, EnforcementDomainFactory,
@@ -8,6 +10,10 @@ from parkings.factories import (
     EventParkingFactory, HistoryEventParkingFactory, HistoryParkingFactory,
     MonitorFactory, OperatorFactory, ParkingAreaFactory, ParkingCheckFactory,
     ParkingFactory, RegionFactory, StaffUserFactory, UserFactory)
+from parkings.plate_cache import clear_local_entries
+from parkings.plate_filter import clear_local_filters
+from parkings.reference_data import clear_reference_data
+from parkings.spatial_index import clear_area_indexes
 
 register(OperatorFactory)
 register(ParkingFactory, 'parking')
@@ -35,3 +41,15 @@ register(DataUserFactory)
 def set_faker_random_seed():
     from parkings.factories.faker import fake
     fake.seed(777)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # The database is flushed between the tests without sending any
+    # signals, so the process-wide caches must be cleared explicitly
+    cache.clear()
+    clear_area_indexes()
+    reset_writers()
+    clear_local_entries()
+    clear_local_filters()
+    clear_reference_data()
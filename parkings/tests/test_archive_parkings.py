@@ -1,14 +1,19 @@
+import copy
 import datetime
 
 import pytest
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management import call_command
+from django.db import connection, models
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from parkings.factories import (
     CompleteHistoryParkingFactory, CompleteParkingFactory)
 from parkings.management.commands import archive_parkings
 from parkings.models import ArchivedParking, Parking
+from parkings.models.parking import _get_set_null_cte_sql
 from parkings.tests.utils import call_mgmt_cmd_with_output
 
 admin_timezone_override = override_settings(ADMIN_TIME_ZONE=None)
@@ -148,3 +153,37 @@ def test_archive_parkings_mgmt_cmd_dry_run(dry_run_enabled, expected_line):
     else:
         assert still_alive_parkings.count() == 0
         assert ArchivedParking.objects.count() == 10
+
+
+@pytest.mark.django_db
+def test_archive_in_bulk_moves_parkings_in_one_statement(
+        parking_check_factory):
+    parkings = create_ended_parkings(3)
+    check = parking_check_factory(found_parking=parkings[0])
+    to_archive = Parking.objects.filter(pk__in=[x.pk for x in parkings[:2]])
+
+    with CaptureQueriesContext(connection) as queries:
+        (archived, count) = ArchivedParking.archive_in_bulk(to_archive)
+
+    assert len([x for x in queries if 'SAVEPOINT' not in x['sql']]) == 1
+    assert count == 2
+    assert set(archived) == set(ArchivedParking.objects.all())
+    assert {x.pk for x in archived} == {x.pk for x in parkings[:2]}
+    assert {x.registration_number for x in archived} == {''}
+    assert list(Parking.objects.all()) == [parkings[2]]
+    check.refresh_from_db()
+    assert check.found_parking is None
+
+
+def test_unsupported_relation_is_reported_by_name():
+    relation = copy.copy(next(
+        x for x in Parking._meta.related_objects
+        if x.on_delete is models.SET_NULL))
+    relation.on_delete = models.CASCADE
+
+    with pytest.raises(ImproperlyConfigured) as excinfo:
+        _get_set_null_cte_sql(0, relation, connection.ops.quote_name)
+
+    assert str(excinfo.value) == (
+        "Cannot archive parkings referred by {} with on_delete=CASCADE, "
+        "only SET_NULL is supported".format(relation.field))
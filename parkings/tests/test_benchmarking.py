@@ -0,0 +1,45 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.test import Client
+
+from parkings import benchmarking
+from parkings.models import Parking, Permit
+
+
+@pytest.mark.django_db(transaction=True)
+def test_all_scenarios_run():
+    dataset = benchmarking.create_dataset(parking_count=8, permit_count=4)
+
+    results = benchmarking.run_benchmarks(dataset, iterations=3, warmup=1)
+
+    assert list(results) == list(benchmarking.SCENARIOS)
+    for result in results.values():
+        assert result["requests"] == 3
+        assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert result["throughput_rps"] > 0
+        assert result["queries_per_request"] > 0
+    assert Parking.objects.count() == 8 + 4
+    assert Permit.objects.count() == 4 + 4
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unexpected_status_is_an_error():
+    dataset = benchmarking.create_dataset(parking_count=1, permit_count=0)
+
+    def unauthenticated_request(dataset, rng):
+        return benchmarking.Request(
+            Client(), "get", "/enforcement/v1/valid_parking/",
+            {"reg_num": "ABC-123"}, 200)
+
+    with pytest.raises(benchmarking.BenchmarkError) as excinfo:
+        benchmarking.run_scenario(unauthenticated_request, dataset, iterations=1)
+
+    assert "returned 401" in str(excinfo.value)
+
+
+def test_unknown_scenario_is_an_error():
+    with pytest.raises(CommandError) as excinfo:
+        call_command("bench", "check_parking", "no_such_scenario")
+
+    assert str(excinfo.value).startswith(
+        "Unknown scenarios: no_such_scenario. Available: check_parking,")
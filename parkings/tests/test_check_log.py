@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from parkings.check_log import BufferedWriter, save_checks
+from parkings.models import Parking, ParkingCheck
+
+
+@pytest.fixture
+def build_check(parking_check_factory, user_factory):
+    performer = user_factory()
+
+    def build(**kwargs):
+        return parking_check_factory.build(performer=performer, **kwargs)
+    return build
+
+
+@pytest.mark.django_db
+def test_save_checks_without_buffering(build_check):
+    save_checks([build_check(), build_check()])
+
+    assert ParkingCheck.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_writer_flushes_on_size(build_check):
+    writer = BufferedWriter(ParkingCheck, max_size=3)
+
+    writer.add([build_check(), build_check()])
+    assert ParkingCheck.objects.count() == 0
+
+    writer.add([build_check()])
+    assert ParkingCheck.objects.count() == 3
+    assert writer.flush() == 0
+
+
+@pytest.mark.django_db
+def test_created_at_is_time_of_the_check(build_check):
+    writer = BufferedWriter(ParkingCheck)
+    check = build_check()
+    created_at = check.created_at
+
+    writer.add([check])
+    writer.flush()
+
+    assert ParkingCheck.objects.get().created_at == created_at
+
+
+@pytest.mark.django_db
+def test_deleted_found_parking_is_nullified(build_check, parking):
+    writer = BufferedWriter(ParkingCheck)
+    writer.add([build_check(found_parking=parking)])
+    Parking.objects.filter(pk=parking.pk).delete()
+
+    assert writer.flush() == 1
+    assert ParkingCheck.objects.get().found_parking is None
+
+
+@pytest.mark.django_db
+def test_orphaned_spool_files_are_replayed(build_check, tmp_path):
+    writer = BufferedWriter(ParkingCheck, spool_dir=str(tmp_path))
+    writer.add([build_check(registration_number="ABC-123")])
+    (spool_file, path) = writer._spool_file
+    assert os.path.exists(path)
+
+    # Simulate a crash of the process owning the spool file
+    spool_file.close()
+    writer._buffer.clear()
+
+    BufferedWriter(ParkingCheck, spool_dir=str(tmp_path))
+
+    assert ParkingCheck.objects.get().registration_number == "ABC-123"
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.mark.django_db
+def test_locked_spool_files_are_not_replayed(build_check, tmp_path):
+    writer = BufferedWriter(ParkingCheck, spool_dir=str(tmp_path))
+    writer.add([build_check()])
+
+    assert BufferedWriter(
+        ParkingCheck, spool_dir=str(tmp_path)).replay_spool_files() == 0
+    assert ParkingCheck.objects.count() == 0
+
+    assert writer.flush() == 1
+    assert os.listdir(str(tmp_path)) == []
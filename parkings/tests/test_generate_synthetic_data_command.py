@@ -0,0 +1,70 @@
+import pytest
+from django.core.management import CommandError
+from django.db.models import F
+
+from parkings.management.commands import generate_synthetic_data
+from parkings.models import (
+    ArchivedParking, EnforcementDomain, Parking, Permit, PermitLookupItem)
+
+from .utils import call_mgmt_cmd_with_output
+
+
+def call_the_command(*args, **kwargs):
+    return call_mgmt_cmd_with_output(
+        generate_synthetic_data.Command, *args, **kwargs)
+
+
+@pytest.mark.django_db
+def test_data_is_generated():
+    (_result, stdout, _stderr) = call_the_command(
+        parkings=50, archived_parkings=20, permits=10, domains=2,
+        plates=30, batch_size=16, open_ended_ratio=0.5)
+
+    domains = EnforcementDomain.objects.filter(code__in=["SYN1", "SYN2"])
+    assert domains.count() == 2
+    assert Parking.objects.filter(domain__in=domains).count() == 50
+    assert ArchivedParking.objects.filter(domain__in=domains).count() == 20
+    assert Permit.objects.filter(domain__in=domains).count() == 10
+    assert PermitLookupItem.objects.filter(
+        permit__domain__in=domains).count() == 10
+    assert Parking.objects.filter(time_end=None).exists()
+    assert not ArchivedParking.objects.filter(time_end=None).exists()
+    assert len(set(Parking.objects.values_list(
+        "normalized_reg_num", flat=True))) <= 30
+    assert stdout.splitlines()[-1].startswith(
+        "Generated domains SYN1, SYN2 in")
+
+
+@pytest.mark.django_db
+def test_generated_parkings_are_in_their_zone_and_region():
+    call_the_command(parkings=40, region_grid=3, zones=4)
+
+    parkings = Parking.objects.filter(domain__code="SYN1")
+    assert parkings.count() == 40
+    assert parkings.filter(
+        location_gk25fin__intersects=F("region__geom"),
+        zone__domain=F("domain"),
+        location_gk25fin__within=F("zone__geom"),
+    ).count() == 40
+
+
+@pytest.mark.django_db
+def test_generated_permits_are_valid():
+    call_the_command(parkings=0, permits=5)
+
+    for permit in Permit.objects.filter(domain__code="SYN1"):
+        permit.full_clean()
+        lookup_item = permit.lookup_items.get()
+        assert lookup_item.area.domain == permit.domain
+        assert lookup_item.registration_number == (
+            permit.subjects[0]["registration_number"].replace("-", ""))
+
+
+@pytest.mark.django_db
+def test_existing_domain_is_not_reused():
+    call_the_command(parkings=1)
+
+    with pytest.raises(CommandError) as excinfo:
+        call_the_command(parkings=1)
+
+    assert str(excinfo.value) == "Domains already exist: SYN1"
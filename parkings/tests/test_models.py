@@ -5,9 +5,17 @@ from django.contrib.gis.geos import Point
 from django.test import override_settings
 from django.utils.timezone import now
 
+from parkings.factories import ParkingAreaFactory, RegionFactory
 from parkings.factories.parking import create_payment_zone
-from parkings.models import Operator, Parking, ParkingCheck, ParkingTerminal
-from parkings.models.utils import normalize_reg_num
+from parkings.models import (
+    EnforcementDomain, Operator, Parking, ParkingCheck, ParkingTerminal)
+from parkings.models.constants import WGS84_SRID
+from parkings.models.utils import get_regions_and_areas, normalize_reg_num
+
+from .api.enforcement.test_check_parking import create_area_geom
+
+AREA_1 = [(24.8, 60.2), (24.9, 60.2), (24.9, 60.1), (24.8, 60.1)]
+AREA_2 = [(24.9005, 60.2), (25.0, 60.2), (25.0, 60.1), (24.9005, 60.1)]
 
 
 def test_operator_instance_creation():
@@ -172,3 +180,62 @@ def test_normalize_reg_num_function(reg_num, result):
 def test_zone_casted_code(code, result):
     zone = create_payment_zone(code=code)
     assert zone.casted_code == result
+
+
+@pytest.mark.django_db
+def test_regions_and_areas_are_resolved(enforcer, operator):
+    domain = enforcer.enforced_domain
+    other_domain = EnforcementDomain.objects.create(code='OTH', name='Other')
+    region = RegionFactory(domain=domain, geom=create_area_geom(AREA_1))
+    near_area = ParkingAreaFactory(domain=domain, geom=create_area_geom(AREA_1))
+    far_area = ParkingAreaFactory(domain=domain, geom=create_area_geom(AREA_2))
+    ParkingAreaFactory(domain=other_domain, geom=create_area_geom(AREA_1))
+    locations = [
+        Point(24.85, 60.15, srid=WGS84_SRID),  # Inside area 1
+        Point(24.9003, 60.15, srid=WGS84_SRID),  # 11 m to area 2, 17 m to 1
+        Point(25.5, 60.15, srid=WGS84_SRID),  # Far from both
+        None,
+    ]
+
+    result = get_regions_and_areas(locations, [domain.pk] * len(locations))
+
+    assert result == [
+        (region.pk, near_area.pk),
+        (None, far_area.pk),
+        (None, None),
+        (None, None),
+    ]
+    assert get_regions_and_areas(locations[:1], [other_domain.pk])[0][0] is None
+
+
+@pytest.mark.django_db
+def test_region_and_area_set_on_save(enforcer, operator):
+    domain = enforcer.enforced_domain
+    region = RegionFactory(domain=domain, geom=create_area_geom(AREA_1))
+    area = ParkingAreaFactory(domain=domain, geom=create_area_geom(AREA_1))
+    parking = create_parking(enforcer, operator_id=operator.pk, domain=domain)
+    parking.location = Point(24.85, 60.15, srid=WGS84_SRID)
+
+    parking.save()
+
+    assert (parking.region, parking.parking_area) == (region, area)
+
+
+@pytest.mark.django_db
+def test_valid_at_uses_inclusive_open_ended_range(parking_factory):
+    start = now()
+    end = start + datetime.timedelta(hours=1)
+    ended = parking_factory(time_start=start, time_end=end)
+    open_ended = parking_factory(time_start=start, time_end=None)
+    reversed_times = parking_factory(time_start=end, time_end=start)
+
+    def get_valid(time):
+        return set(Parking.objects.valid_at(time))
+
+    assert get_valid(start - datetime.timedelta(seconds=1)) == set()
+    assert get_valid(start) == {ended, open_ended}
+    assert get_valid(end) == {ended, open_ended}
+    assert get_valid(end + datetime.timedelta(days=100)) == {open_ended}
+    assert reversed_times not in get_valid(start)
+    assert Parking.objects.filter(
+        pk__in=Parking.objects.valid_at(start)).count() == 2
@@ -0,0 +1,118 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from parkings import partitioning
+from parkings.factories import ArchivedParkingFactory, ParkingCheckFactory
+from parkings.management.commands import partition_tables
+from parkings.models import ArchivedParking, ParkingCheck
+from parkings.tests.utils import call_mgmt_cmd_with_output
+
+UTC = datetime.timezone.utc
+
+NOW = datetime.datetime(2024, 5, 15, 12, 0, tzinfo=UTC)
+
+
+@pytest.mark.django_db
+def test_convert_archived_parkings():
+    old = ArchivedParkingFactory(
+        time_end=datetime.datetime(2024, 2, 10, tzinfo=UTC))
+    unended = ArchivedParkingFactory(time_end=None)
+
+    created = partitioning.convert_to_partitioned(
+        "archived_parking", months_ahead=1, now=NOW)
+
+    table = ArchivedParking._meta.db_table
+    assert created == [table + "_p2024{:02d}".format(month)
+                       for month in [2, 3, 4, 5, 6]]
+    assert partitioning.is_partitioned("archived_parking")
+    assert [name for (name, _month) in partitioning.get_partitions(
+        "archived_parking")] == created
+    assert set(ArchivedParking.objects.values_list("pk", flat=True)) == {
+        old.pk, unended.pk}
+
+    new = ArchivedParkingFactory(
+        time_end=datetime.datetime(2024, 6, 1, tzinfo=UTC))
+    assert ArchivedParking.objects.get(pk=new.pk).time_end == new.time_end
+
+
+@pytest.mark.django_db
+def test_convert_parking_checks_continues_ids():
+    old = ParkingCheckFactory(created_at=NOW)
+
+    partitioning.convert_to_partitioned(
+        "parking_check", months_ahead=0, now=NOW)
+
+    new = ParkingCheckFactory(created_at=NOW)
+    assert new.pk > old.pk
+    assert ParkingCheck.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_convert_twice_fails():
+    partitioning.convert_to_partitioned("parking_check", now=NOW)
+    with pytest.raises(ValueError):
+        partitioning.convert_to_partitioned("parking_check", now=NOW)
+
+
+@pytest.mark.django_db
+def test_create_partitions_moves_rows_from_default():
+    partitioning.convert_to_partitioned(
+        "parking_check", months_ahead=0, now=NOW)
+    check = ParkingCheckFactory(
+        created_at=datetime.datetime(2024, 7, 3, tzinfo=UTC))
+
+    later = datetime.datetime(2024, 6, 1, tzinfo=UTC)
+    created = partitioning.create_partitions(
+        "parking_check", months_ahead=1, now=later)
+
+    table = ParkingCheck._meta.db_table
+    assert created == [table + "_p202406", table + "_p202407"]
+    assert ParkingCheck.objects.get().pk == check.pk
+
+
+@pytest.mark.django_db
+def test_remove_partitions():
+    partitioning.convert_to_partitioned(
+        "parking_check", months_ahead=0, now=NOW)
+    old = ParkingCheckFactory(
+        created_at=datetime.datetime(2024, 3, 31, 23, 0, tzinfo=UTC))
+    recent = ParkingCheckFactory(
+        created_at=datetime.datetime(2024, 4, 1, tzinfo=UTC))
+    partitioning.create_partitions(
+        "parking_check", now=NOW, since=old.created_at)
+
+    removed = partitioning.remove_partitions(
+        "parking_check", datetime.datetime(2024, 4, 15, tzinfo=UTC),
+        drop=True)
+
+    assert removed == [ParkingCheck._meta.db_table + "_p202403"]
+    assert list(ParkingCheck.objects.all()) == [recent]
+
+
+@pytest.mark.django_db
+def test_command_skips_unpartitioned_tables():
+    (_result, stdout, stderr) = call_mgmt_cmd_with_output(
+        partition_tables.Command)
+    assert stdout == ""
+    assert stderr.splitlines() == [
+        "Skipping archived_parking: not partitioned",
+        "Skipping parking_check: not partitioned",
+    ]
+
+
+@pytest.mark.django_db
+def test_command_converts_and_detaches():
+    old = ParkingCheckFactory(
+        created_at=timezone.now() - datetime.timedelta(days=450))
+
+    (_result, stdout, _stderr) = call_mgmt_cmd_with_output(
+        partition_tables.Command, "parking_check", "--convert",
+        "--keep-months", "12")
+
+    lines = stdout.splitlines()
+    assert lines[0] == "Converted parking_check"
+    assert "Detached {}_p{:%Y%m}".format(
+        ParkingCheck._meta.db_table, old.created_at) in lines
+    assert ParkingCheck.objects.count() == 0
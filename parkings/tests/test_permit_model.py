@@ -1,5 +1,9 @@
+import datetime
+
 import pytest
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from ..factories.permit import (
@@ -126,3 +130,152 @@ def test_permitlookupitem_creation_ignored_for_start_date_gte_end_date():
 
     assert Permit.objects.count() == 1
     assert PermitLookupItem.objects.count() == 0
+
+
+def make_permits(series, count):
+    areas = generate_areas(count=2)
+    return [
+        Permit(
+            domain=EnforcementDomain.get_default_domain(),
+            series=series,
+            external_id='permit-{}'.format(n),
+            subjects=generate_subjects(count=2),
+            areas=areas)
+        for n in range(count)]
+
+
+@pytest.mark.django_db
+def test_bulk_create_query_count_does_not_depend_on_permit_count():
+    series = create_permit_series()
+    one_permit = make_permits(series, 1)
+    many_permits = make_permits(create_permit_series(), 10)
+    # Load the cached area identifiers before counting the queries
+    PermitArea.get_identifier_map(EnforcementDomain.get_default_domain())
+
+    with CaptureQueriesContext(connection) as one_permit_queries:
+        Permit.objects.bulk_create(one_permit)
+    with CaptureQueriesContext(connection) as many_permits_queries:
+        Permit.objects.bulk_create(many_permits)
+
+    assert len(many_permits_queries) == len(one_permit_queries)
+    assert Permit.objects.count() == 11
+    for permit in Permit.objects.all():
+        assert permit.subject_items.count() == 2
+        assert permit.area_items.count() == 2
+        assert permit.lookup_items.count() == 4
+
+
+@pytest.mark.django_db
+def test_bulk_create_validates_unique_external_ids():
+    series = create_permit_series()
+    Permit.objects.bulk_create(make_permits(series, 1))
+
+    with pytest.raises(ValidationError) as taken_error:
+        Permit.objects.bulk_create(make_permits(series, 2))
+    duplicates = make_permits(series, 2)
+    for permit in duplicates:
+        permit.external_id = 'other'
+    with pytest.raises(ValidationError) as duplicate_error:
+        Permit.objects.bulk_create(duplicates)
+
+    assert 'already exists' in str(taken_error.value)
+    assert 'already exists' in str(duplicate_error.value)
+    assert Permit.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_bulk_create_validates_series():
+    permits = make_permits(create_permit_series(), 1)
+    permits[0].series_id = 999999
+
+    with pytest.raises(ValidationError) as error:
+        Permit.objects.bulk_create(permits)
+
+    assert 'series' in error.value.message_dict
+    assert not Permit.objects.exists()
+
+
+@pytest.mark.django_db
+def test_permit_update_keeps_unchanged_items():
+    permit = make_permits(create_permit_series(), 1)[0]
+    permit.save()
+    old_lookup_ids = set(permit.lookup_items.values_list('id', flat=True))
+
+    permit.properties = {'changed': True}
+    with CaptureQueriesContext(connection) as queries:
+        permit.save()
+
+    assert not any(
+        x['sql'].startswith(('INSERT', 'DELETE')) for x in queries
+        if 'permitlookupitem' in x['sql'] or 'permitsubjectitem' in x['sql'])
+    assert set(permit.lookup_items.values_list('id', flat=True)) == old_lookup_ids
+
+
+@pytest.mark.django_db
+def test_permit_update_updates_changed_items_only():
+    permit = make_permits(create_permit_series(), 1)[0]
+    permit.save()
+    (changed, unchanged) = permit.subject_items.order_by('id')
+    old_lookup_ids = set(permit.lookup_items.values_list('id', flat=True))
+    new_end_time = timezone.now() + datetime.timedelta(hours=5)
+
+    permit.subjects = [
+        dict(x, end_time=new_end_time.isoformat())
+        if x['registration_number'] == changed.registration_number else x
+        for x in permit.subjects]
+    permit.save()
+
+    subject_items = permit.subject_items.order_by('id')
+    assert [x.id for x in subject_items] == [changed.id, unchanged.id]
+    assert subject_items[0].end_time == new_end_time
+    assert subject_items[1].end_time == unchanged.end_time
+    assert set(permit.lookup_items.values_list('id', flat=True)) == old_lookup_ids
+    lookup_items = permit.lookup_items.filter(subject_item=changed)
+    assert len(lookup_items) == 2
+    assert all(x.end_time == min(new_end_time, x.area_item.end_time)
+               for x in lookup_items)
+
+
+@pytest.mark.django_db
+def test_permit_update_replaces_removed_items():
+    permit = make_permits(create_permit_series(), 1)[0]
+    permit.save()
+    (removed, kept) = permit.subject_items.order_by('id')
+
+    permit.subjects = generate_subjects(count=1) + [
+        x for x in permit.subjects
+        if x['registration_number'] != removed.registration_number]
+    permit.save()
+
+    subject_items = list(permit.subject_items.order_by('id'))
+    assert len(subject_items) == 2
+    assert subject_items[0].id == kept.id
+    assert subject_items[1].id not in {removed.id, kept.id}
+    assert permit.lookup_items.count() == 4
+    assert not permit.lookup_items.filter(subject_item=removed.id).exists()
+
+
+@pytest.mark.django_db
+def test_anonymize_in_batches():
+    series = create_permit_series()
+    permits = make_permits(series, 5)
+    Permit.objects.bulk_create(permits)
+    kept = make_permits(create_permit_series(), 1)[0]
+    kept.save()
+    to_anonymize = Permit.objects.filter(series=series)
+
+    count = to_anonymize.anonymize(batch_size=2)
+
+    assert count == 5
+    for (permit, old) in zip(to_anonymize.order_by('id'), permits):
+        assert [x['registration_number'] for x in permit.subjects] == ['', '']
+        assert [x['zip'] for x in permit.subjects] == [
+            x['zip'] for x in old.subjects]
+        assert set(permit.subject_items.values_list(
+            'registration_number', flat=True)) == {''}
+        assert set(permit.lookup_items.values_list(
+            'registration_number', flat=True)) == {''}
+    assert not to_anonymize.unanonymized().exists()
+    kept.refresh_from_db()
+    assert all(x['registration_number'] for x in kept.subjects)
+    assert Permit.objects.unanonymized().get() == kept
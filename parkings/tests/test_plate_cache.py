@@ -0,0 +1,169 @@
+from datetime import timedelta
+
+import pytest
+from django.test import override_settings
+from django.utils import timezone
+
+from parkings import plate_cache
+from parkings.check_candidates import CandidateRow, fetch_candidate_rows
+from parkings.models import EnforcementDomain
+
+enable_cache = override_settings(
+    PARKKIHUBI_PLATE_CACHE_TIMEOUT=timedelta(minutes=1),
+    PARKKIHUBI_PLATE_CACHE_LOCAL_TIMEOUT=timedelta(seconds=5))
+
+
+class Fetcher:
+    def __init__(self, rows_by_reg_num=None):
+        self.rows_by_reg_num = rows_by_reg_num or {}
+        self.calls = []
+
+    def __call__(self, reg_nums, domain_id, time_from, time_to):
+        self.calls.append(sorted(reg_nums))
+        return {x: self.rows_by_reg_num.get(x, []) for x in reg_nums}
+
+
+def make_row(reg_num, time_start, time_end):
+    return CandidateRow(
+        "parking", reg_num, None, None, time_start, time_end,
+        None, None, None, None, None, None)
+
+
+@enable_cache
+def test_entries_are_reused_within_covered_time():
+    now = timezone.now()
+    fetch = Fetcher()
+
+    for seconds in [0, 10, 30]:
+        time = now + timedelta(seconds=seconds)
+        plate_cache.get_rows(
+            ["ABC123"], 1, time - timedelta(minutes=15), time, fetch)
+    assert fetch.calls == [["ABC123"]]
+
+    plate_cache.get_rows(
+        ["ABC123", "XYZ987"], 1, now - timedelta(minutes=15), now, fetch)
+    assert fetch.calls == [["ABC123"], ["XYZ987"]]
+
+    # Times before the covered range are not served from the cache
+    past = now - timedelta(seconds=10)
+    plate_cache.get_rows(
+        ["ABC123"], 1, past - timedelta(minutes=15), past, fetch)
+    assert fetch.calls[-1] == ["ABC123"]
+
+
+@enable_cache
+def test_rows_starting_after_the_time_are_not_returned():
+    now = timezone.now()
+    later = now + timedelta(seconds=30)
+    row = make_row("ABC123", later, later + timedelta(hours=1))
+    fetch = Fetcher({"ABC123": [row]})
+
+    result = plate_cache.get_rows(
+        ["ABC123"], 1, now - timedelta(minutes=15), now, fetch)
+    assert result == {"ABC123": []}
+
+    result = plate_cache.get_rows(
+        ["ABC123"], 1, later - timedelta(minutes=15), later, fetch)
+    assert result == {"ABC123": [row]}
+    assert len(fetch.calls) == 1
+
+
+@enable_cache
+@pytest.mark.parametrize("invalidate", [
+    lambda: plate_cache.invalidate_plates(1, ["ABC123"]),
+    plate_cache.invalidate_all_plates,
+])
+def test_invalidation(invalidate):
+    now = timezone.now()
+    fetch = Fetcher()
+    args = (["ABC123"], 1, now - timedelta(minutes=15), now, fetch)
+
+    plate_cache.get_rows(*args)
+    invalidate()
+    plate_cache.get_rows(*args)
+
+    assert len(fetch.calls) == 2
+
+
+@enable_cache
+def test_rows_are_not_stored_if_invalidated_during_fetch():
+    now = timezone.now()
+    fetch = Fetcher()
+
+    def fetch_and_invalidate(*args):
+        result = fetch(*args)
+        plate_cache.invalidate_all_plates()
+        return result
+
+    window = (now - timedelta(minutes=15), now)
+    plate_cache.get_rows(["ABC123"], 1, *window, fetch_and_invalidate)
+
+    assert plate_cache.peek_rows("ABC123", 1, *window) is None
+
+
+@enable_cache
+def test_rows_are_not_kept_if_plate_invalidated_during_fetch():
+    now = timezone.now()
+    fetch = Fetcher()
+
+    def fetch_and_invalidate(*args):
+        result = fetch(*args)
+        # A parking is saved and committed before the rows are stored
+        plate_cache.invalidate_plates(1, ["ABC123"])
+        return result
+
+    window = (now - timedelta(minutes=15), now)
+    plate_cache.get_rows(
+        ["ABC123", "XYZ987"], 1, *window, fetch_and_invalidate)
+
+    assert plate_cache.peek_rows("ABC123", 1, *window) is None
+    assert plate_cache.peek_rows("XYZ987", 1, *window) == []
+
+
+def test_disabled_cache_always_fetches():
+    now = timezone.now()
+    fetch = Fetcher()
+    args = (["ABC123"], 1, now - timedelta(minutes=15), now, fetch)
+
+    plate_cache.get_rows(*args)
+    plate_cache.get_rows(*args)
+
+    assert len(fetch.calls) == 2
+    assert plate_cache.peek_rows("ABC123", 1, now, now) is None
+
+
+@enable_cache
+@pytest.mark.django_db(transaction=True)
+def test_saving_a_parking_invalidates_its_plate(parking_factory):
+    domain = EnforcementDomain.get_default_domain()
+    now = timezone.now()
+    window = (now - timedelta(minutes=15), now)
+    plate_cache.get_rows(["ABC123"], domain.pk, *window, fetch_candidate_rows)
+    assert plate_cache.peek_rows("ABC123", domain.pk, *window) == []
+
+    parking_factory(
+        registration_number="ABC-123", domain=domain,
+        time_start=now - timedelta(minutes=1))
+
+    assert plate_cache.peek_rows("ABC123", domain.pk, *window) is None
+
+
+@pytest.mark.django_db
+def test_fetched_rows_overlap_the_window(parking_factory):
+    domain = EnforcementDomain.get_default_domain()
+    now = timezone.now()
+    window = (now - timedelta(minutes=15), now)
+    ended_before = parking_factory(
+        registration_number="ABC-123", domain=domain,
+        time_start=now - timedelta(hours=2), time_end=window[0] - timedelta(seconds=1))
+    ended_at_start = parking_factory(
+        registration_number="ABC-123", domain=domain,
+        time_start=now - timedelta(hours=1), time_end=window[0])
+    unended = parking_factory(
+        registration_number="ABC-123", domain=domain,
+        time_start=now, time_end=None)
+
+    rows = fetch_candidate_rows(["ABC123"], domain.pk, *window)["ABC123"]
+
+    assert {row.id for row in rows} == {ended_at_start.pk, unended.pk}
+    assert ended_before.pk not in {row.id for row in rows}
@@ -0,0 +1,130 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from parkings import plate_filter
+from parkings.check_candidates import fetch_active_reg_nums
+from parkings.factories.permit import create_permit_series
+from parkings.models import EnforcementDomain, Parking
+
+from .api.enforcement.test_check_parking import (
+    create_permit, create_permit_area)
+
+pytestmark = pytest.mark.django_db
+
+GRACE = timedelta(minutes=15)
+
+
+@pytest.fixture(autouse=True)
+def enable_filter(settings):
+    settings.PARKKIHUBI_PLATE_FILTER_ENABLED = True
+    settings.PARKKIHUBI_PLATE_FILTER_SIZE = 2 ** 16
+
+
+@pytest.fixture
+def domain():
+    return EnforcementDomain.get_default_domain()
+
+
+def rebuild(domain):
+    return plate_filter.rebuild(domain.pk, fetch_active_reg_nums, GRACE)
+
+
+def test_unbuilt_filter_returns_all_plates(domain):
+    plates = plate_filter.get_possible_plates(
+        domain.pk, ["ABC123", "XYZ987"], timezone.now())
+
+    assert plates == {"ABC123", "XYZ987"}
+
+
+def test_rebuilt_filter_contains_only_active_plates(
+        domain, parking_factory, history_parking_factory):
+    parking_factory(registration_number="ABC-123", domain=domain)
+    history_parking_factory(registration_number="OLD-111", domain=domain)
+
+    assert rebuild(domain) == 1
+
+    now = timezone.now()
+    plates = plate_filter.get_possible_plates(
+        domain.pk, ["ABC123", "OLD111", "XYZ987"], now - GRACE)
+    assert plates == {"ABC123"}
+
+    # The filter doesn't know about rows ended before it was built
+    past = now - timedelta(hours=1)
+    plates = plate_filter.get_possible_plates(
+        domain.pk, ["ABC123", "OLD111"], past)
+    assert plates == {"ABC123", "OLD111"}
+
+
+def test_saved_parkings_are_added(domain, parking_factory):
+    rebuild(domain)
+    time_from = timezone.now() - GRACE
+    assert plate_filter.get_possible_plates(
+        domain.pk, ["ABC123"], time_from) == set()
+
+    parking_factory(registration_number="ABC-123", domain=domain)
+
+    assert plate_filter.get_possible_plates(
+        domain.pk, ["ABC123"], time_from) == {"ABC123"}
+
+
+def test_extended_parkings_are_added(domain, history_parking_factory):
+    parking = history_parking_factory(
+        registration_number="ABC-123", domain=domain)
+    rebuild(domain)
+    time_from = timezone.now() - GRACE
+    assert plate_filter.get_possible_plates(
+        domain.pk, ["ABC123"], time_from) == set()
+
+    Parking.objects.set_end_times(
+        {parking.pk: timezone.now() + timedelta(hours=1)})
+
+    assert plate_filter.get_possible_plates(
+        domain.pk, ["ABC123"], time_from) == {"ABC123"}
+
+
+def test_rows_committed_after_the_snapshot_are_readded(
+        domain, parking_factory):
+    parking = parking_factory(registration_number="ABC-123", domain=domain)
+    long_ago = timezone.now() - timedelta(days=1)
+    Parking.objects.filter(pk=parking.pk).update(modified_at=long_ago)
+    fetches = []
+
+    def fetch_after_commit(domain_id, ends_after, written_since=None):
+        fetches.append(written_since)
+        if written_since is None:
+            return []  # As if the parking was committed after the fetch
+        return fetch_active_reg_nums(domain_id, ends_after, written_since)
+
+    plate_filter.rebuild(domain.pk, fetch_after_commit, GRACE)
+
+    assert fetches[0] is None and fetches[1] is not None
+    assert plate_filter.get_possible_plates(
+        domain.pk, ["ABC123"], timezone.now() - GRACE) == {"ABC123"}
+
+
+def test_plates_of_rows_written_since_are_fetched(domain, operator):
+    create_permit_area(domain=domain, allowed_user=operator.user)
+    series = create_permit_series(active=True, owner=operator.user)
+    create_permit(domain, permit_series=series)
+    snapshot_xmin = plate_filter._get_snapshot_xmin(
+        plate_filter._get_snapshot())
+    now = timezone.now()
+
+    def fetch(written_since):
+        return list(fetch_active_reg_nums(
+            domain.pk, now, written_since=written_since))
+
+    assert fetch(snapshot_xmin) == ["ABC123"]
+    assert fetch(snapshot_xmin + 1000) == []
+
+
+def test_rebuild_command(domain, parking_factory, capsys):
+    parking_factory(registration_number="ABC-123", domain=domain)
+
+    call_command("rebuild_plate_filters")
+
+    assert capsys.readouterr().out == "{}: 1 registration numbers\n".format(
+        domain.code)
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+
+from parkings import reference_data
+from parkings.factories.parking import create_payment_zone
+from parkings.models import (
+    EnforcementDomain, ParkingTerminal, PaymentZone, PermitArea)
+
+from .api.enforcement.test_check_parking import create_area_geom
+
+
+@pytest.mark.django_db
+def test_default_domain_is_created_once(django_assert_num_queries):
+    domain = reference_data.get_default_domain()
+
+    assert domain.code == settings.DEFAULT_ENFORCEMENT_DOMAIN[1]
+    with django_assert_num_queries(0):
+        assert EnforcementDomain.get_default_domain() == domain
+
+
+@pytest.mark.django_db
+def test_lookups_are_cached(django_assert_num_queries, operator, enforcer):
+    domain = enforcer.enforced_domain
+    zone = create_payment_zone(domain=domain, code="2", number=2)
+    terminal = ParkingTerminal.objects.create(
+        number="123", name="Terminal", domain=domain)
+
+    def lookup_all():
+        return (
+            reference_data.get_domain(domain.pk),
+            reference_data.get_domain_by_code(domain.code),
+            reference_data.get_payment_zone(domain.pk, "2"),
+            reference_data.get_operator(operator.pk),
+            reference_data.get_operator_of_user(operator.user_id),
+            reference_data.get_terminal(domain.pk, 123),
+            reference_data.get_permit_area_identifier_map(domain.pk),
+        )
+
+    expected = (domain, domain, zone, operator, operator, terminal, {})
+    assert lookup_all() == expected
+    with django_assert_num_queries(0):
+        assert lookup_all() == expected
+    assert reference_data.get_payment_zone(domain.pk, "3") is None
+    assert reference_data.get_terminal(domain.pk, "124") is None
+
+
+@pytest.mark.django_db
+def test_data_is_reloaded_on_save_and_delete(enforcer):
+    domain = enforcer.enforced_domain
+    assert reference_data.get_payment_zone(domain.pk, "5") is None
+
+    zone = create_payment_zone(domain=domain, code="5", number=5)
+    assert reference_data.get_payment_zone(domain.pk, "5") == zone
+
+    zone.code = "6"
+    zone.save()
+    assert reference_data.get_payment_zone(domain.pk, "5") is None
+    assert reference_data.get_payment_zone(domain.pk, "6") == zone
+
+    zone.delete()
+    assert reference_data.get_payment_zone(domain.pk, "6") is None
+
+
+@pytest.mark.django_db
+def test_other_processes_reload_after_invalidation(enforcer):
+    domain = enforcer.enforced_domain
+    assert reference_data.get_permit_area_identifier_map(domain.pk) == {}
+    area = PermitArea.objects.create(
+        domain=domain, identifier="A", name="Area A",
+        geom=create_area_geom())
+    # Simulate another process which still has the old data cached
+    version = reference_data._get_version("permitarea")
+    reference_data._entries[("permitarea", domain.pk)] = (
+        version, time.monotonic(), {})
+    assert reference_data.get_permit_area_identifier_map(domain.pk) == {}
+
+    cache.delete(reference_data.VERSION_CACHE_KEY.format(table="permitarea"))
+
+    assert reference_data.get_permit_area_identifier_map(domain.pk) == {
+        "A": area.pk}
+
+
+@pytest.mark.django_db
+def test_missing_rows_are_queried(enforcer, operator):
+    domain = enforcer.enforced_domain
+    assert reference_data.get_payment_zone(domain.pk, "7") is None
+    assert reference_data.get_permit_area_identifier_map(domain.pk) == {}
+    # Simulate rows created by another process without a shared cache
+    version = reference_data._get_version("operator")
+    reference_data._entries[("operator", "all")] = (
+        version, time.monotonic(), ({}, {}))
+    zone = PaymentZone.objects.bulk_create([PaymentZone(
+        domain=domain, code="7", number=7, name="Zone 7",
+        geom=create_area_geom())])[0]
+    area = PermitArea.objects.bulk_create([PermitArea(
+        domain=domain, identifier="B", name="Area B",
+        geom=create_area_geom())])[0]
+
+    assert reference_data.get_operator_of_user(operator.user_id) == operator
+    assert reference_data.get_payment_zone(domain.pk, "7") == zone
+    assert reference_data.get_permit_area_identifier_map(domain.pk) == {}
+    assert reference_data.get_permit_area_identifier_map(
+        domain.pk, ["B"]) == {"B": area.pk}
+
+
+@pytest.mark.django_db
+def test_data_is_reloaded_after_ttl(enforcer, monkeypatch):
+    domain = enforcer.enforced_domain
+    zone = create_payment_zone(domain=domain, code="8", number=8)
+    assert reference_data.get_payment_zone(domain.pk, "8") == zone
+    PaymentZone.objects.filter(pk=zone.pk).update(name="Renamed")
+    assert reference_data.get_payment_zone(domain.pk, "8").name != "Renamed"
+
+    monkeypatch.setattr(reference_data, "LOCAL_TTL", 0)
+
+    assert reference_data.get_payment_zone(domain.pk, "8").name == "Renamed"
+
+
+@pytest.mark.django_db
+def test_unknown_keys_cost_a_single_query(django_assert_num_queries, enforcer):
+    domain = enforcer.enforced_domain
+    assert reference_data.get_terminal(domain.pk, "1") is None
+    assert reference_data.get_payment_zone(domain.pk, "99") is None
+
+    with django_assert_num_queries(2):
+        assert reference_data.get_terminal(domain.pk, "1") is None
+        assert reference_data.get_payment_zone(domain.pk, "99") is None
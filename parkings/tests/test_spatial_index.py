@@ -0,0 +1,111 @@
+import datetime
+import random
+
+import pytest
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
+from django.utils import timezone
+
+from parkings import spatial_index
+from parkings.factories.parking import create_payment_zone
+from parkings.models import EnforcementDomain, PaymentZone
+from parkings.models.constants import GK25FIN_SRID
+from parkings.spatial_index import STRtree, get_area_index
+
+
+def square(x, y, size):
+    return MultiPolygon(Polygon.from_bbox(
+        (x, y, x + size, y + size)), srid=GK25FIN_SRID)
+
+
+def test_strtree_query_matches_brute_force():
+    rnd = random.Random(123)
+    extents = []
+    for n in range(500):
+        (x, y) = (rnd.uniform(0, 1000), rnd.uniform(0, 1000))
+        extents.append(((x, y, x + rnd.uniform(1, 50), y + rnd.uniform(1, 50)), n))
+    tree = STRtree(extents)
+
+    for _ in range(200):
+        (px, py) = (rnd.uniform(0, 1000), rnd.uniform(0, 1000))
+        expected = {
+            n for ((x0, y0, x1, y1), n) in extents
+            if x0 <= px <= x1 and y0 <= py <= y1}
+        assert set(tree.query_point(px, py)) == expected
+
+
+def test_strtree_empty():
+    assert list(STRtree([]).query_point(0, 0)) == []
+
+
+@pytest.mark.django_db
+def test_payment_zone_with_highest_number_wins():
+    domain = EnforcementDomain.get_default_domain()
+    create_payment_zone(domain=domain, number=1, code="1", geom=square(0, 0, 100))
+    create_payment_zone(domain=domain, number=3, code="3", geom=square(50, 50, 100))
+    index = get_area_index(domain)
+
+    assert index.get_payment_zone(Point(10, 10, srid=GK25FIN_SRID)) == 1
+    assert index.get_payment_zone(Point(60, 60, srid=GK25FIN_SRID)) == 3
+    assert index.get_payment_zone(Point(500, 500, srid=GK25FIN_SRID)) is None
+
+
+@pytest.mark.django_db
+def test_index_is_invalidated_on_save_and_delete():
+    domain = EnforcementDomain.get_default_domain()
+    location = Point(10, 10, srid=GK25FIN_SRID)
+    assert get_area_index(domain).get_payment_zone(location) is None
+
+    zone = create_payment_zone(domain=domain, number=2, code="2", geom=square(0, 0, 100))
+    assert get_area_index(domain).get_payment_zone(location) == 2
+
+    zone.geom = square(200, 200, 100)
+    zone.save()
+    new_location = Point(210, 210, srid=GK25FIN_SRID)
+    assert get_area_index(domain).get_payment_zone(location) is None
+    assert get_area_index(domain).get_payment_zone(new_location) == 2
+
+    PaymentZone.objects.get(pk=zone.pk).delete()
+    assert get_area_index(domain).get_payment_zone(new_location) is None
+
+
+@pytest.mark.django_db
+def test_index_is_invalidated_after_commit(django_capture_on_commit_callbacks):
+    domain = EnforcementDomain.get_default_domain()
+    location = Point(10, 10, srid=GK25FIN_SRID)
+    with django_capture_on_commit_callbacks(execute=True):
+        create_payment_zone(domain=domain, number=4, code="4", geom=square(0, 0, 100))
+        # Another process rebuilds the index before the commit
+        stale_index = get_area_index(domain)
+
+    assert get_area_index(domain) is not stale_index
+    assert get_area_index(domain).get_payment_zone(location) == 4
+
+
+@pytest.mark.django_db
+def test_ended_event_areas_are_skipped(event_area_factory):
+    domain = EnforcementDomain.get_default_domain()
+    event_area = event_area_factory(domain=domain, geom=square(0, 0, 100))
+    location = Point(10, 10, srid=GK25FIN_SRID)
+    index = get_area_index(domain)
+
+    assert index.get_event_area(location) == event_area
+    later = event_area.time_end + datetime.timedelta(seconds=1)
+    assert index.get_event_area(location, now=later) is None
+    assert index.get_event_area(location, now=timezone.now()) == event_area
+
+
+@pytest.mark.django_db
+def test_index_is_rebuilt_after_local_ttl(monkeypatch):
+    domain = EnforcementDomain.get_default_domain()
+    location = Point(10, 10, srid=GK25FIN_SRID)
+    zone = create_payment_zone(domain=domain, number=2, code="2", geom=square(0, 0, 100))
+    index = get_area_index(domain)
+    assert get_area_index(domain) is index
+
+    # Not seen by the signals, as if changed by another process
+    # invalidating only its own cache
+    PaymentZone.objects.filter(pk=zone.pk).update(geom=square(200, 200, 100))
+    assert get_area_index(domain).get_payment_zone(location) == 2
+
+    monkeypatch.setattr(spatial_index, "LOCAL_TTL", 0)
+    assert get_area_index(domain).get_payment_zone(location) is None
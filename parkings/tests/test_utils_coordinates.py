@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+from django.contrib.gis.geos import Point
+
+from parkings.models.constants import GK25FIN_SRID, WGS84_SRID
+from parkings.utils import coordinates
+from parkings.utils.coordinates import (
+    get_transformer, transform_coordinates, transform_point, transform_points)
+
+WGS84_POINTS = [
+    Point(24.9384, 60.1699, srid=WGS84_SRID),
+    Point(22.2666, 60.4518, srid=WGS84_SRID),
+    Point(25.4651, 65.0121, srid=WGS84_SRID),
+]
+
+
+@pytest.mark.parametrize("index", range(len(WGS84_POINTS)))
+def test_transform_point_matches_gdal(index):
+    wgs84_point = WGS84_POINTS[index]
+    expected = wgs84_point.transform(GK25FIN_SRID, clone=True)
+
+    result = transform_point(wgs84_point, GK25FIN_SRID)
+
+    assert result.srid == GK25FIN_SRID
+    assert result.x == pytest.approx(expected.x, abs=0.001)
+    assert result.y == pytest.approx(expected.y, abs=0.001)
+
+
+def test_transform_points_in_bulk():
+    gk25_point = WGS84_POINTS[0].transform(GK25FIN_SRID, clone=True)
+    points = WGS84_POINTS + [gk25_point]
+
+    result = transform_points(points, GK25FIN_SRID)
+
+    assert [x.srid for x in result] == [GK25FIN_SRID] * len(points)
+    assert result[0].coords == pytest.approx(result[-1].coords)
+    for (point, transformed) in zip(WGS84_POINTS, result):
+        assert transformed.coords == pytest.approx(
+            transform_point(point, GK25FIN_SRID).coords)
+
+
+def test_transform_coordinates_round_trip():
+    xs = [p.x for p in WGS84_POINTS]
+    ys = [p.y for p in WGS84_POINTS]
+
+    (gk_xs, gk_ys) = transform_coordinates(xs, ys, WGS84_SRID, GK25FIN_SRID)
+    (back_xs, back_ys) = transform_coordinates(
+        gk_xs, gk_ys, GK25FIN_SRID, WGS84_SRID)
+
+    assert list(back_xs) == pytest.approx(xs)
+    assert list(back_ys) == pytest.approx(ys)
+
+
+def test_transform_coordinates_of_numpy_arrays():
+    numpy = pytest.importorskip("numpy")
+    xs = numpy.array([p.x for p in WGS84_POINTS])
+    ys = numpy.array([p.y for p in WGS84_POINTS])
+
+    (gk_xs, gk_ys) = transform_coordinates(xs, ys, WGS84_SRID, GK25FIN_SRID)
+
+    assert isinstance(gk_xs, numpy.ndarray)
+    assert [(x, y) for (x, y) in zip(gk_xs, gk_ys)] == [
+        pytest.approx(transform_point(p, GK25FIN_SRID).coords)
+        for p in WGS84_POINTS]
+
+
+def test_untransformable_point_is_none(monkeypatch):
+    def transform_to_infinity(xs, ys, source_srid, target_srid):
+        return ([float("inf")] * len(xs), [float("inf")] * len(ys))
+
+    monkeypatch.setattr(
+        coordinates, "transform_coordinates", transform_to_infinity)
+
+    assert transform_point(WGS84_POINTS[0], GK25FIN_SRID) is None
+
+
+def test_transformer_is_cached_per_thread():
+    transformer = get_transformer(WGS84_SRID, GK25FIN_SRID)
+    other_thread_transformers = []
+    thread = threading.Thread(target=lambda: other_thread_transformers.append(
+        get_transformer(WGS84_SRID, GK25FIN_SRID)))
+    thread.start()
+    thread.join()
+
+    assert get_transformer(WGS84_SRID, GK25FIN_SRID) is transformer
+    assert other_thread_transformers[0] is not transformer
@@ -1,4 +1,6 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from parkings.models import Parking
 from parkings.utils.querysets import _items_before, make_batches
@@ -60,6 +62,46 @@ class TestMakeBatches:
         total = sum(batch.count() for batch in batches)
         assert total == 25
 
+    def test_make_batches_splits_equal_values_by_pk(self, parking_factory):
+        """Test make_batches covers items having the same order value once."""
+        parkings = [parking_factory() for _ in range(7)]
+        Parking.objects.update(created_at=parkings[0].created_at)
+
+        batches = list(make_batches(
+            Parking.objects.all(), batch_size=3, order_by_field='created_at'))
+
+        ids = [list(batch.values_list('pk', flat=True)) for batch in batches]
+        assert [len(x) for x in ids] == [3, 3, 1]
+        assert sorted(sum(ids, [])) == sorted(x.pk for x in parkings)
+
+    def test_make_batches_uses_keyset_condition(self, parking_factory):
+        """Test the batches after the first start from the previous batch."""
+        for _ in range(4):
+            parking_factory()
+
+        batches = make_batches(
+            Parking.objects.all(), batch_size=2, order_by_field='created_at')
+        next(batches)
+        second_batch_sql = str(next(batches).query)
+
+        assert 'NOT' not in second_batch_sql
+        assert '"created_at" >=' in second_batch_sql
+
+    def test_make_batches_does_not_use_offset(self, parking_factory):
+        """Test the batch boundaries are found without OFFSET."""
+        for _ in range(5):
+            parking_factory()
+
+        with CaptureQueriesContext(connection) as context:
+            batches = list(make_batches(
+                Parking.objects.all(), batch_size=2,
+                order_by_field='created_at'))
+
+        assert len(batches) == 3
+        sqls = [query['sql'] for query in context.captured_queries]
+        assert sqls
+        assert not any('OFFSET' in sql for sql in sqls)
+
 
 @pytest.mark.django_db
 class TestItemsBefore:
@@ -0,0 +1,44 @@
+import uuid
+
+import pytest
+from django.test import override_settings
+
+from parkings.models import Operator
+from parkings.utils.uuids import generate_uuid, uuid7
+
+
+def test_uuid7_layout():
+    value = uuid7(1700000000.123)
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert value.int >> 80 == 1700000000123
+
+
+def test_uuid7_is_ordered_by_time():
+    values = [uuid7(1700000000 + n / 1000) for n in range(100)]
+
+    assert sorted(values) == values
+    assert sorted(str(x) for x in values) == [str(x) for x in values]
+
+
+def test_uuid7_is_random_within_millisecond():
+    assert uuid7(1700000000) != uuid7(1700000000)
+
+
+def test_random_uuids_are_generated_by_default():
+    assert generate_uuid().version == 4
+
+
+@override_settings(PARKKIHUBI_TIME_ORDERED_UUIDS=True)
+def test_time_ordered_uuids_can_be_enabled():
+    assert generate_uuid().version == 7
+
+
+@pytest.mark.django_db
+@override_settings(PARKKIHUBI_TIME_ORDERED_UUIDS=True)
+def test_time_ordered_primary_keys(admin_user):
+    operator = Operator.objects.create(name="Operator", user=admin_user)
+
+    assert operator.pk.version == 7
+    assert Operator.objects.get(pk=operator.pk) == operator
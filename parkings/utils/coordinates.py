@@ -0,0 +1,90 @@
+"""
+Transformation of coordinates between spatial reference systems.
+
+Transforming a GEOS geometry with `transform` constructs a new GDAL
+coordinate transformation on every call, which dominates the cost of
+transforming a single point.  The functions here use a `pyproj`
+transformer which is created once per thread and pair of SRIDs, and can
+also transform many points with a single call.
+
+Coordinates are always in (x, y) order, i.e. (longitude, latitude) for
+WGS84.
+"""
+import math
+import threading
+
+from django.contrib.gis.geos import Point
+from pyproj import Transformer
+
+_local = threading.local()
+
+
+def get_transformer(source_srid, target_srid):
+    """
+    Get a transformer between two SRIDs for the current thread.
+
+    :rtype: pyproj.Transformer
+    """
+    transformers = getattr(_local, "transformers", None)
+    if transformers is None:
+        transformers = _local.transformers = {}
+    key = (source_srid, target_srid)
+    transformer = transformers.get(key)
+    if transformer is None:
+        transformer = transformers[key] = Transformer.from_crs(
+            "EPSG:{}".format(source_srid), "EPSG:{}".format(target_srid),
+            always_xy=True)
+    return transformer
+
+
+def transform_coordinates(xs, ys, source_srid, target_srid):
+    """
+    Transform coordinates of many points at once.
+
+    The coordinates may be given as sequences or as NumPy arrays, and
+    are returned in the same form.  Points which cannot be transformed
+    get infinite coordinates.
+
+    :rtype: (list[float], list[float])
+    """
+    if source_srid == target_srid:
+        return (xs, ys)
+    transformer = get_transformer(source_srid, target_srid)
+    return transformer.transform(xs, ys)
+
+
+def transform_points(points, srid):
+    """
+    Transform GEOS points to given SRID.
+
+    :type points: list[django.contrib.gis.geos.Point]
+    :type srid: int
+    :rtype: list[django.contrib.gis.geos.Point|None]
+    :return: The transformed points, with None in place of the points
+      which are outside of the area of the target reference system
+    """
+    result = [None] * len(points)
+    indexes_by_srid = {}
+    for (index, point) in enumerate(points):
+        indexes_by_srid.setdefault(point.srid, []).append(index)
+    for (source_srid, indexes) in indexes_by_srid.items():
+        (xs, ys) = transform_coordinates(
+            [points[i].x for i in indexes], [points[i].y for i in indexes],
+            source_srid, srid)
+        for (index, x, y) in zip(indexes, xs, ys):
+            if math.isfinite(x) and math.isfinite(y):
+                result[index] = Point(x, y, srid=srid)
+    return result
+
+
+def transform_point(point, srid):
+    """
+    Transform a GEOS point to given SRID.
+
+    :type point: django.contrib.gis.geos.Point
+    :type srid: int
+    :rtype: django.contrib.gis.geos.Point|None
+    :return: The transformed point, or None if the point is outside of
+      the area of the target reference system
+    """
+    return transform_points([point], srid)[0]
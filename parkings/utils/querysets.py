@@ -2,6 +2,19 @@ from django.db.models import Q
 
 
 def make_batches(queryset, batch_size, order_by_field):
+    """
+    Split a queryset to batches ordered by given field and the pk.
+
+    The batches are found with a keyset cursor: each batch starts right
+    after the (field value, pk) pair which ended the previous batch, so
+    finding a batch does not scan the items of the previous batches and
+    the cost of a batch stays the same regardless of its position.
+    The keys of a batch are fetched with a single query limited to the
+    batch size, without OFFSET, and the last of them ends the batch.
+
+    The batches are querysets bounded by their first and last item, so
+    they can be modified or deleted before the next batch is requested.
+    """
     if queryset.filter(**{order_by_field: None}).exists():
         raise ValueError(
             "Found NULL values in order-by field ({f}) for {qs}".format(
@@ -11,20 +24,17 @@ def make_batches(queryset, batch_size, order_by_field):
 
     ordered_qs = queryset.order_by(order_by_field, "pk")
     window = ordered_qs
-    found_last_batch = False
-    while not found_last_batch:
-        last_item_slice = window[(batch_size - 1):batch_size]
-        last = last_item_slice.values("pk", order_by_field).first()
-        if not last:  # If there was less than batch_size items left
-            last = window.values("pk", order_by_field).last()
-            found_last_batch = True
-            if not last:
-                break
-        (cut_value, cut_pk) = (last[order_by_field], last["pk"])
-        items_before_q = _items_before(cut_value, cut_pk, order_by_field)
-        batch = window.filter(items_before_q)
+    while True:
+        keys = list(window.values_list(order_by_field, "pk")[:batch_size])
+        if not keys:
+            break
+        (cut_value, cut_pk) = keys[-1]
+        batch = window.filter(_items_before(cut_value, cut_pk, order_by_field))
         yield batch
-        window = ordered_qs.exclude(items_before_q)
+        if len(keys) < batch_size:  # This was the last batch
+            break
+        window = ordered_qs.filter(
+            _items_after(cut_value, cut_pk, order_by_field))
 
 
 def _items_before(cut_value, cut_pk, field_name):
@@ -51,3 +61,23 @@ def _items_before(cut_value, cut_pk, field_name):
         "pk__lte": cut_pk,  # pk <= cut_pk
     })
     return q0 & (q1 | q2)
+
+
+def _items_after(cut_value, cut_pk, field_name):
+    """
+    Generate a Q term for filtering values after certain cut point.
+
+    This is the keyset condition (X, pk) > (cut_value, cut_pk), i.e.
+
+        X > cut_value OR (X = cut_value AND pk > cut_pk)
+
+    ANDed with the term X >= cut_value, which allows PostgreSQL to start
+    an index scan from the cut point, see `_items_before`.
+    """
+    q0 = Q(**{field_name + "__gte": cut_value})  # field value >= cut_value
+    q1 = Q(**{field_name + "__gt": cut_value})  # field value > cut_value
+    q2 = Q(**{
+        field_name: cut_value,  # field value = cut_value
+        "pk__gt": cut_pk,  # pk > cut_pk
+    })
+    return q0 & (q1 | q2)
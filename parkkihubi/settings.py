@@ -294,6 +294,34 @@ CORS_ALLOW_CREDENTIALS = True  # Required for session cookies to work with CORS
 PARKKIHUBI_TIME_PARKINGS_EDITABLE = timedelta(minutes=2)
 PARKKIHUBI_TIME_EVENT_PARKINGS_EDITABLE = timedelta(minutes=2)
 PARKKIHUBI_TIME_OLD_PARKINGS_VISIBLE = timedelta(minutes=15)
+PARKKIHUBI_CHECK_PARKING_BATCH_MAX_SIZE = env.int(
+    'PARKKIHUBI_CHECK_PARKING_BATCH_MAX_SIZE', 1000)
+PARKKIHUBI_OPERATOR_PARKING_BULK_MAX_SIZE = env.int(
+    'PARKKIHUBI_OPERATOR_PARKING_BULK_MAX_SIZE', 5000)
+PARKKIHUBI_OPERATOR_PARKING_STREAM_BATCH_SIZE = env.int(
+    'PARKKIHUBI_OPERATOR_PARKING_STREAM_BATCH_SIZE', 500)
+PARKKIHUBI_OPERATOR_PARKING_STREAM_MAX_DELAY = env.float(
+    'PARKKIHUBI_OPERATOR_PARKING_STREAM_MAX_DELAY', 1.0)
+PARKKIHUBI_TIME_ORDERED_UUIDS = env.bool(
+    'PARKKIHUBI_TIME_ORDERED_UUIDS', False)
+PARKKIHUBI_PLATE_CACHE_TIMEOUT = timedelta(
+    seconds=env.int('PARKKIHUBI_PLATE_CACHE_TIMEOUT', 0))
+PARKKIHUBI_PLATE_CACHE_LOCAL_TIMEOUT = timedelta(
+    seconds=env.int('PARKKIHUBI_PLATE_CACHE_LOCAL_TIMEOUT', 0))
+PARKKIHUBI_PLATE_CACHE_ALIAS = 'default'
+PARKKIHUBI_PLATE_FILTER_ENABLED = env.bool(
+    'PARKKIHUBI_PLATE_FILTER_ENABLED', False)
+PARKKIHUBI_PLATE_FILTER_SIZE = 2 ** 23
+PARKKIHUBI_PLATE_FILTER_HASH_COUNT = 7
+PARKKIHUBI_PLATE_FILTER_CACHE_ALIAS = 'default'
+PARKKIHUBI_BUFFERED_CHECK_LOGGING = env.bool(
+    'PARKKIHUBI_BUFFERED_CHECK_LOGGING', False)
+PARKKIHUBI_CHECK_LOG_BUFFER_SIZE = env.int(
+    'PARKKIHUBI_CHECK_LOG_BUFFER_SIZE', 100)
+PARKKIHUBI_CHECK_LOG_FLUSH_INTERVAL = timedelta(
+    seconds=env.float('PARKKIHUBI_CHECK_LOG_FLUSH_INTERVAL', 5))
+PARKKIHUBI_CHECK_LOG_SPOOL_DIR = env.str(
+    'PARKKIHUBI_CHECK_LOG_SPOOL_DIR', default='')
 PARKKIHUBI_NONE_END_TIME_REPLACEMENT = env.str(
     'PARKKIHUBI_NONE_END_TIME_REPLACEMENT', default='')
 PARKKIHUBI_PUBLIC_API_ENABLED = env.bool('PARKKIHUBI_PUBLIC_API_ENABLED', True)